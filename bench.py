@@ -0,0 +1,598 @@
+# Benchmarks for the editor's hot paths on synthetic Python, JavaScript,
+# HTML and CSS files from 1 KB to 100 MB: opening and saving throughput,
+# tokenizing, line lookups, find and replace (also across files),
+# per-keystroke latency and the crash journal's overhead, plus peak
+# memory while opening. Results can be saved as a baseline and later
+# runs compared against it.
+#
+#   python bench.py                          all languages at the default sizes
+#   python bench.py --sizes 1K,1M --languages python,css
+#   python bench.py --save baseline.json     keep the results as a baseline
+#   python bench.py --compare baseline.json  exit 1 on a regression
+#   xvfb-run -a python bench.py --tk         also time the Tk side
+#
+# Generated files are cached in --data-dir; they only depend on the
+# language, size and seed.
+import argparse
+import atexit
+import importlib.util
+import json
+import os
+import platform
+import random
+import shutil
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+
+# Keep the editor's session and recovery files out of the user's home
+HOME = tempfile.mkdtemp(prefix="notepad-bench-home-")
+os.environ["HOME"] = HOME
+atexit.register(shutil.rmtree, HOME, ignore_errors=True)
+
+import notepad_core as core
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+SIZES = {"1K": 1024, "100K": 100 * 1024, "1M": 1024 ** 2, "10M": 10 * 1024 ** 2, "100M": 100 * 1024 ** 2}
+LANGUAGES = {"python": ".py", "javascript": ".js", "html": ".html", "css": ".css"}
+HIGHER_IS_BETTER = {"MB/s", "files/s"}
+SEED = 1
+
+# One snippet per construct the lexers know, {name} and {n} filled in
+SNIPPETS = {
+    "python": [
+        'def {name}_{n}(value, count={n}):\n'
+        '    # scale {name} by count\n'
+        '    total = value * count + {n}\n'
+        '    if total > {n}:\n'
+        '        return "{name}" + str(total)\n'
+        '    return \'{name}\'\n\n',
+        'class {Name}{n}:\n'
+        '    """Holds a {name} value.\n\n'
+        '    Created {n} times per run.\n'
+        '    """\n'
+        '    def __init__(self, value=None):\n'
+        '        self.value = value or {n}\n\n',
+        'for value in range({n}):\n'
+        '    {name} = [value, "{name}", {n}]  # list of three\n'
+        '    while not {name}:\n'
+        '        break\n\n',
+    ],
+    "javascript": [
+        'function {name}{n}(value, count) {{\n'
+        '    // scale {name} by count\n'
+        '    const total = value * count + {n};\n'
+        '    if (total > {n}) {{\n'
+        '        return "{name}" + total;\n'
+        '    }}\n'
+        '    return \'{name}\';\n'
+        '}}\n\n',
+        '/* {name} keeps {n} values\n'
+        '   around between calls */\n'
+        'class {Name}{n} extends Object {{\n'
+        '    constructor(value) {{ super(); this.value = value || {n}; }}\n'
+        '}}\n\n',
+        'for (let value = 0; value < {n}; value++) {{\n'
+        '    var {name} = [value, "{name}", {n}];\n'
+        '}}\n\n',
+    ],
+    "html": [
+        '<div class="{name}" id="{name}-{n}">\n'
+        '  <p>The value of {name} is {n}.</p>\n'
+        '  <a href="/{name}/{n}">{Name}</a>\n'
+        '</div>\n',
+        '<!-- {name} section {n},\n'
+        '     kept for the value column -->\n'
+        '<ul>\n'
+        '  <li data-value="{n}">{name}</li>\n'
+        '</ul>\n',
+        '<table class="value">\n'
+        '  <tr><td>{name}</td><td>{n}</td></tr>\n'
+        '</table>\n',
+    ],
+    "css": [
+        '.{name}-{n} {{\n'
+        '  margin: {n}px 0;\n'
+        '  font-family: "{Name} Sans", sans-serif;\n'
+        '}}\n\n',
+        '/* {name} overrides,\n'
+        '   value {n} */\n'
+        '#{name}{n} .value {{\n'
+        '  width: {n}%;\n'
+        '}}\n\n',
+        '.value > .{name} {{ color: #{n:06d}; content: \'{name}\'; }}\n\n',
+    ],
+}
+NAMES = ["value", "total", "buffer", "cursor", "widget", "token", "offset", "window"]
+
+
+def generate(language, size, seed=SEED):
+    # Text of at least size characters built from the language's snippets,
+    # always ending at a snippet boundary
+    rng = random.Random(f"{seed}-{language}")
+    snippets = SNIPPETS[language]
+    variants = []
+    for _ in range(256):
+        name = rng.choice(NAMES)
+        variants.append(rng.choice(snippets).format(name=name, Name=name.capitalize(),
+                                                    n=rng.randrange(1000000)))
+    parts = []
+    length = 0
+    while length < size:
+        snippet = rng.choice(variants)
+        parts.append(snippet)
+        length += len(snippet)
+    return "".join(parts)
+
+
+def data_file(data_dir, language, size_name):
+    path = os.path.join(data_dir, f"{language}-{size_name}-{SEED}{LANGUAGES[language]}")
+    if not os.path.exists(path):
+        os.makedirs(data_dir, exist_ok=True)
+        temp_path = path + ".tmp"
+        with open(temp_path, "w", encoding="utf-8", newline="") as file:
+            file.write(generate(language, SIZES[size_name]))
+        os.replace(temp_path, path)
+    return path
+
+
+def megabytes(count):
+    return count / (1024 * 1024)
+
+
+def percentile(samples, fraction):
+    samples = sorted(samples)
+    return samples[min(len(samples) - 1, int(len(samples) * fraction))]
+
+
+def best(run, budget=0.2, limit=20):
+    # Fastest of several calls of run, which returns its own elapsed time;
+    # quick ones are repeated until they have taken budget seconds
+    times = []
+    while len(times) < limit and sum(times) < budget:
+        times.append(run())
+    return min(times)
+
+
+# Headless cases; each returns {metric: (value, unit)}
+
+def load(path):
+    # FileLoader's chunks appended to a Document, as poll_loader does
+    loader = core.FileLoader(path)
+    loader.start()
+    document = core.Document()
+    document.logging = False
+    while True:
+        item = loader.queue.get()
+        if item is None:
+            break
+        document.insert(len(document), *item)
+    if loader.error is not None:
+        raise loader.error
+    document.logging = True
+    return document
+
+
+def bench_open(path):
+    def run():
+        started = time.perf_counter()
+        load(path)
+        return time.perf_counter() - started
+    return {"open": (megabytes(os.path.getsize(path)) / best(run), "MB/s")}
+
+
+def bench_open_memory(path):
+    tracemalloc.start()
+    try:
+        load(path)
+        peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+    return {"open_peak": (megabytes(peak), "MB")}
+
+
+def bench_save(document, data_dir):
+    target = os.path.join(data_dir, "save-target.txt")
+    
+    def run():
+        started = time.perf_counter()
+        saver = core.FileSaver(target, list(document.chunks()), "utf-8", "\n")
+        saver.start()
+        saver.thread.join()
+        elapsed = time.perf_counter() - started
+        if saver.error is not None:
+            raise saver.error
+        os.unlink(target)
+        return elapsed
+    return {"save": (megabytes(len(document)) / best(run), "MB/s")}
+
+
+def bench_tokenize(document, language):
+    # The tokenizer thread's job for the whole file: a snapshot, then the
+    # token ranges of every line
+    def run():
+        started = time.perf_counter()
+        core.lex_ranges(document.snapshot(), core.LANGUAGES.lexer(language), None, 0, None, 0, document.line_count())
+        return time.perf_counter() - started
+    return {"tokenize": (megabytes(len(document)) / best(run), "MB/s")}
+
+
+def bench_outline(document, language, rng, count=20000):
+    # Listing the symbols of the whole file, as when the outline panel
+    # first shows it, and finding the symbol at a line, as the outline panel does on every
+    # cursor move
+    patterns = core.LANGUAGES.outline(language)
+    if patterns is None:
+        return {}
+    outline = core.Outline(document)
+    
+    def run():
+        started = time.perf_counter()
+        outline.set_patterns(patterns)
+        outline.scan()
+        return time.perf_counter() - started
+    scan = best(run)
+    numbers = [rng.randrange(document.line_count()) for _ in range(count)]
+    started = time.perf_counter()
+    for line in numbers:
+        outline.symbol_at(line)
+    elapsed = time.perf_counter() - started
+    return {"outline": (megabytes(len(document)) / scan, "MB/s"),
+            "symbol_lookup": (elapsed / count * 1e6, "us")}
+
+
+def bench_lines(document, rng, count=20000):
+    # Offset -> (line, column) and line -> offset, as the gutter, the
+    # status bar and every edit do
+    offsets = [rng.randrange(len(document) + 1) for _ in range(count)]
+    numbers = [rng.randrange(document.line_count()) for _ in range(count)]
+    started = time.perf_counter()
+    for offset in offsets:
+        document.line_col(offset)
+    for line in numbers:
+        document.line_offset(line)
+    elapsed = time.perf_counter() - started
+    return {"line_lookup": (elapsed / (2 * count) * 1e6, "us")}
+
+
+def bench_line_index(path):
+    with open(path, "rb") as file:
+        data = file.read()
+        
+    def run():
+        index = core.LineIndex(data)
+        started = time.perf_counter()
+        index.build(threading.Event())
+        return time.perf_counter() - started
+    return {"line_index": (megabytes(len(data)) / best(run), "MB/s")}
+
+
+def bench_find(document):
+    def run(query, regex):
+        engine = core.FindEngine(document)
+        started = time.perf_counter()
+        engine.search(query, regex, regex, False)
+        return time.perf_counter() - started
+    return {"find": (megabytes(len(document)) / best(lambda: run("value", False)), "MB/s"),
+            "find_regex": (megabytes(len(document)) / best(lambda: run(r"\b\w+_\d+\b", True)), "MB/s")}
+
+
+def bench_replace(document):
+    # Replace All the way Notepad applies it, with the edits from
+    # replace_edits
+    text = document.text()
+    
+    def run():
+        result = core.Document(text)
+        result.logging = False
+        pattern = core.FindEngine(result).compile("value", False, True, True)
+        started = time.perf_counter()
+        edits = core.plan_replacements(text, pattern, core.replacer("amount"))
+        for edit_start, edit_end, new_text in core.replace_edits(text, edits):
+            result.delete(edit_start, edit_end)
+            result.insert(edit_start, new_text)
+        return time.perf_counter() - started
+    return {"replace_all": (best(run) * 1000, "ms")}
+
+
+def bench_keystrokes(document, language, rng, keystrokes):
+    # What a keystroke costs the Tk thread: the Document edit, the line
+    # states brought up to date past a 50-line viewport, the outline and
+    # the snapshot handed to the tokenizer thread; the stale lines are then lexed
+    # outside the timing, as the worker does. The edit log is handed off
+    # every 20 keystrokes, like the journal flush.
+    states = core.LineStates(document)
+    states.set_lexer(core.LANGUAGES.lexer(language))
+    states.relex(0, states.line_count())
+    states.tagged[:] = b"\x01" * len(states.tagged)
+    outline = core.Outline(document)
+    outline.set_patterns(core.LANGUAGES.outline(language))
+    outline.scan()
+    samples = []
+    offset = rng.randrange(len(document) + 1)
+    for i in range(keystrokes):
+        if i % 200 == 0:
+            offset = rng.randrange(len(document) + 1)
+        char = "\n" if i % 60 == 59 else "x"
+        started = time.perf_counter()
+        line = document.line_col(offset)[0]
+        count = document.line_count()
+        document.insert(offset, char)
+        states.update(line + 1, 1, 1 + document.line_count() - count, line + 50)
+        outline.update(line + 1, 1, 1 + document.line_count() - count)
+        snapshot = document.snapshot()
+        samples.append(time.perf_counter() - started)
+        top = max(0, line - 25)
+        stop = min(top + 50, states.valid - 1)
+        stale = states.tagged.find(0, top, stop)
+        if stale >= 0:
+            core.lex_ranges(snapshot, states.lexer, None, stale, states.states[stale], stale, stop)
+            states.tagged[stale:stop] = b"\x01" * (stop - stale)
+        offset += 1
+        if i % 20 == 19:
+            document.clear_log()
+    return {"keystroke_p50": (percentile(samples, 0.5) * 1e6, "us"),
+            "keystroke_p99": (percentile(samples, 0.99) * 1e6, "us")}
+
+
+def bench_journal(keystrokes):
+    # What the crash journal adds to a keystroke on the Tk thread
+    text = "".join(f"line {i} of some sample text\n" for i in range(50000))
+    
+    def type_text(document, journal=None):
+        offset = len(document) // 2
+        started = time.perf_counter()
+        for i in range(keystrokes):
+            document.insert(offset, "\n" if i % 60 == 59 else "x")
+            offset += 1
+            if journal is not None and i % 20 == 19:
+                records = document.log
+                document.clear_log()
+                journal.append(records)
+        return time.perf_counter() - started
+        
+    def unlogged():
+        document = core.Document(text)
+        document.logging = False
+        return type_text(document)
+        
+    def journalled():
+        journal = core.Journal(directory, session="bench")
+        journal.reset()
+        elapsed = type_text(core.Document(text), journal)
+        journal.close(discard=False)
+        return elapsed
+        
+    baseline = best(unlogged, limit=3)
+    with tempfile.TemporaryDirectory() as directory:
+        typing = best(journalled, limit=3)
+        size = os.path.getsize(os.path.join(directory, "session-bench.journal"))
+    return {"journal_overhead": ((typing - baseline) / keystrokes * 1e6, "us"),
+            "journal_bytes": (size / keystrokes, "B")}
+
+
+def bench_find_files(paths):
+    # Find in Files over a directory linking to this run's files
+    directory = tempfile.mkdtemp(prefix="notepad-bench-tree-")
+    try:
+        for i, path in enumerate(paths):
+            os.symlink(os.path.abspath(path), os.path.join(directory, f"{i}-{os.path.basename(path)}"))
+            
+        def run():
+            search = core.FileSearch(directory, core.FindEngine(core.Document()).compile("value"))
+            started = time.perf_counter()
+            search.start()
+            while search.queue.get() is not None:
+                pass
+            rates.append(search.rates())
+            return time.perf_counter() - started
+        rates = []
+        best(run)
+    finally:
+        shutil.rmtree(directory, ignore_errors=True)
+    megabytes, files = max(rates)
+    return {"find_files": (megabytes, "MB/s"), "find_files_rate": (files, "files/s")}
+
+
+def run_headless(args, record):
+    rng = random.Random(SEED)
+    paths = []
+    for language in args.languages:
+        for size_name in args.sizes:
+            path = data_file(args.data_dir, language, size_name)
+            paths.append(path)
+            document = load(path)
+            results = bench_open(path)
+            results.update(bench_open_memory(path))
+            results.update(bench_save(document, args.data_dir))
+            results.update(bench_tokenize(document, language))
+            results.update(bench_outline(document, language, rng))
+            results.update(bench_lines(document, rng))
+            results.update(bench_line_index(path))
+            results.update(bench_find(document))
+            results.update(bench_replace(document))
+            results.update(bench_keystrokes(document, language, rng, args.keystrokes))
+            for metric, (value, unit) in results.items():
+                record(metric, language, size_name, value, unit)
+    for metric, (value, unit) in bench_journal(args.keystrokes * 10).items():
+        record(metric, "-", "-", value, unit)
+    for metric, (value, unit) in bench_find_files(paths).items():
+        record(metric, "-", "-", value, unit)
+
+
+# Tk cases, through a real Notepad (needs a display; use xvfb-run)
+
+def load_notepad():
+    spec = importlib.util.spec_from_file_location("notepad", os.path.join(ROOT, "python notepad.py"))
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def run_tk(args, record):
+    import tkinter as tk
+    try:
+        import resource
+    except ImportError:
+        resource = None
+    notepad_module = load_notepad()
+    try:
+        root = tk.Tk()
+    except tk.TclError as e:
+        print(f"Skipping the Tk benchmarks: {e}", file=sys.stderr)
+        return
+    root.geometry("1000x700")
+    notepad = notepad_module.Notepad(root)
+    root.update()
+    rng = random.Random(SEED)
+    
+    def settle():
+        # Let the scheduler's frame and idle work run out
+        for _ in range(1000):
+            root.update()
+            scheduler = notepad.scheduler
+            if (scheduler.frame_job is None and scheduler.idle_job is None
+                    and notepad.loader is None and notepad.saver is None
+                    and notepad.highlighter.job is None):
+                return
+            time.sleep(0.001)
+            
+    for language in args.languages:
+        for size_name in args.sizes:
+            if SIZES[size_name] > SIZES[args.tk_max_size]:
+                continue
+            path = data_file(args.data_dir, language, size_name)
+            results = {}
+            started = time.perf_counter()
+            notepad.open_path(path)
+            settle()
+            results["tk_open"] = (megabytes(os.path.getsize(path)) / (time.perf_counter() - started), "MB/s")
+            if resource is not None:
+                results["tk_rss"] = (resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, "MB")
+            text_area = notepad.text_area
+            
+            # Until the viewport is tagged; the lexing happens on the
+            # tokenizer thread
+            started = time.perf_counter()
+            notepad.highlighter.set_lexer(notepad_module.LANGUAGES.lexer(language))
+            notepad.highlighter.highlight_view()
+            settle()
+            results["tk_highlight_view"] = ((time.perf_counter() - started) * 1000, "ms")
+            
+            notepad.gutter_drawn = None
+            started = time.perf_counter()
+            notepad.update_line_numbers()
+            results["tk_line_numbers"] = ((time.perf_counter() - started) * 1000, "ms")
+            
+            # A keystroke: the widget edit through the proxy, then the
+            # frame's status bar, gutter and highlighting work
+            samples = []
+            text_area.mark_set(tk.INSERT, f"{rng.randrange(notepad.document.line_count()) + 1}.0")
+            text_area.see(tk.INSERT)
+            for i in range(args.tk_keystrokes):
+                started = time.perf_counter()
+                text_area.insert(tk.INSERT, "\n" if i % 60 == 59 else "x")
+                notepad.update_statusbar()
+                notepad.update_line_numbers()
+                notepad.highlighter.highlight_view()
+                root.update_idletasks()
+                samples.append(time.perf_counter() - started)
+                settle()
+            results["tk_keystroke_p50"] = (percentile(samples, 0.5) * 1e6, "us")
+            results["tk_keystroke_p99"] = (percentile(samples, 0.99) * 1e6, "us")
+            
+            notepad.find_text()
+            root.update()
+            notepad.find_query.set("value")
+            started = time.perf_counter()
+            notepad.run_find()
+            results["tk_find"] = ((time.perf_counter() - started) * 1000, "ms")
+            notepad.close_find_bar()
+            
+            notepad.replace_with.set("amount")
+            started = time.perf_counter()
+            notepad.replace_all()
+            results["tk_replace_all"] = ((time.perf_counter() - started) * 1000, "ms")
+            
+            text_area.edit_modified(False)
+            notepad.close_tab()
+            settle()
+            for metric, (value, unit) in results.items():
+                record(metric, language, size_name, value, unit)
+    notepad.exit_app()
+
+
+# Baselines
+
+def compare(results, baseline_path, tolerance):
+    # Print each metric against the baseline; True if any got worse by
+    # more than tolerance
+    with open(baseline_path, encoding="utf-8") as file:
+        baseline = {(r["metric"], r["language"], r["size"]): r for r in json.load(file)["results"]}
+    regressed = False
+    print()
+    print(f"{'metric':<20}{'language':<12}{'size':<6}{'baseline':>12}{'now':>12}{'change':>9}")
+    for result in results:
+        key = (result["metric"], result["language"], result["size"])
+        if key not in baseline:
+            continue
+        old, new = baseline[key]["value"], result["value"]
+        if not old:
+            continue
+        change = (new - old) / old
+        worse = -change if result["unit"] in HIGHER_IS_BETTER else change
+        flag = "  REGRESSION" if worse > tolerance else ""
+        regressed = regressed or bool(flag)
+        print(f"{key[0]:<20}{key[1]:<12}{key[2]:<6}{old:>12.2f}{new:>12.2f}{change:>+9.1%}{flag}")
+    return regressed
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the editor's hot paths.")
+    parser.add_argument("--sizes", default="1K,100K,1M,10M,100M",
+                        help="comma-separated file sizes out of " + ",".join(SIZES))
+    parser.add_argument("--languages", default=",".join(LANGUAGES),
+                        help="comma-separated languages out of " + ",".join(LANGUAGES))
+    parser.add_argument("--keystrokes", type=int, default=2000)
+    parser.add_argument("--data-dir", default=os.path.join(tempfile.gettempdir(), "notepad-bench"))
+    parser.add_argument("--tk", action="store_true", help="also run the Tk benchmarks (needs a display)")
+    parser.add_argument("--tk-only", action="store_true", help="only run the Tk benchmarks")
+    parser.add_argument("--tk-max-size", default="1M", help="largest file size for the Tk benchmarks")
+    parser.add_argument("--tk-keystrokes", type=int, default=200)
+    parser.add_argument("--save", metavar="PATH", help="write the results as a baseline")
+    parser.add_argument("--compare", metavar="PATH", help="compare against a saved baseline")
+    parser.add_argument("--tolerance", type=float, default=0.20,
+                        help="allowed slowdown before a metric counts as a regression")
+    args = parser.parse_args()
+    args.sizes = args.sizes.split(",")
+    args.languages = args.languages.split(",")
+    for name in args.sizes + [args.tk_max_size]:
+        if name not in SIZES:
+            parser.error(f"unknown size {name}")
+    for name in args.languages:
+        if name not in LANGUAGES:
+            parser.error(f"unknown language {name}")
+            
+    results = []
+    
+    def record(metric, language, size, value, unit):
+        results.append({"metric": metric, "language": language, "size": size, "value": value, "unit": unit})
+        print(f"{metric:<20}{language:<12}{size:<6}{value:>12.2f} {unit}", flush=True)
+        
+    if not args.tk_only:
+        run_headless(args, record)
+    if args.tk or args.tk_only:
+        run_tk(args, record)
+        
+    if args.save:
+        with open(args.save, "w", encoding="utf-8") as file:
+            json.dump({"python": platform.python_version(), "platform": platform.platform(),
+                       "time": time.time(), "results": results}, file, indent=1)
+    if args.compare and compare(results, args.compare, args.tolerance):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
\ No newline at end of file
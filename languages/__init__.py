@@ -0,0 +1,31 @@
+# Language definitions for syntax highlighting, one module per language.
+# LANGUAGES below lists each language by its module's name (as saved in
+# the session) with what is needed before the module is imported:
+#
+#   title       name shown in the Syntax Highlighting menu
+#   extensions  file extensions, lowercase and with the dot
+#   shebangs    interpreters named on a #! line, without version digits
+#
+# The module is only imported when a file of its language is highlighted
+# or outlined, and defines:
+#
+#   BLOCKS      (opener, closer, tag) constructs that can span lines
+#   RULES       (pattern, tag) pairs, or (pattern, (tag, ...)) with one
+#               tag per group of the pattern
+#   OUTLINE     optional (pattern, kind) pairs for the outline panel;
+#               group 1 of the pattern is the symbol's name
+#
+# Tags are those in notepad_core.TAGS. A module and its entry here are
+# all it takes to add a language; see notepad_core.LanguageRegistry.
+
+LANGUAGES = {
+    # name: (title, extensions, shebangs)
+    "css": ("CSS", (".css",), ()),
+    "html": ("HTML", (".html", ".htm", ".xhtml"), ()),
+    "javascript": ("JavaScript", (".js", ".mjs", ".cjs"), ("node",)),
+    "json": ("JSON", (".json", ".jsonl", ".geojson"), ()),
+    "markdown": ("Markdown", (".md", ".markdown"), ()),
+    "python": ("Python", (".py", ".pyw", ".pyi"), ("python",)),
+    "sql": ("SQL", (".sql",), ()),
+    "yaml": ("YAML", (".yaml", ".yml"), ()),
+}
\ No newline at end of file
@@ -0,0 +1,14 @@
+from notepad_core import STRING_PATTERN
+
+BLOCKS = [("/*", "*/", "comment")]
+
+RULES = [
+    (STRING_PATTERN, "string"),
+    (r"\.\w+", "keyword"),
+    (r"#\w+", "keyword"),
+    (r"\b\d+\b", "number"),
+]
+
+OUTLINE = [
+    (r"^([^\s{}/][^{};]*?)\s*\{", "rule"),
+]
\ No newline at end of file
@@ -0,0 +1,11 @@
+BLOCKS = [("<!--", "-->", "comment")]
+
+RULES = [
+    # Tag names and the brackets closing a tag
+    (r"</?[A-Za-z][\w:.-]*|/?>", "keyword"),
+    # Attribute names and their quoted values
+    (r"\b[\w:.-]+(?=\s*=)", "function"),
+    (r"(?<==)\"[^\"]*\"|(?<==)'[^']*'", "string"),
+    # Character references
+    (r"&(?:\w+|#\d+|#[xX][0-9A-Fa-f]+);", "number"),
+]
\ No newline at end of file
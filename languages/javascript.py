@@ -0,0 +1,21 @@
+from notepad_core import keyword_pattern, STRING_PATTERN
+
+BLOCKS = [("/*", "*/", "comment")]
+
+RULES = [
+    (r"//.*", "comment"),
+    (STRING_PATTERN, "string"),
+    (r"\b(function)\s+(\w+)", ("keyword", "function")),
+    (keyword_pattern(["break", "case", "catch", "class", "const", "continue", "debugger",
+                      "default", "delete", "do", "else", "export", "extends", "finally",
+                      "for", "function", "if", "import", "in", "instanceof", "new", "return",
+                      "super", "switch", "this", "throw", "try", "typeof", "var", "void",
+                      "while", "with", "yield"]), "keyword"),
+    (r"\b\d+\b", "number"),
+]
+
+OUTLINE = [
+    (r"\bfunction\s*\*?\s*(\w+)", "function"),
+    (r"^\s*(?:export\s+)?(?:default\s+)?class\s+(\w+)", "class"),
+    (r"^\s*(?:export\s+)?(?:const|let|var)\s+(\w+)\s*=\s*(?:async\s*)?(?:\([^)]*\)|\w+)\s*=>", "function"),
+]
\ No newline at end of file
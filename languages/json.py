@@ -0,0 +1,9 @@
+BLOCKS = []
+
+RULES = [
+    # Object keys, then any other string
+    (r'"(?:[^"\\]|\\.)*"(?=\s*:)', "function"),
+    (r'"(?:[^"\\]|\\.)*"', "string"),
+    (r"\b(?:true|false|null)\b", "keyword"),
+    (r"-?\b\d+(?:\.\d+)?(?:[eE][+-]?\d+)?\b", "number"),
+]
\ No newline at end of file
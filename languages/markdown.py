@@ -0,0 +1,15 @@
+# Fenced code blocks
+BLOCKS = [("```", "```", "string"), ("<!--", "-->", "comment")]
+
+RULES = [
+    (r"^ {0,3}#{1,6}(?:\s.*|$)", "keyword"),
+    (r"^ {0,3}>.*", "comment"),
+    (r"`[^`]+`", "string"),
+    (r"!?\[[^\]]*\]\([^)]*\)", "function"),
+    (r"\*\*[^*]+\*\*|__[^_]+__|(?<![\w*])\*[^*\s][^*]*\*|(?<![\w_])_[^_\s][^_]*_", "number"),
+    (r"^\s*(?:[-*+]|\d+[.)])(?=\s)", "keyword"),
+]
+
+OUTLINE = [
+    (r"^ {0,3}(#{1,6}\s+.*?)\s*#*\s*$", "heading"),
+]
\ No newline at end of file
@@ -0,0 +1,19 @@
+from notepad_core import keyword_pattern, STRING_PATTERN
+
+BLOCKS = [('"""', '"""', "string"), ("'''", "'''", "string")]
+
+RULES = [
+    (r"#.*", "comment"),
+    (STRING_PATTERN, "string"),
+    (r"\b(def)\s+(\w+)", ("keyword", "function")),
+    (keyword_pattern(["and", "as", "assert", "break", "class", "continue", "def", "del",
+                      "elif", "else", "except", "False", "finally", "for", "from", "global",
+                      "if", "import", "in", "is", "lambda", "None", "nonlocal", "not", "or",
+                      "pass", "raise", "return", "True", "try", "while", "with", "yield"]), "keyword"),
+    (r"\b\d+\b", "number"),
+]
+
+OUTLINE = [
+    (r"^\s*(?:async\s+)?def\s+(\w+)", "def"),
+    (r"^\s*class\s+(\w+)", "class"),
+]
\ No newline at end of file
@@ -0,0 +1,25 @@
+from notepad_core import keyword_pattern
+
+BLOCKS = [("/*", "*/", "comment")]
+
+RULES = [
+    (r"--.*", "comment"),
+    (r"'(?:[^']|'')*'", "string"),
+    (r'"(?:[^"]|"")*"', "string"),
+    (r"(?i:" + keyword_pattern(["add", "all", "alter", "and", "as", "asc", "begin", "between", "by",
+                                "case", "commit", "constraint", "create", "cross", "database",
+                                "default", "delete", "desc", "distinct", "drop", "else", "end",
+                                "exists", "foreign", "from", "full", "group", "having", "if", "in",
+                                "index", "inner", "insert", "into", "is", "join", "key", "left",
+                                "like", "limit", "not", "null", "offset", "on", "or", "order",
+                                "outer", "primary", "references", "right", "rollback", "select",
+                                "set", "table", "then", "transaction", "union", "unique",
+                                "update", "values", "view", "when", "where", "with"]) + ")", "keyword"),
+    (r"\b\w+(?=\s*\()", "function"),
+    (r"\b\d+(?:\.\d+)?\b", "number"),
+]
+
+OUTLINE = [
+    (r"(?i)^\s*create\s+(?:or\s+replace\s+)?(?:temporary\s+)?(?:table|view|index|function|procedure|trigger)"
+     r"\s+(?:if\s+not\s+exists\s+)?([\w.\"]+)", "create"),
+]
\ No newline at end of file
@@ -0,0 +1,20 @@
+from notepad_core import keyword_pattern, STRING_PATTERN
+
+BLOCKS = []
+
+RULES = [
+    (r"(?:^|(?<=\s))#.*", "comment"),
+    (STRING_PATTERN, "string"),
+    # Document markers, then mapping keys
+    (r"^(?:---|\.\.\.)(?=\s|$)", "keyword"),
+    (r"[^\s#'\"\-?:,\[\]{}][^#:]*?(?=:(?:\s|$))", "function"),
+    (r"[&*][\w-]+|!!?[\w-]*", "function"),
+    (keyword_pattern(["true", "false", "null", "yes", "no", "on", "off",
+                      "True", "False", "Null", "Yes", "No", "On", "Off"]), "keyword"),
+    (r"-?\b\d+(?:\.\d+)?\b", "number"),
+]
+
+# Top-level keys only
+OUTLINE = [
+    (r"^([^\s#'\"\-?:,\[\]{}][^#:]*?):(?:\s|$)", "key"),
+]
\ No newline at end of file
@@ -0,0 +1,1667 @@
+# Text handling behind Notepad+ that does not need Tk: the document
+# model, lexers and the language registry, line states and the tokenizer
+# thread, the outline of definitions and indentation blocks, find and
+# replace (also across files), file loading and saving, the
+# crash-recovery journal and the line index of large files.
+# Kept free of tkinter so it can be benchmarked and tested headless
+# (see bench.py).
+import re
+import json
+import os
+import importlib
+import time
+import shutil
+import tempfile
+import codecs
+import queue
+import bisect
+import threading
+import mmap
+import fnmatch
+from array import array
+from itertools import accumulate
+
+
+class Document:
+    # Model of the buffer, independent of Tk. The text is kept as a flat
+    # rope: a list of blocks of whole lines, each with its length and
+    # newline count, so edits copy one block and line lookups are a bisect
+    # over per-block prefix sums. The word count is kept up to date from
+    # each edit and the characters either side of it. Every edit is
+    # appended to log as (op, offset, text) while logging is on.
+    BLOCK = 16 * 1024
+    
+    def __init__(self, text=""):
+        self.log = []
+        self.logging = True
+        self.version = 0
+        self.set_text(text)
+        
+    def set_text(self, text):
+        self.blocks = self.split_blocks(text) or [""]
+        self.sizes = [len(block) for block in self.blocks]
+        self.newlines = [block.count("\n") for block in self.blocks]
+        self.starts = [None] * len(self.blocks)
+        self.length = len(text)
+        self.words = sum(count_words(block) for block in self.blocks)  # no word spans a block
+        self.dirty = True
+        self.version += 1
+        
+    def split_blocks(self, text):
+        # Cut text into blocks of about BLOCK characters at line ends
+        blocks = []
+        start = 0
+        while len(text) - start > self.BLOCK:
+            cut = text.rfind("\n", start, start + self.BLOCK) + 1
+            if cut <= start:
+                cut = text.find("\n", start + self.BLOCK) + 1
+                if cut == 0:
+                    break
+            blocks.append(text[start:cut])
+            start = cut
+        if start < len(text):
+            blocks.append(text[start:])
+        return blocks
+        
+    def update_prefixes(self):
+        if self.dirty:
+            self.size_prefix = [0, *accumulate(self.sizes)]
+            self.line_prefix = [0, *accumulate(self.newlines)]
+            self.dirty = False
+            
+    def __len__(self):
+        return self.length
+        
+    def line_count(self):
+        self.update_prefixes()
+        return self.line_prefix[-1] + 1
+        
+    def text(self):
+        return "".join(self.blocks)
+        
+    def chunks(self):
+        return iter(self.blocks)
+        
+    def locate(self, offset):
+        # (block index, offset within the block) of a document offset
+        self.update_prefixes()
+        index = min(bisect.bisect_right(self.size_prefix, offset), len(self.blocks)) - 1
+        return index, offset - self.size_prefix[index]
+        
+    def block_starts(self, index):
+        starts = self.starts[index]
+        if starts is None:
+            block = self.blocks[index]
+            starts = [0]
+            pos = block.find("\n")
+            while pos >= 0:
+                starts.append(pos + 1)
+                pos = block.find("\n", pos + 1)
+            self.starts[index] = starts
+        return starts
+        
+    def line_offset(self, line):
+        # Offset of the start of a 0-based line; the document length past the end
+        self.update_prefixes()
+        if line <= 0:
+            return 0
+        if line >= self.line_prefix[-1] + 1:
+            return self.length
+        index = min(bisect.bisect_right(self.line_prefix, line), len(self.blocks)) - 1
+        return self.size_prefix[index] + self.block_starts(index)[line - self.line_prefix[index]]
+        
+    def line_end(self, line):
+        if line + 1 >= self.line_count():
+            return self.length
+        return self.line_offset(line + 1) - 1
+        
+    def line_col(self, offset):
+        # 0-based (line, column) of an offset
+        index, rel = self.locate(min(max(offset, 0), self.length))
+        block = self.blocks[index]
+        line = self.line_prefix[index] + block.count("\n", 0, rel)
+        return line, rel - (block.rfind("\n", 0, rel) + 1)
+        
+    def offset(self, line, col):
+        # Offset of a 0-based line and column, clamped to the document
+        return min(self.line_offset(line) + col, self.line_end(line))
+        
+    def tk_offset(self, line, column):
+        # Offset of a 0-based line and Tk column, clamped to the line
+        start, end = self.line_offset(line), self.line_end(line)
+        return min(start + text_column(self.get(start, min(start + column, end)), column), end)
+        
+    def tk_line_col(self, offset):
+        # 0-based line and Tk column of an offset
+        line, col = self.line_col(offset)
+        return line, tk_column(self.get(offset - col, offset), col)
+        
+    def get(self, start, end):
+        start, end = max(start, 0), min(end, self.length)
+        if start >= end:
+            return ""
+        index, rel = self.locate(start)
+        parts = []
+        remaining = end - start
+        while remaining > 0:
+            part = self.blocks[index][rel:rel + remaining]
+            parts.append(part)
+            remaining -= len(part)
+            index += 1
+            rel = 0
+        return "".join(parts)
+        
+    def lines(self, start, stop):
+        # Text of the 0-based lines start..stop-1
+        if start >= stop:
+            return []
+        return self.get(self.line_offset(start), self.line_end(stop - 1)).split("\n")
+        
+    def line(self, line):
+        return self.get(self.line_offset(line), self.line_end(line))
+        
+    def insert(self, offset, text, words=None):
+        # words may give count_words(text) when it is already known
+        if not text:
+            return
+        offset = min(max(offset, 0), self.length)
+        before, after = self.get(offset - 1, offset), self.get(offset, offset + 1)
+        if words is None:
+            words = count_words(text)
+        if before and not before.isspace() and not text[0].isspace():
+            words -= 1
+        self.words += words + word_count(after, text[-1]) - word_count(after, before)
+        index, rel = self.locate(offset)
+        block = self.blocks[index]
+        self.replace_blocks(index, index + 1, block[:rel] + text + block[rel:])
+        self.length += len(text)
+        self.record("insert", offset, text)
+        
+    def delete(self, start, end):
+        start, end = max(start, 0), min(end, self.length)
+        if start >= end:
+            return
+        if start == 0 and end == self.length:
+            removed = self.text() if self.logging else ""
+            self.words = 0
+        else:
+            removed = self.get(start, end)
+            before, after = self.get(start - 1, start), self.get(end, end + 1)
+            self.words += word_count(after, before) - word_count(removed + after, before)
+        first, rel_start = self.locate(start)
+        last, rel_end = self.locate(end)
+        self.replace_blocks(first, last + 1, self.blocks[first][:rel_start] + self.blocks[last][rel_end:])
+        self.length -= end - start
+        self.record("delete", start, removed)
+        
+    def delete_span(self, start, end):
+        # Offsets a Tk text widget really deletes for start..end. It keeps a
+        # newline after the last line, so a range running past the document
+        # stops before that newline and then also takes the newline before
+        # it when it starts at a line start. An empty range stays at start.
+        if start >= end:
+            return start, start
+        if end > self.length:
+            if self.get(start - 1, start) == "\n":
+                start -= 1
+            return start, self.length
+        return start, end
+        
+    def replace_blocks(self, first, last, text):
+        # Swap blocks first..last-1 for text, re-split into blocks. Text that
+        # no longer ends a line, or is small, absorbs the following block.
+        while last < len(self.blocks) and (not text.endswith("\n") or len(text) < self.BLOCK // 4):
+            text += self.blocks[last]
+            last += 1
+        blocks = self.split_blocks(text)
+        if not blocks and first == 0 and last == len(self.blocks):
+            blocks = [""]
+        self.blocks[first:last] = blocks
+        self.sizes[first:last] = [len(block) for block in blocks]
+        self.newlines[first:last] = [block.count("\n") for block in blocks]
+        self.starts[first:last] = [None] * len(blocks)
+        self.dirty = True
+        
+    def snapshot(self):
+        # A copy that later edits do not touch, for worker threads to read.
+        # Blocks are immutable strings, so only the block lists are copied.
+        copy = Document.__new__(Document)
+        copy.__dict__.update(self.__dict__)
+        copy.blocks = list(self.blocks)
+        copy.sizes = list(self.sizes)
+        copy.newlines = list(self.newlines)
+        copy.starts = list(self.starts)
+        copy.log = []
+        copy.logging = False
+        return copy
+        
+    def record(self, op, offset, text):
+        self.version += 1
+        if self.logging:
+            self.log.append((op, offset, text))
+            
+    def clear_log(self):
+        self.log = []
+
+
+# Tk keeps characters above U+FFFF as surrogate pairs, so each takes two
+# of its columns
+ASTRAL = re.compile("[\U00010000-\U0010FFFF]")
+
+
+def tk_column(text, column):
+    # Tk column of a column of text, a line
+    if text.isascii():
+        return column
+    return column + len(ASTRAL.findall(text, 0, column))
+
+
+def text_column(text, column):
+    # Column of text, a line, at a Tk column; one inside a surrogate pair
+    # falls before its character
+    if text.isascii():
+        return column
+    result = column
+    for count, match in enumerate(ASTRAL.finditer(text)):
+        if match.start() + count >= column:
+            break
+        result -= 1
+    return result
+
+
+# Bytes that str.split() separates words at, as " ", and all others as
+# "x", so words are counted as " x" pairs without building a list
+WORD_MASK = bytes(32 if chr(i).isspace() else 120 for i in range(128)) + b"x" * 128
+
+
+def count_words(text):
+    # len(text.split()), about three times faster for ASCII text
+    if not text.isascii():
+        return len(text.split())
+    mask = text.encode("ascii").translate(WORD_MASK)
+    return mask.count(b" x") + mask.startswith(b"x")
+
+
+def word_count(text, before=""):
+    # Whitespace-separated words in text, less the one it continues when
+    # it starts inside a word that began in before
+    count = count_words(text)
+    if count and not text[0].isspace() and before and not before.isspace():
+        count -= 1
+    return count
+
+
+# Token kinds used by RegexLexer for the groups of its combined pattern
+BLOCK, RULE = 0, 1
+
+# Tags the lexers produce; TokenRanges stores indices into this
+TAGS = ("keyword", "comment", "string", "number", "function")
+
+
+class RegexLexer:
+    # A language compiled into one alternation regex. Constructs that can
+    # span lines ("""...""", /* ... */) are blocks: when a block is left
+    # open at the end of a line, its index becomes the state the next line
+    # starts in, so every line can be lexed on its own.
+    def __init__(self, rules, blocks=()):
+        self.blocks = list(blocks)
+        parts = []
+        for i, (opener, closer, tag) in enumerate(self.blocks):
+            parts.append(f"(?P<b{i}>{re.escape(opener)})")
+        for i, (pattern, tags) in enumerate(rules):
+            parts.append(f"(?P<r{i}>{pattern})")
+        self.regex = re.compile("|".join(parts))
+        
+        # Group name -> (kind, block index or tag(s), group number)
+        self.groups = {}
+        for i in range(len(self.blocks)):
+            self.groups[f"b{i}"] = (BLOCK, i, self.regex.groupindex[f"b{i}"])
+        for i, (pattern, tags) in enumerate(rules):
+            self.groups[f"r{i}"] = (RULE, tags, self.regex.groupindex[f"r{i}"])
+            
+        # Lines without any block opener cannot change the state
+        if self.blocks:
+            self.opener_regex = re.compile("|".join(re.escape(b[0]) for b in self.blocks))
+        else:
+            self.opener_regex = None
+            
+    def lex_line(self, line, state=None):
+        # Returns the (start, end, tag) tokens of one line and the state
+        # the following line starts in
+        tokens = []
+        pos = 0
+        if state is not None:
+            pos = self.close_block(line, 0, 0, state, tokens)
+            if pos < 0:
+                return tokens, state
+                
+        search = self.regex.search
+        length = len(line)
+        while pos < length:
+            match = search(line, pos)
+            if match is None:
+                break
+            kind, value, group = self.groups[match.lastgroup]
+            start, end = match.span()
+            if kind == BLOCK:
+                end = self.close_block(line, start, end, value, tokens)
+                if end < 0:
+                    return tokens, value
+            elif isinstance(value, str):
+                tokens.append((start, end, value))
+            else:
+                # One tag per inner group, e.g. ("keyword", "function") for "def name"
+                for offset, tag in enumerate(value, 1):
+                    sub_start, sub_end = match.span(group + offset)
+                    if sub_start < sub_end:
+                        tokens.append((sub_start, sub_end, tag))
+            pos = end if end > start else start + 1
+            
+        return tokens, None
+        
+    def close_block(self, line, start, search_from, index, tokens):
+        # Tag a block from start up to its closer; -1 if it runs past the line
+        opener, closer, tag = self.blocks[index]
+        end = line.find(closer, search_from)
+        if end < 0:
+            tokens.append((start, len(line), tag))
+            return -1
+        end += len(closer)
+        tokens.append((start, end, tag))
+        return end
+        
+    def end_state(self, line, state=None):
+        # Same as lex_line(line, state)[1], without building tokens for the
+        # common case of a line that cannot open a block
+        if state is None and (self.opener_regex is None or not self.opener_regex.search(line)):
+            return None
+        return self.lex_line(line, state)[1]
+
+
+def keyword_pattern(keywords):
+    return r"\b(?:" + "|".join(keywords) + r")\b"
+
+
+STRING_PATTERN = r'"(?:[^"\\]|\\.)*"|\'(?:[^\'\\]|\\.)*\''
+
+
+def shebang_command(path):
+    # The interpreter a file's #! line names ("python" for
+    # "#!/usr/bin/env python3"), or None
+    try:
+        with open(path, "rb") as file:
+            line = file.readline(256)
+    except OSError:
+        return None
+    if not line.startswith(b"#!"):
+        return None
+    words = line[2:].decode("utf-8", "replace").split()
+    if words and os.path.basename(words[0]) == "env":
+        words = [word for word in words[1:] if not word.startswith("-") and "=" not in word]
+    if not words:
+        return None
+    return os.path.basename(words[0]).rstrip("0123456789.") or None
+
+
+class LanguageRegistry:
+    # The languages listed in a package's LANGUAGES (see
+    # languages/__init__.py). Telling a file's language only reads that
+    # list; a language's module is imported the first time it is
+    # highlighted or outlined, and each RegexLexer is compiled the first
+    # time it is used and then kept, so languages that are never opened
+    # cost nothing.
+    def __init__(self, package="languages"):
+        self.package = package
+        self.languages = None  # name -> (title, extensions, shebangs), in name order
+        self.extensions = {}
+        self.shebangs = {}
+        self.definitions = {}  # name -> module, once imported
+        self.lexers = {}
+        self.outlines = {}
+        
+    def scan(self):
+        if self.languages is not None:
+            return
+        package = importlib.import_module(self.package)
+        self.languages = dict(sorted(package.LANGUAGES.items()))
+        for name, (title, extensions, shebangs) in self.languages.items():
+            for extension in extensions:
+                self.extensions[extension] = name
+            for command in shebangs:
+                self.shebangs[command] = name
+                
+    def definition(self, name):
+        # A language's module; None for plain text
+        self.scan()
+        if name not in self.languages:
+            return None
+        definition = self.definitions.get(name)
+        if definition is None:
+            definition = self.definitions[name] = importlib.import_module(f"{self.package}.{name}")
+        return definition
+        
+    def titles(self):
+        # (name, menu title) of every language
+        self.scan()
+        return [(name, language[0]) for name, language in self.languages.items()]
+        
+    def lexer(self, name):
+        # The compiled lexer of a language; None for plain text
+        lexer = self.lexers.get(name)
+        if lexer is None:
+            definition = self.definition(name)
+            if definition is None:
+                return None
+            lexer = self.lexers[name] = RegexLexer(definition.RULES, definition.BLOCKS)
+        return lexer
+        
+    def outline(self, name):
+        # Compiled (pattern, kind) pairs of a language's OUTLINE; None if
+        # it has none
+        if name not in self.outlines:
+            patterns = getattr(self.definition(name), "OUTLINE", None)
+            self.outlines[name] = [(re.compile(pattern), kind) for pattern, kind in patterns] if patterns else None
+        return self.outlines[name]
+        
+    def detect(self, path):
+        # Language of a file by its extension, else by the #! line of an
+        # existing file; "plain" if neither is known
+        self.scan()
+        name = self.extensions.get(os.path.splitext(path)[1].lower())
+        if name is None and os.path.isfile(path):
+            name = self.shebangs.get(shebang_command(path))
+        return name or "plain"
+
+
+LANGUAGES = LanguageRegistry()
+
+
+class LineStates:
+    # The lexer state every line of a Document starts in, which is all a
+    # line needs to be lexed on its own. An edit only re-lexes lines until
+    # the state settles again; tagged marks the lines whose tokens have
+    # been applied since they last changed.
+    CHUNK = 2000
+    
+    def __init__(self, document):
+        self.document = document
+        self.lexer = None
+        self.states = [None]  # state at the start of each line, plus one past the end
+        self.valid = 1  # leading entries of states known to be correct
+        self.tagged = bytearray()  # 1 for lines whose tags are up to date
+        
+    def line_count(self):
+        return self.document.line_count()
+        
+    def set_lexer(self, lexer):
+        self.lexer = lexer
+        self.reset()
+        
+    def reset(self):
+        count = self.line_count()
+        self.states = [None] * (count + 1)
+        self.valid = 1
+        self.tagged = bytearray(count)
+        
+    def iter_lines(self, start, stop):
+        # Yield the text of lines start..stop-1 (0-based), fetched in chunks
+        while start < stop:
+            end = min(stop, start + self.CHUNK)
+            yield from self.document.lines(start, end)
+            start = end
+            
+    def update(self, first, old_count, new_count, stop):
+        # Lines first..first+old_count-1 (1-based) were replaced by
+        # new_count lines; states are brought up to date as far as line stop
+        if self.lexer is None:
+            return
+        i = first - 1
+        self.states[i + 1:i + old_count] = [None] * (new_count - 1)
+        self.tagged[i:i + old_count] = bytes(new_count)
+        if self.valid <= i:
+            return
+            
+        # States after the edited lines are still right if the state
+        # entering them turns out unchanged
+        if self.valid > i + old_count:
+            tail_valid = self.valid + new_count - old_count
+        else:
+            tail_valid = 0
+        self.valid = i + 1
+        self.relex(i, stop, i + new_count, tail_valid)
+        
+    def relex(self, start, stop, settle_from=0, tail_valid=0):
+        # Recompute line start states from line start (0-based) onwards.
+        # Stops once the state settles past settle_from, or at line stop.
+        count = len(self.tagged)
+        stop = min(stop, count)
+        states = self.states
+        state = states[start]
+        index = start
+        for line in self.iter_lines(start, stop):
+            state = self.lexer.end_state(line, state)
+            index += 1
+            if settle_from <= index < tail_valid and states[index] == state:
+                self.valid = tail_valid
+                return
+            if states[index] != state:
+                states[index] = state
+                if index < count:
+                    self.tagged[index] = 0
+            self.valid = index + 1
+            
+    def line_tokens(self, start, stop):
+        # Yield the (start, end, tag) tokens of lines start..stop-1
+        # (0-based); their states must be valid
+        lex_line = self.lexer.lex_line
+        for offset, line in enumerate(self.iter_lines(start, stop)):
+            yield lex_line(line, self.states[start + offset])[0]
+
+
+class TokenRanges:
+    # What lexing lines start..stop-1 of one document version produced:
+    # the state each of lines start+1..stop begins in, and the tokens of
+    # lines token_from..stop-1 as parallel arrays of columns and TAGS
+    # indices. The tokens of line token_from + i are firsts[i] up to
+    # firsts[i + 1].
+    def __init__(self, stamp, start, token_from, stop):
+        self.stamp = stamp
+        self.start = start
+        self.token_from = token_from
+        self.stop = stop
+        self.states = []
+        self.firsts = array("I")
+        self.starts = array("I")
+        self.ends = array("I")
+        self.tags = array("B")
+        
+    def request(self):
+        return self.stamp, self.start, self.token_from, self.stop
+        
+    def line_tokens(self, line):
+        # (start, end, tag) tokens of a 0-based line in token_from..stop-1
+        i = line - self.token_from
+        for k in range(self.firsts[i], self.firsts[i + 1]):
+            yield self.starts[k], self.ends[k], TAGS[self.tags[k]]
+
+
+def lex_ranges(document, lexer, stamp, start, state, token_from, stop, cancelled=None):
+    # Lex lines start..stop-1 of document, line start beginning in state;
+    # lines before token_from only advance the state. Returns None if
+    # cancelled is set part way.
+    result = TokenRanges(stamp, start, token_from, stop)
+    states, firsts, starts, ends, tags = result.states, result.firsts, result.starts, result.ends, result.tags
+    tag_index = {tag: i for i, tag in enumerate(TAGS)}
+    end_state, lex_line = lexer.end_state, lexer.lex_line
+    index = start
+    while index < stop:
+        if cancelled is not None and cancelled.is_set():
+            return None
+        end = min(stop, index + LineStates.CHUNK)
+        for line in document.lines(index, end):
+            if index < token_from:
+                state = end_state(line, state)
+            else:
+                firsts.append(len(tags))
+                tokens, state = lex_line(line, state)
+                if tokens and not line.isascii():
+                    # Tagged by Tk columns
+                    tokens = [(tk_column(line, token_start), tk_column(line, token_end), tag)
+                              for token_start, token_end, tag in tokens]
+                for token_start, token_end, tag in tokens:
+                    starts.append(token_start)
+                    ends.append(token_end)
+                    tags.append(tag_index[tag])
+            states.append(state)
+            index += 1
+    firsts.append(len(tags))
+    return result
+
+
+class Tokenizer:
+    # Runs lex_ranges on a worker thread against snapshots of a Document.
+    # Only the newest job matters: submitting one cancels the one running
+    # and any still queued. Results are queued for the Tk thread to poll.
+    def __init__(self):
+        self.jobs = queue.Queue()
+        self.results = queue.Queue()
+        self.cancelled = threading.Event()
+        self.thread = None
+        
+    def submit(self, document, lexer, stamp, start, state, token_from, stop):
+        self.cancelled.set()
+        self.cancelled = threading.Event()
+        self.jobs.put((document.snapshot(), lexer, stamp, start, state, token_from, stop, self.cancelled))
+        if self.thread is None:
+            self.thread = threading.Thread(target=self.run, daemon=True)
+            self.thread.start()
+            
+    def close(self):
+        self.cancelled.set()
+        self.jobs.put(None)
+        
+    def run(self):
+        while True:
+            job = self.jobs.get()
+            while job is not None and not self.jobs.empty():
+                job = self.jobs.get_nowait()
+            if job is None:
+                return
+            result = lex_ranges(*job)
+            if result is not None:
+                self.results.put(result)
+
+
+class Outline:
+    # Structure of a Document for code folding and the outline panel.
+    # Symbols are the lines matched by a language's OUTLINE patterns. They
+    # are listed by the first scan (so a file whose outline is never shown
+    # costs nothing), then kept in line order from the same (first,
+    # old_count, new_count) edits as LineStates: an edit only searches the
+    # lines it changed, and finding the symbol at a line is a bisect. Like
+    # the Document's blocks, the symbol lines are kept in runs of about
+    # RUN, each relative to a base whose step from the run before is
+    # stored, so an edit that adds or removes lines rewrites one run and
+    # one step, and the bases are prefix sums worked out when next needed.
+    # Fold blocks come from indentation and are read from the lines around
+    # them when asked for.
+    CHUNK = 2000
+    RUN = 128
+    LOOKAHEAD = 200  # lines read at a time looking for the end of a block
+    TAB = 4
+    
+    def __init__(self, document):
+        self.document = document
+        self.patterns = None
+        self.scanned = False
+        self.runs = []  # 0-based lines of the symbols, ascending, relative to the run's base
+        self.steps = []  # base of each run minus that of the run before
+        self.symbols = []  # (kind, name, indent) of each symbol
+        self.dirty = True
+        self.version = 0  # changes whenever the list of symbols does
+        
+    def set_patterns(self, patterns):
+        self.patterns = patterns
+        self.scanned = False
+        self.runs, self.steps, self.symbols = [], [], []
+        self.dirty = True
+        self.version += 1
+        
+    def scan(self):
+        # List the symbols if they are not yet
+        if self.scanned:
+            return
+        self.scanned = True
+        lines = []
+        if self.patterns:
+            count = self.document.line_count()
+            for start in range(0, count, self.CHUNK):
+                stop = min(count, start + self.CHUNK)
+                self.find_symbols(self.document.lines(start, stop), start, lines, self.symbols)
+        self.runs, self.steps = self.split_runs(lines, 0)
+        self.dirty = True
+        self.version += 1
+        
+    def split_runs(self, lines, base):
+        # (runs, steps) for ascending lines, the first step from base; runs
+        # hold between RUN and 2 * RUN lines unless there are fewer
+        count = max(1, len(lines) // self.RUN)
+        size = -(-len(lines) // count) if lines else 0
+        runs, steps = [], []
+        for start in range(0, len(lines), size or 1):
+            run = lines[start:start + size]
+            runs.append([line - run[0] for line in run])
+            steps.append(run[0] - base)
+            base = run[0]
+        return runs, steps
+        
+    def update_prefixes(self):
+        if self.dirty:
+            # Each run starts at its base, its first line being 0
+            self.bases = list(accumulate(self.steps))
+            self.counts = list(accumulate(map(len, self.runs), initial=0))
+            self.dirty = False
+            
+    def locate(self, line):
+        # (run, index) of the first symbol at or after a 0-based line,
+        # index counting all symbols
+        self.update_prefixes()
+        run = max(bisect.bisect_right(self.bases, line) - 1, 0)
+        if run >= len(self.runs):
+            return run, 0
+        return run, self.counts[run] + bisect.bisect_left(self.runs[run], line - self.bases[run])
+        
+    def symbol_line(self, index):
+        # 0-based line of a symbol
+        self.update_prefixes()
+        run = bisect.bisect_right(self.counts, index) - 1
+        return self.bases[run] + self.runs[run][index - self.counts[run]]
+        
+    def indent(self, text):
+        # Width of the leading whitespace of a line; -1 for a blank line
+        stripped = text.lstrip(" \t")
+        if not stripped:
+            return -1
+        return len(text[:len(text) - len(stripped)].expandtabs(self.TAB))
+        
+    def find_symbols(self, texts, first, lines, symbols):
+        # Append the symbols among texts, the lines from first (0-based)
+        for line, text in enumerate(texts, first):
+            for pattern, kind in self.patterns:
+                match = pattern.search(text)
+                if match:
+                    lines.append(line)
+                    symbols.append((kind, match.group(1), self.indent(text)))
+                    break
+                    
+    def update(self, first, old_count, new_count):
+        # Lines first..first+old_count-1 (1-based) were replaced by new_count lines
+        if not self.patterns or not self.scanned:
+            return
+        i = first - 1
+        first_run, lo = self.locate(i)
+        last_run, hi = self.locate(i + old_count)
+        lines, symbols = [], []
+        self.find_symbols(self.document.lines(i, i + new_count), i, lines, symbols)
+        if symbols != self.symbols[lo:hi]:
+            self.version += 1
+        self.symbols[lo:hi] = symbols
+        
+        # Rewrite the runs the edit touches, then carry the shift in the
+        # lines after it by the step of the run that follows them
+        shift = new_count - old_count
+        end = min(last_run + 1, len(self.runs))
+        start = self.counts[first_run] if first_run < len(self.runs) else self.counts[-1]
+        merged = [self.bases[run] + line for run in range(first_run, end) for line in self.runs[run]]
+        merged[lo - start:] = lines + [line + shift for line in merged[hi - start:]]
+        before = self.bases[first_run - 1] if first_run > 0 else 0
+        runs, steps = self.split_runs(merged, before)
+        if end < len(self.runs):
+            self.steps[end] = self.bases[end] + shift - (before + sum(steps))
+        self.runs[first_run:end] = runs
+        self.steps[first_run:end] = steps
+        self.dirty = True
+        
+    def symbol_at(self, line):
+        # Index of the last symbol at or before a 0-based line; -1 if none
+        return self.locate(line + 1)[1] - 1
+        
+    def fold_starts(self, start, stop):
+        # The 0-based lines in start..stop-1 that open a block: the next
+        # non-blank line is indented deeper
+        count = self.document.line_count()
+        levels = [self.indent(text) for text in self.document.lines(start, min(count, stop + self.LOOKAHEAD))]
+        starts = set()
+        following = -1
+        for offset in range(len(levels) - 1, -1, -1):
+            level = levels[offset]
+            if level >= 0:
+                if following > level and start + offset < stop:
+                    starts.add(start + offset)
+                following = level
+        return starts
+        
+    def fold_end(self, line):
+        # Last line of the block a 0-based line opens; None if it opens none
+        count = self.document.line_count()
+        base = self.indent(self.document.line(line))
+        end = None
+        start = line + 1
+        while base >= 0 and start < count:
+            stop = min(count, start + self.LOOKAHEAD)
+            for index, text in enumerate(self.document.lines(start, stop), start):
+                level = self.indent(text)
+                if 0 <= level <= base:
+                    return end
+                if level > base:
+                    end = index
+            start = stop
+        return end
+
+
+def detect_encoding(path):
+    with open(path, "rb") as file:
+        return head_encoding(file.read(65536))
+
+
+# Encodings named by byte order, whose codecs read a BOM as U+FEFF and do
+# not write one: skip_bom drops it on reading and FileSaver writes it back
+BOMS = {"utf-32-le": codecs.BOM_UTF32_LE, "utf-32-be": codecs.BOM_UTF32_BE,
+        "utf-16-le": codecs.BOM_UTF16_LE, "utf-16-be": codecs.BOM_UTF16_BE}
+
+
+def head_encoding(head):
+    # Returns the encoding to decode a file with, given its first bytes:
+    # from its BOM if it has one, UTF-8 if the head decodes as such,
+    # otherwise Latin-1, which maps every byte and so round-trips on save.
+    # The UTF-32 BOMs are tried first, as they begin with UTF-16's.
+    if head.startswith(codecs.BOM_UTF8):
+        return "utf-8-sig"
+    for encoding, bom in BOMS.items():
+        if head.startswith(bom):
+            return encoding
+    try:
+        codecs.getincrementaldecoder("utf-8")().decode(head, final=False)
+    except UnicodeDecodeError:
+        return "latin-1"
+    return "utf-8"
+
+
+def skip_bom(file, encoding):
+    # Read past the BOM of a text file just opened in encoding
+    if encoding in BOMS:
+        file.read(1)
+
+
+# Set on a thread whose decoding replaced invalid bytes
+DECODING = threading.local()
+
+
+def replace_invalid(error):
+    # errors="notepad-replace": the "replace" handler, noting that it ran,
+    # since U+FFFD in the text may also have been in the file
+    DECODING.replaced = True
+    return "\ufffd", error.end
+
+
+codecs.register_error("notepad-replace", replace_invalid)
+
+
+class FileLoader:
+    # Reads a file on a worker thread and hands decoded chunks to the Tk
+    # thread through a bounded queue, so only a few chunks are ever held
+    # outside the widget. Items are (chunk, words in it), words being
+    # counted here rather than on the Tk thread; None marks the end.
+    # replaced tells whether invalid bytes were read as U+FFFD.
+    CHUNK = 256 * 1024
+    
+    def __init__(self, path):
+        self.path = path
+        self.size = os.path.getsize(path)
+        self.encoding = detect_encoding(path)
+        self.queue = queue.Queue(maxsize=8)
+        self.cancelled = threading.Event()
+        self.bytes_read = 0
+        self.newlines = None
+        self.replaced = False
+        self.error = None
+        self.thread = threading.Thread(target=self.run, daemon=True)
+        
+    def start(self):
+        self.thread.start()
+        
+    def cancel(self):
+        self.cancelled.set()
+        
+    def run(self):
+        try:
+            # Invalid bytes are replaced rather than failing the whole open
+            DECODING.replaced = False
+            with open(self.path, "r", encoding=self.encoding, errors="notepad-replace") as file:
+                skip_bom(file, self.encoding)
+                while not self.cancelled.is_set():
+                    chunk = file.read(self.CHUNK)
+                    if not chunk:
+                        break
+                    self.bytes_read = file.buffer.tell()
+                    self.replaced = DECODING.replaced
+                    self.put((chunk, count_words(chunk)))
+                self.newlines = file.newlines
+        except Exception as e:
+            self.error = e
+        self.put(None)
+        
+    def put(self, item):
+        while not self.cancelled.is_set():
+            try:
+                self.queue.put(item, timeout=0.1)
+                return
+            except queue.Full:
+                pass
+                
+    def progress(self):
+        return min(self.bytes_read / self.size, 1.0) if self.size else 1.0
+
+
+def has_border(text):
+    # True if some proper prefix of text is also a suffix, i.e. two
+    # matches of it can overlap
+    return any(text[:k] == text[-k:] for k in range(1, len(text)))
+
+
+class FindEngine:
+    # Finds every match of a query with one re scan over a snapshot of the
+    # document and keeps their offsets for navigation and tagging. A
+    # literal query that grows while typing is narrowed from the previous
+    # matches instead of rescanning.
+    def __init__(self, document):
+        self.document = document
+        self.query = ""
+        self.options = None
+        self.pattern = None
+        self.snapshot = None
+        self.version = None
+        self.starts = array("q")
+        self.ends = array("q")
+        
+    def compile(self, query, regex=False, case=False, word=False):
+        pattern = query if regex else re.escape(query)
+        if word:
+            pattern = rf"\b(?:{pattern})\b"
+        return re.compile(pattern, 0 if case else re.IGNORECASE)
+        
+    def stale(self):
+        return self.version != self.document.version
+        
+    def clear(self):
+        self.query = ""
+        self.snapshot = None
+        self.starts = array("q")
+        self.ends = array("q")
+        
+    def search(self, query, regex=False, case=False, word=False):
+        # Returns the number of matches; raises re.error for a bad pattern
+        options = (regex, case, word)
+        pattern = self.compile(query, regex, case, word)
+        if self.can_narrow(query, options):
+            self.narrow(pattern)
+        else:
+            self.snapshot = self.document.text()
+            self.starts = array("q")
+            self.ends = array("q")
+            for match in pattern.finditer(self.snapshot):
+                if match.end() > match.start():
+                    self.starts.append(match.start())
+                    self.ends.append(match.end())
+        self.query = query
+        self.options = options
+        self.pattern = pattern
+        self.version = self.document.version
+        return len(self.starts)
+        
+    def can_narrow(self, query, options):
+        regex, case, word = options
+        if self.snapshot is None or self.stale() or options != self.options or regex or word:
+            return False
+        old, new = (self.query, query) if case else (self.query.lower(), query.lower())
+        return bool(old) and new.startswith(old) and not has_border(old)
+        
+    def narrow(self, pattern):
+        # Every match of the longer query starts where the old one matched
+        starts, ends = array("q"), array("q")
+        end = 0
+        for start in self.starts:
+            if start < end:
+                continue
+            match = pattern.match(self.snapshot, start)
+            if match is not None:
+                end = match.end()
+                starts.append(start)
+                ends.append(end)
+        self.starts, self.ends = starts, ends
+        
+    def __len__(self):
+        return len(self.starts)
+        
+    def next_index(self, offset):
+        # First match starting at or after offset, wrapping around
+        if not self.starts:
+            return None
+        index = bisect.bisect_left(self.starts, offset)
+        return index if index < len(self.starts) else 0
+        
+    def prev_index(self, offset):
+        # Last match starting before offset, wrapping around
+        if not self.starts:
+            return None
+        return (bisect.bisect_left(self.starts, offset) - 1) % len(self.starts)
+        
+    def between(self, start, end):
+        # Indices of the matches overlapping start..end
+        return range(bisect.bisect_left(self.ends, start + 1), bisect.bisect_left(self.starts, end))
+
+
+def replacer(replacement, regex=False):
+    # Function giving the replacement text for a match: backreferences
+    # are expanded for regex queries, literal text is used as-is
+    if regex:
+        return lambda match: match.expand(replacement)
+    return lambda match: replacement
+
+
+def plan_replacements(text, pattern, replace, start=0, end=None):
+    # (start, end, new text) for every match in text[start:end]
+    end = len(text) if end is None else end
+    return [(match.start(), match.end(), replace(match)) for match in pattern.finditer(text, start, end)]
+
+
+# Replace All above this many matches rewrites the span they cover in
+# one edit instead of one edit per match
+REPLACE_SPAN_THRESHOLD = 1000
+
+
+def replace_edits(text, edits):
+    # The (start, end, new text) edits Replace All makes to text for the
+    # planned ones, in the order to apply them: each match from the last,
+    # or one rewrite from the first match to the last when there are many
+    if len(edits) <= REPLACE_SPAN_THRESHOLD:
+        return edits[::-1]
+    span_start, span_end = edits[0][0], edits[-1][1]
+    parts = []
+    pos = span_start
+    for edit_start, edit_end, new_text in edits:
+        parts.append(text[pos:edit_start])
+        parts.append(new_text)
+        pos = edit_end
+    return [(span_start, span_end, "".join(parts))]
+
+
+def stream_replace(path, pattern, replace, encoding, progress=None, chunk_size=4 * 1024 * 1024):
+    # Rewrite a file through a temporary file next to it, a block of whole
+    # lines at a time, so no more than one block is held in memory. Matches
+    # spanning a block boundary are not found. Returns the match count.
+    directory = os.path.dirname(os.path.abspath(path))
+    fd, temp_path = tempfile.mkstemp(dir=directory, prefix=".notepad-", suffix=".tmp")
+    count = 0
+    try:
+        # surrogateescape carries undecodable bytes through unchanged
+        with open(path, "r", encoding=encoding, errors="surrogateescape", newline="") as source, \
+                open(fd, "w", encoding=encoding, errors="surrogateescape", newline="") as target:
+            carry = ""
+            while True:
+                chunk = source.read(chunk_size)
+                data = carry + chunk
+                cut = data.rfind("\n") + 1 if chunk else len(data)
+                if chunk and cut == 0 and len(data) < 4 * chunk_size:
+                    carry = data
+                    continue
+                cut = cut or len(data)
+                block, carry = data[:cut], data[cut:]
+                new_block, replaced = pattern.subn(replace, block)
+                target.write(new_block)
+                count += replaced
+                if progress is not None:
+                    progress(source.buffer.tell())
+                if not chunk:
+                    break
+        shutil.copymode(path, temp_path)
+        os.replace(temp_path, path)
+    except BaseException:
+        os.unlink(temp_path)
+        raise
+    return count
+
+
+class FileSearch:
+    # Find in Files. A thread walks the tree under root, skipping ignored
+    # paths, and hands the files to a pool of worker threads; files from
+    # MMAP_THRESHOLD up are searched through mmap instead of being read
+    # whole, and files with a NUL byte near the start are taken as binary
+    # and skipped. Each file with matches is queued for the Tk thread as
+    # (path, [(line, column, length, text), ...]), one entry per matching
+    # line (1-based line, 0-based column); None marks the end.
+    WORKERS = min(8, os.cpu_count() or 1)
+    MMAP_THRESHOLD = 1024 * 1024
+    SNIFF = 8192
+    MAX_MATCHES = 10000
+    MAX_TEXT = 200
+    IGNORE = (".git/", ".hg/", ".svn/", "__pycache__/", "node_modules/", ".tox/", ".venv/",
+              "*.pyc", "*.pyo", "*.so", "*.dll", "*.exe", "*.o", "*.zip", "*.gz", "*.png", "*.jpg")
+              
+    def __init__(self, root, pattern, include=(), ignore=()):
+        self.root = root
+        self.pattern = pattern
+        self.include = list(include)
+        self.ignore = [*self.IGNORE, *ignore, *gitignore_patterns(root)]
+        self.byte_patterns = {}
+        self.queue = queue.Queue()
+        self.cancelled = threading.Event()
+        self.lock = threading.Lock()
+        self.files = 0
+        self.bytes = 0
+        self.skipped = 0
+        self.matches = 0
+        self.started = None
+        self.elapsed = None
+        self.error = None
+        self.thread = threading.Thread(target=self.run, daemon=True)
+        
+    def start(self):
+        self.started = time.perf_counter()
+        self.thread.start()
+        
+    def cancel(self):
+        self.cancelled.set()
+        
+    def full(self):
+        return self.matches >= self.MAX_MATCHES
+        
+    def rates(self):
+        # (MB/s, files/s) so far
+        elapsed = self.elapsed if self.elapsed is not None else time.perf_counter() - self.started
+        elapsed = max(elapsed, 1e-6)
+        return self.bytes / elapsed / (1024 * 1024), self.files / elapsed
+        
+    def run(self):
+        # concurrent.futures (and the logging it imports) is only loaded
+        # once a search runs, keeping it off the editor's startup
+        from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+        pool = ThreadPoolExecutor(self.WORKERS)
+        try:
+            pending = set()
+            for path in self.walk():
+                if self.cancelled.is_set() or self.full():
+                    break
+                pending.add(pool.submit(self.search_file, path))
+                if len(pending) >= self.WORKERS * 4:
+                    done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                    for future in done:
+                        future.result()
+            for future in wait(pending).done:
+                future.result()
+        except Exception as e:
+            self.error = e
+            self.cancelled.set()
+        finally:
+            pool.shutdown(wait=True, cancel_futures=True)
+        self.elapsed = time.perf_counter() - self.started
+        self.queue.put(None)
+        
+    def walk(self):
+        # Yield the files under root that are neither ignored nor excluded
+        # by the include patterns, a directory at a time
+        stack = [self.root]
+        while stack and not self.cancelled.is_set():
+            directory = stack.pop()
+            try:
+                entries = sorted(os.scandir(directory), key=lambda entry: entry.name)
+            except OSError:
+                continue
+            directories = []
+            for entry in entries:
+                try:
+                    is_dir = entry.is_dir(follow_symlinks=False)
+                    relative = os.path.relpath(entry.path, self.root).replace(os.sep, "/")
+                    if self.ignored(relative, entry.name, is_dir):
+                        continue
+                    if is_dir:
+                        directories.append(entry.path)
+                    elif entry.is_file() and self.included(entry.name):
+                        yield entry.path
+                except OSError:
+                    continue
+            stack.extend(reversed(directories))
+            
+    def ignored(self, relative, name, is_dir):
+        # gitignore-style globs: "dir/" only matches directories, and a
+        # glob with a slash is matched against the path from root
+        for pattern in self.ignore:
+            if pattern.endswith("/"):
+                if not is_dir:
+                    continue
+                pattern = pattern[:-1]
+            if "/" in pattern:
+                if fnmatch.fnmatch(relative, pattern.lstrip("/")):
+                    return True
+            elif fnmatch.fnmatch(name, pattern):
+                return True
+        return False
+        
+    def included(self, name):
+        return not self.include or any(fnmatch.fnmatch(name, pattern) for pattern in self.include)
+        
+    def search_file(self, path):
+        if self.cancelled.is_set() or self.full():
+            return
+        try:
+            with open(path, "rb") as file:
+                size = os.fstat(file.fileno()).st_size
+                head = file.read(self.SNIFF)
+                encoding = head_encoding(head)
+                if b"\0" in head and not encoding.startswith(("utf-16", "utf-32")):
+                    with self.lock:
+                        self.skipped += 1
+                    return
+                pattern = None
+                if size >= self.MMAP_THRESHOLD and encoding in ("utf-8", "utf-8-sig", "latin-1"):
+                    pattern = self.byte_pattern(encoding)
+                if pattern is not None:
+                    with mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as data:
+                        found = self.search_bytes(data, pattern, encoding)
+                else:
+                    file.seek(0)
+                    text = file.read().decode(encoding, "replace")
+                    found = self.search_text(text[1:] if encoding in BOMS else text)
+        except (OSError, ValueError):
+            with self.lock:
+                self.skipped += 1
+            return
+            
+        with self.lock:
+            self.files += 1
+            self.bytes += size
+            found = found[:max(self.MAX_MATCHES - self.matches, 0)]
+            self.matches += len(found)
+        if found:
+            self.queue.put((path, found))
+            
+    def byte_pattern(self, encoding):
+        # The pattern compiled for the raw bytes of a file, None if it
+        # cannot be expressed in that encoding. Bytes patterns match
+        # \w and ignore case for ASCII only.
+        if encoding not in self.byte_patterns:
+            try:
+                source = self.pattern.pattern.encode("latin-1" if encoding == "latin-1" else "utf-8")
+                pattern = re.compile(source, self.pattern.flags & ~re.UNICODE)
+            except (UnicodeEncodeError, re.error):
+                pattern = None
+            self.byte_patterns[encoding] = pattern
+        return self.byte_patterns[encoding]
+        
+    def search_text(self, text):
+        found = []
+        search = self.pattern.search
+        line = 1
+        line_start = 0
+        pos = 0
+        while len(found) < self.MAX_MATCHES and not self.cancelled.is_set():
+            match = search(text, pos)
+            if match is None:
+                break
+            start, end = match.span()
+            if start == end:
+                pos = start + 1
+                continue
+            line += text.count("\n", line_start, start)
+            line_start = text.rfind("\n", 0, start) + 1
+            line_end = text.find("\n", start)
+            if line_end < 0:
+                line_end = len(text)
+            found.append((line, start - line_start, end - start,
+                          text[line_start:line_end].rstrip("\r")[:self.MAX_TEXT]))
+            line_start = pos = line_end + 1
+            line += 1
+        return found
+        
+    def search_bytes(self, data, pattern, encoding):
+        # Same as search_text over a mapped file; columns and lengths are
+        # in characters
+        found = []
+        line = 1
+        line_start = 0
+        pos = 0
+        while len(found) < self.MAX_MATCHES and not self.cancelled.is_set():
+            match = pattern.search(data, pos)
+            if match is None:
+                break
+            start, end = match.span()
+            if start == end:
+                pos = start + 1
+                continue
+            line += data[line_start:start].count(b"\n")
+            line_start = data.rfind(b"\n", 0, start) + 1
+            line_end = data.find(b"\n", start)
+            if line_end < 0:
+                line_end = len(data)
+            text = data[line_start:line_end].decode(encoding, "replace").rstrip("\r")
+            column = len(data[line_start:start].decode(encoding, "replace"))
+            length = len(data[start:end].decode(encoding, "replace"))
+            found.append((line, column, length, text[:self.MAX_TEXT]))
+            line_start = pos = line_end + 1
+            line += 1
+        return found
+
+
+def gitignore_patterns(root):
+    # The plain globs of root's .gitignore; negations are not supported
+    try:
+        with open(os.path.join(root, ".gitignore"), encoding="utf-8", errors="replace") as file:
+            lines = [line.strip() for line in file]
+    except OSError:
+        return []
+    return [line for line in lines if line and not line.startswith(("#", "!"))]
+
+
+def file_creation_mode():
+    # Permissions a newly created file gets under the current umask
+    umask = os.umask(0)
+    os.umask(umask)
+    return 0o666 & ~umask
+
+
+# Reading the umask means setting it for a moment, which would give files
+# other threads create meanwhile the wrong mode, so it is read once here
+NEW_FILE_MODE = file_creation_mode()
+
+
+class FileSaver:
+    # Writes a snapshot of a document on a worker thread: into a temporary
+    # file in the target's directory with large buffered writes, fsynced,
+    # then moved over the target with os.replace so a crash never leaves a
+    # half-written file. A symlink is saved through, to the file it points
+    # to. Text the file's encoding cannot represent is saved as UTF-8
+    # instead.
+    BUFFER = 1024 * 1024
+    
+    def __init__(self, path, chunks, encoding="utf-8", newline=None):
+        self.path = path
+        self.target = os.path.realpath(path)
+        self.chunks = chunks
+        self.encoding = encoding
+        self.newline = newline
+        self.total = sum(len(chunk) for chunk in chunks)
+        self.written = 0
+        self.error = None
+        self.mode = None if os.path.exists(self.target) else NEW_FILE_MODE
+        self.thread = threading.Thread(target=self.run, daemon=True)
+        
+    def start(self):
+        self.thread.start()
+        
+    def done(self):
+        return not self.thread.is_alive()
+        
+    def progress(self):
+        return self.written / self.total if self.total else 1.0
+        
+    def run(self):
+        try:
+            try:
+                self.write(self.encoding)
+            except UnicodeEncodeError:
+                self.written = 0
+                self.encoding = "utf-8"
+                self.write(self.encoding)
+        except Exception as e:
+            self.error = e
+            
+    def write(self, encoding):
+        fd, temp_path = tempfile.mkstemp(dir=os.path.dirname(self.target), prefix=".notepad-", suffix=".tmp")
+        try:
+            with open(fd, "w", encoding=encoding, newline=self.newline, buffering=self.BUFFER) as file:
+                if encoding in BOMS:
+                    file.write("\ufeff")
+                for chunk in self.chunks:
+                    file.write(chunk)
+                    self.written += len(chunk)
+                file.flush()
+                os.fsync(file.fileno())
+            if self.mode is None:
+                shutil.copymode(self.target, temp_path)
+            else:
+                os.chmod(temp_path, self.mode)
+            os.replace(temp_path, self.target)
+        except BaseException:
+            os.unlink(temp_path)
+            raise
+
+
+# Crash-recovery journals live here, one per running editor
+RECOVERY_DIR = os.path.join(os.path.expanduser("~"), ".notepad_plus", "recovery")
+
+
+class Journal:
+    # Crash-recovery log for one editor session. The Tk thread hands over
+    # batches of Document edits; a worker appends them as JSON lines after
+    # a header naming what they apply to: the file on disk (checked by size
+    # and mtime on recovery), a snapshot written by compaction, or an empty
+    # buffer. Past COMPACT_SIZE the journal is folded into a new snapshot.
+    COMPACT_SIZE = 4 * 1024 * 1024
+    
+    def __init__(self, directory=RECOVERY_DIR, session=None):
+        os.makedirs(directory, exist_ok=True)
+        self.directory = directory
+        self.session = session or str(os.getpid())
+        self.path = os.path.join(directory, f"session-{self.session}.journal")
+        self.generation = 0
+        self.size = 0
+        self.error = None
+        self.queue = queue.Queue()
+        self.thread = threading.Thread(target=self.run, daemon=True)
+        self.thread.start()
+        
+    # Called from the Tk thread; none of these touch the disk
+    
+    def reset(self, path=None, encoding="utf-8", newlines=None):
+        self.size = 0
+        self.queue.put(("reset", {"path": path, "encoding": encoding, "newlines": newlines}))
+        
+    def append(self, records):
+        self.queue.put(("append", records))
+        
+    def compact(self, chunks, path=None, encoding="utf-8", newlines=None):
+        self.size = 0
+        self.queue.put(("compact", chunks, {"path": path, "encoding": encoding, "newlines": newlines}))
+        
+    def needs_compaction(self):
+        return self.size > self.COMPACT_SIZE
+        
+    def close(self, discard=True):
+        self.queue.put(("close", discard))
+        self.thread.join()
+        
+    # Worker thread
+    
+    def run(self):
+        while True:
+            item = self.queue.get()
+            try:
+                if item[0] == "close":
+                    if item[1]:
+                        self.discard()
+                    return
+                elif item[0] == "reset":
+                    self.write_header(item[1])
+                elif item[0] == "append":
+                    self.write_records(item[1])
+                else:
+                    self.write_snapshot(item[1], item[2])
+            except OSError as e:
+                self.error = e
+                
+    def snapshot_path(self, generation):
+        return os.path.join(self.directory, f"session-{self.session}.{generation}.snapshot")
+        
+    def write_header(self, header, snapshot=None):
+        header = dict(header, time=time.time(), snapshot=snapshot)
+        if snapshot is None and header["path"] and os.path.exists(header["path"]):
+            stat = os.stat(header["path"])
+            header.update(size=stat.st_size, mtime=stat.st_mtime)
+        temp_path = self.path + ".tmp"
+        with open(temp_path, "w", encoding="utf-8") as file:
+            file.write(json.dumps(header) + "\n")
+        os.replace(temp_path, self.path)
+        self.size = 0
+        
+    def write_records(self, records):
+        lines = []
+        for op, offset, text in records:
+            if op == "insert":
+                lines.append(json.dumps(["i", offset, text]))
+            else:
+                lines.append(json.dumps(["d", offset, offset + len(text)]))
+        data = "\n".join(lines) + "\n"
+        with open(self.path, "a", encoding="utf-8") as file:
+            file.write(data)
+        self.size += len(data)
+        
+    def write_snapshot(self, chunks, header):
+        # New snapshot first, then the header pointing at it, then drop the
+        # old one, so a crash at any point leaves a consistent pair
+        old_path = self.snapshot_path(self.generation)
+        self.generation += 1
+        new_path = self.snapshot_path(self.generation)
+        with open(new_path, "w", encoding="utf-8", errors="surrogatepass", newline="") as file:
+            for chunk in chunks:
+                file.write(chunk)
+        self.write_header(header, os.path.basename(new_path))
+        if os.path.exists(old_path):
+            os.unlink(old_path)
+            
+    def discard(self):
+        for name in os.listdir(self.directory):
+            if name.startswith(f"session-{self.session}."):
+                os.unlink(os.path.join(self.directory, name))
+
+
+def process_alive(pid):
+    # Whether a process is running; when that cannot be told it is taken
+    # as alive, so the journals of a live editor are never recovered
+    if os.name == "nt":
+        return windows_process_alive(pid)
+    if os.name != "posix":
+        return True
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+def windows_process_alive(pid):
+    import ctypes
+    PROCESS_QUERY_LIMITED_INFORMATION = 0x1000
+    STILL_ACTIVE = 259
+    ERROR_INVALID_PARAMETER = 87
+    kernel32 = ctypes.WinDLL("kernel32", use_last_error=True)
+    handle = kernel32.OpenProcess(PROCESS_QUERY_LIMITED_INFORMATION, False, pid)
+    if not handle:
+        # No such process, else one we may not query (access denied)
+        return ctypes.get_last_error() != ERROR_INVALID_PARAMETER
+    try:
+        code = ctypes.c_ulong()
+        if not kernel32.GetExitCodeProcess(handle, ctypes.byref(code)):
+            return True
+        return code.value == STILL_ACTIVE
+    finally:
+        kernel32.CloseHandle(handle)
+
+
+def orphaned_journals(directory=RECOVERY_DIR):
+    # Journals left behind by editors that are no longer running, newest
+    # first; an editor keeps one per tab, named session-<pid>-<tab>
+    if not os.path.isdir(directory):
+        return []
+    journals = []
+    for name in os.listdir(directory):
+        match = re.fullmatch(r"session-(\d+)(?:-\d+)?\.journal", name)
+        if match and int(match.group(1)) != os.getpid() and not process_alive(int(match.group(1))):
+            journals.append(os.path.join(directory, name))
+    return sorted(journals, key=os.path.getmtime, reverse=True)
+
+
+def read_journal(journal_path):
+    # (header, records) of a journal; a record cut short by a crash is dropped
+    with open(journal_path, encoding="utf-8") as file:
+        header = json.loads(file.readline())
+        records = []
+        for line in file:
+            try:
+                records.append(json.loads(line))
+            except ValueError:
+                break
+    return header, records
+
+
+def recover_journal(journal_path):
+    # Rebuild the text a journal describes; raises ValueError if its base
+    # is gone or the file it was based on has changed since
+    header, records = read_journal(journal_path)
+    directory = os.path.dirname(journal_path)
+    if header.get("snapshot"):
+        with open(os.path.join(directory, header["snapshot"]), encoding="utf-8",
+                  errors="surrogatepass", newline="") as file:
+            text = file.read()
+    elif header.get("path"):
+        path = header["path"]
+        if not os.path.exists(path):
+            raise ValueError(f"{path} no longer exists")
+        stat = os.stat(path)
+        if (stat.st_size, stat.st_mtime) != (header.get("size"), header.get("mtime")):
+            raise ValueError(f"{path} has changed since the journal was written")
+        with open(path, encoding=header["encoding"], errors="replace") as file:
+            skip_bom(file, header["encoding"])
+            text = file.read()
+    else:
+        text = ""
+        
+    document = Document(text)
+    document.logging = False
+    for record in records:
+        if record[0] == "i":
+            document.insert(record[1], record[2])
+        else:
+            document.delete(record[1], record[2])
+    return header, document.text()
+
+
+def discard_journal(journal_path):
+    session = os.path.basename(journal_path)[:-len(".journal")]
+    directory = os.path.dirname(journal_path)
+    for name in os.listdir(directory):
+        if name.startswith(session + "."):
+            os.unlink(os.path.join(directory, name))
+
+
+# Files at least this big open in the read-only large file viewer
+LARGE_FILE_THRESHOLD = 64 * 1024 * 1024
+
+
+class LineIndex:
+    # Newline counts per fixed-size block of a memory-mapped file. That is
+    # enough to map a line number to a byte offset (and back) with one
+    # bisect plus a scan of at most one block, in memory proportional to
+    # size / BLOCK rather than to the number of lines.
+    BLOCK = 64 * 1024
+    SLICE = 64 * BLOCK
+    
+    def __init__(self, data):
+        self.data = data
+        self.size = len(data)
+        self.counts = array("q", [0])  # newlines before the start of each block
+        self.indexed = 0
+        self.done = False
+        
+    def build(self, cancelled):
+        # Runs on a worker thread; readers only see whole blocks
+        total = 0
+        pos = 0
+        while pos < self.size and not cancelled.is_set():
+            chunk = self.data[pos:pos + self.SLICE]
+            for start in range(0, len(chunk), self.BLOCK):
+                total += chunk.count(b"\n", start, start + self.BLOCK)
+                self.counts.append(total)
+            pos += len(chunk)
+            self.indexed = pos
+        self.done = pos >= self.size
+        
+    def progress(self):
+        return self.indexed / self.size if self.size else 1.0
+        
+    def line_count(self):
+        return self.counts[-1] + 1 if self.done else None
+        
+    def line_at(self, offset):
+        # 0-based number of the line containing offset, None if not indexed yet
+        if offset > self.indexed:
+            return None
+        block = offset // self.BLOCK
+        start = block * self.BLOCK
+        return self.counts[block] + self.data[start:offset].count(b"\n")
+        
+    def line_offset(self, line):
+        # Byte offset of the start of a 0-based line, None if not indexed yet
+        if line <= 0:
+            return 0
+        block = bisect.bisect_left(self.counts, line) - 1
+        if block + 1 >= len(self.counts) and not self.done:
+            return None
+        pos = block * self.BLOCK
+        for _ in range(line - self.counts[block]):
+            pos = self.data.find(b"\n", pos)
+            if pos < 0:
+                return None
+            pos += 1
+        return pos
\ No newline at end of file
@@ -1,33 +1,679 @@
+import time
+STARTED = time.perf_counter()  # when the imports began, for --profile-startup
 import tkinter as tk
-from tkinter import filedialog, messagebox, simpledialog, scrolledtext
+from tkinter import scrolledtext
+import tkinter.font as tkfont
+import importlib
 import re
+import json
+import os
+import sys
+import mmap
+import queue
+import bisect
+import threading
+from collections import deque
+from notepad_core import (Document, TAGS, LANGUAGES, LineStates, Tokenizer, Outline, FileLoader, FindEngine, replacer,
+                          plan_replacements, replace_edits, stream_replace, FileSaver, Journal, orphaned_journals,
+                          read_journal, recover_journal, discard_journal, LARGE_FILE_THRESHOLD,
+                          LineIndex, FileSearch, tk_column)
+
+
+class LazyModule:
+    # Stands in for a module that is imported the first time one of its
+    # names is used, which keeps the dialog modules off the startup path
+    def __init__(self, name):
+        self.name = name
+        
+    def __getattr__(self, attribute):
+        return getattr(importlib.import_module(self.name), attribute)
+
+
+filedialog = LazyModule("tkinter.filedialog")
+messagebox = LazyModule("tkinter.messagebox")
+simpledialog = LazyModule("tkinter.simpledialog")
+
+
+class SyntaxHighlighter(LineStates):
+    # Incremental highlighter for a Text widget. LineStates keeps the state
+    # every line starts in; the stale lines of the viewport plus a margin
+    # are lexed by a Tokenizer thread, and the tags it returns are applied
+    # here a few milliseconds at a time. Results for an older document
+    # version (or lexer) are dropped.
+    TAGS = TAGS
+    MARGIN = 50
+    BATCH_MS = 4
+    BATCH_LINES = 50
+    POLL_MS = 5
+    
+    def __init__(self, text, document):
+        super().__init__(document)
+        self.text = text
+        self.tokenizer = Tokenizer()
+        self.generation = 0  # bumped by reset, so older results are dropped
+        self.requested = None  # request() of the job in flight
+        self.waiting = False
+        self.result = None  # TokenRanges whose tags are being applied
+        self.next_line = 0
+        self.job = None
+        
+    def reset(self):
+        super().reset()
+        self.generation += 1
+        self.result = None
+        for tag in self.TAGS:
+            self.text.tag_remove(tag, "1.0", tk.END)
+            
+    def close(self):
+        if self.job is not None:
+            self.text.after_cancel(self.job)
+            self.job = None
+        self.tokenizer.close()
+        
+    def stamp(self):
+        return self.document.version, self.generation
+        
+    def visible_lines(self):
+        first = int(self.text.index("@0,0").split(".")[0])
+        last = int(self.text.index(f"@0,{self.text.winfo_height()}").split(".")[0])
+        return first, last
+        
+    def on_change(self, first, old_count, new_count):
+        self.update(first, old_count, new_count, self.visible_lines()[1] + self.MARGIN)
+        
+    def highlight_view(self):
+        # Ask the tokenizer for the stale lines in (or near) the viewport,
+        # starting from the last line whose state is known
+        if self.lexer is None:
+            return
+        first, last = self.visible_lines()
+        first = max(first - self.MARGIN, 1) - 1
+        last = min(last + self.MARGIN, len(self.tagged))
+        stale = self.tagged.find(0, first, last)
+        if stale < 0:
+            if self.valid >= last:
+                return
+            stale = last
+        start = min(self.valid - 1, stale)
+        request = (self.stamp(), start, max(start, first), last)
+        if request == self.requested:
+            return
+        self.requested = request
+        self.waiting = True
+        self.tokenizer.submit(self.document, self.lexer, *request[:2], self.states[start], *request[2:])
+        self.schedule(self.POLL_MS)
+        
+    def schedule(self, delay):
+        if self.job is None:
+            self.job = self.text.after(delay, self.step)
+            
+    def step(self):
+        # Take in finished results, then tag lines until the batch budget
+        # is spent; poll again while a job is still out
+        self.job = None
+        stamp = self.stamp()
+        while True:
+            try:
+                result = self.tokenizer.results.get_nowait()
+            except queue.Empty:
+                break
+            if result.request() == self.requested:
+                self.waiting = False
+            if result.stamp == stamp:
+                self.take(result)
+        if self.result is not None and self.result.stamp != stamp:
+            self.result = None
+        if self.result is not None:
+            self.apply_batch(time.perf_counter() + self.BATCH_MS / 1000)
+        if self.result is not None:
+            self.schedule(1)
+        elif self.waiting:
+            self.schedule(self.POLL_MS)
+            
+    def take(self, result):
+        # Adopt the line states a result computed; lines whose state
+        # changed need their tags again
+        states, tagged = self.states, self.tagged
+        count = len(tagged)
+        for index, state in enumerate(result.states, result.start + 1):
+            if states[index] != state:
+                states[index] = state
+                if index < count:
+                    tagged[index] = 0
+        self.valid = max(self.valid, result.stop + 1)
+        self.result = result
+        self.next_line = result.token_from
+        
+    def apply_batch(self, deadline):
+        # Re-tag runs of stale lines, one Tk call per tag and run
+        result = self.result
+        tagged = self.tagged
+        index = self.next_line
+        while time.perf_counter() < deadline:
+            index = tagged.find(0, index, result.stop)
+            if index < 0:
+                self.result = None
+                return
+            run_end = index + 1
+            limit = min(result.stop, index + self.BATCH_LINES)
+            while run_end < limit and not tagged[run_end]:
+                run_end += 1
+            self.highlight_lines(result, index, run_end)
+            index = run_end
+        self.next_line = index
+        
+    def highlight_lines(self, result, start, stop):
+        ranges = {tag: [] for tag in self.TAGS}
+        firsts, starts, ends, tags = result.firsts, result.starts, result.ends, result.tags
+        for line in range(start, stop):
+            i = line - result.token_from
+            for k in range(firsts[i], firsts[i + 1]):
+                ranges[TAGS[tags[k]]].extend((f"{line + 1}.{starts[k]}", f"{line + 1}.{ends[k]}"))
+                
+        for tag, indices in ranges.items():
+            self.text.tag_remove(tag, f"{start + 1}.0", f"{stop}.end")
+            if indices:
+                self.text.tag_add(tag, *indices)
+        self.tagged[start:stop] = b"\x01" * (stop - start)
+
+
+class EditScheduler:
+    # Coalesces edit notifications into at most one update per frame.
+    # Stages run in the order they were added (cheapest first). Deferred
+    # stages wait until Tk is idle and run while one frame's budget lasts;
+    # one with more work than that spreads it over later calls itself, as
+    # the highlighter does.
+    def __init__(self, root, frame_ms=16):
+        self.root = root
+        self.frame_ms = frame_ms
+        self.stages = {}
+        self.dirty = set()
+        self.frame_job = None
+        self.idle_job = None
+        self.last_frame = 0.0
+        self.frames = 0
+        self.dropped = 0
+        self.frame_times = deque(maxlen=120)
+        
+    def add_stage(self, name, callback, deferred=False):
+        self.stages[name] = (callback, deferred)
+        
+    def request(self, *names):
+        self.dirty.update(names)
+        if self.frame_job is None:
+            wait = self.last_frame + self.frame_ms / 1000 - time.perf_counter()
+            self.frame_job = self.root.after(max(0, int(wait * 1000)), self.run_frame)
+            
+    def run_frame(self):
+        self.frame_job = None
+        start = time.perf_counter()
+        for name, (callback, deferred) in self.stages.items():
+            if name in self.dirty and not deferred:
+                self.dirty.discard(name)
+                callback()
+        self.schedule_idle()
+        self.last_frame = time.perf_counter()
+        self.record(start)
+        
+    def schedule_idle(self):
+        if self.idle_job is None and self.pending_deferred():
+            self.idle_job = self.root.after_idle(self.run_idle)
+            
+    def pending_deferred(self):
+        return [name for name, (callback, deferred) in self.stages.items()
+                if deferred and name in self.dirty]
+                
+    def run_idle(self):
+        # Run deferred stages until one frame's budget is spent
+        self.idle_job = None
+        start = time.perf_counter()
+        deadline = start + self.frame_ms / 1000
+        while time.perf_counter() < deadline:
+            pending = self.pending_deferred()
+            if not pending:
+                break
+            self.dirty.discard(pending[0])
+            self.stages[pending[0]][0]()
+        self.record(start)
+        self.schedule_idle()
+        
+    def record(self, start):
+        elapsed = (time.perf_counter() - start) * 1000
+        self.frames += 1
+        self.frame_times.append(elapsed)
+        if elapsed > self.frame_ms:
+            self.dropped += int(elapsed // self.frame_ms)
+            
+    def stats(self):
+        times = self.frame_times
+        return {
+            "frames": self.frames,
+            "dropped": self.dropped,
+            "last_ms": times[-1] if times else 0.0,
+            "avg_ms": sum(times) / len(times) if times else 0.0,
+            "max_ms": max(times) if times else 0.0,
+        }
+
+
+class StartupProfile:
+    # Phases of startup for --profile-startup: each mark ends the phase
+    # begun by the one before (the first, by the start of the imports),
+    # and report() prints them to stderr
+    def __init__(self, started):
+        self.started = started
+        self.last = started
+        self.phases = []
+        
+    def mark(self, name):
+        now = time.perf_counter()
+        self.phases.append((name, now - self.last))
+        self.last = now
+        
+    def report(self):
+        for name, seconds in self.phases:
+            print(f"{name:<10}{seconds * 1000:9.1f} ms", file=sys.stderr)
+        print(f"{'total':<10}{(self.last - self.started) * 1000:9.1f} ms", file=sys.stderr)
+
+
+class Instrumentation:
+    # Opt-in latency recording (--profile or NOTEPAD_PROFILE=1). Handlers
+    # wrapped by timed() add (name, start, seconds, Tk calls, characters)
+    # to a ring buffer, where the Tk calls and characters are those the
+    # text widgets' proxies passed through meanwhile, or Notepad.text_call
+    # made past them (see counted() and count()). When it is off nothing
+    # is wrapped, so it costs nothing.
+    SIZE = 10000
+    
+    def __init__(self, size=SIZE):
+        self.events = deque(maxlen=size)
+        self.commands = {}  # Tk command -> [calls, characters]
+        self.calls = 0
+        self.chars = 0
+        self.profile = None
+        
+    def timed(self, name, function):
+        def wrapper(*args, **kwargs):
+            calls, chars = self.calls, self.chars
+            start = time.perf_counter()
+            try:
+                return function(*args, **kwargs)
+            finally:
+                self.events.append((name, start, time.perf_counter() - start,
+                                    self.calls - calls, self.chars - chars))
+        return wrapper
+        
+    def counted(self, proxy):
+        # Wrap a text widget's proxy to count each command and the
+        # characters it inserted or fetched
+        def wrapper(command, *args):
+            result = proxy(command, *args)
+            self.count(command, args, result)
+            return result
+        return wrapper
+        
+    def count(self, command, args, result):
+        # Count one text widget command, through the proxy or past it (see
+        # Notepad.text_call)
+        if command == "insert":
+            chars = sum(len(text) for text in args[1::2])
+        elif command == "replace":
+            chars = sum(len(text) for text in args[2::2])
+        elif command == "get":
+            chars = len(str(result))
+        else:
+            chars = 0
+        if command in ("tag", "mark", "edit") and args:
+            command = f"{command} {args[0]}"
+        entry = self.commands.get(command)
+        if entry is None:
+            entry = self.commands[command] = [0, 0]
+        entry[0] += 1
+        entry[1] += chars
+        self.calls += 1
+        self.chars += chars
+        
+    def summary(self):
+        # Per handler over the buffered events: (name, count, p50 ms,
+        # p99 ms, max ms, Tk calls per call, characters per call)
+        groups = {}
+        for name, start, seconds, calls, chars in self.events:
+            groups.setdefault(name, []).append((seconds, calls, chars))
+        rows = []
+        for name, samples in groups.items():
+            times = sorted(sample[0] for sample in samples)
+            count = len(times)
+            rows.append((name, count, times[count // 2] * 1000, times[min(count - 1, count * 99 // 100)] * 1000,
+                         times[-1] * 1000, sum(sample[1] for sample in samples) / count,
+                         sum(sample[2] for sample in samples) / count))
+        return sorted(rows, key=lambda row: -row[3])
+        
+    def reset(self):
+        self.events.clear()
+        self.commands.clear()
+        
+    def export(self, path, frames=None):
+        data = {
+            "events": [{"handler": name, "start": start, "seconds": seconds, "tk_calls": calls, "chars": chars}
+                       for name, start, seconds, calls, chars in self.events],
+            "handlers": [dict(zip(("handler", "count", "p50_ms", "p99_ms", "max_ms", "tk_calls", "chars"), row))
+                         for row in self.summary()],
+            "tk_commands": {command: {"calls": calls, "chars": chars}
+                            for command, (calls, chars) in self.commands.items()},
+            "frames": frames,
+        }
+        with open(path, "w", encoding="utf-8") as file:
+            json.dump(data, file, indent=1)
+            
+    def start_profile(self):
+        import cProfile
+        self.profile = cProfile.Profile()
+        self.profile.enable()
+        
+    def stop_profile(self, path=None):
+        # Stop cProfile and write its stats (readable with pstats) to path
+        self.profile.disable()
+        if path:
+            self.profile.dump_stats(path)
+        self.profile = None
+
+
+class LargeFileViewer:
+    # Read-only view of a memory-mapped file. Only a window of lines around
+    # the viewport is kept in the Text widget; it is paged as the view nears
+    # either edge, the scrollbar maps to byte offsets in the whole file, and
+    # line numbers come from a LineIndex built in the background. Windows
+    # start at a row: a line, or a PIECE of one too long to fit a window.
+    WINDOW_LINES = 2000
+    MAX_WINDOW_BYTES = 4 * 1024 * 1024
+    PIECE = 64 * 1024
+    
+    def __init__(self, text, path, encoding):
+        self.text = text
+        self.path = path
+        self.encoding = encoding
+        self.file = open(path, "rb")
+        self.data = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+        self.size = len(self.data)
+        self.index = LineIndex(self.data)
+        self.cancelled = threading.Event()
+        self.thread = threading.Thread(target=self.index.build, args=(self.cancelled,), daemon=True)
+        self.start = 0
+        self.shown = 0  # where the text shown starts, past a split character
+        self.end = 0
+        self.start_line = 0
+        self.recenter_job = None
+        
+    def open(self):
+        self.thread.start()
+        self.load_window(0)
+        
+    def close(self):
+        self.cancelled.set()
+        self.thread.join()
+        if self.recenter_job is not None:
+            self.text.after_cancel(self.recenter_job)
+        self.data.close()
+        self.file.close()
+        
+    def absolute_line(self, line):
+        # 1-based file line of a 1-based line in the widget
+        if self.start_line is None:
+            self.start_line = self.index.line_at(self.start)
+        return None if self.start_line is None else self.start_line + line
+        
+    def row_start(self, offset):
+        # Start of the row holding offset. A line is broken into rows at
+        # each multiple of PIECE found a whole PIECE past its start, so only
+        # the last two PIECEs need searching for it.
+        grid = offset // self.PIECE * self.PIECE
+        newline = self.data.rfind(b"\n", max(0, grid - self.PIECE), offset)
+        if newline >= 0 or grid == 0:
+            return newline + 1
+        return grid
+        
+    def rows_before(self, offset, count):
+        # Start of the row count rows above the one starting at offset, or
+        # of the first row within half a window's bytes of it
+        limit = offset - self.MAX_WINDOW_BYTES // 2
+        for _ in range(count):
+            if offset <= max(limit, 0):
+                break
+            offset = self.row_start(offset - 1)
+        return offset
+        
+    def char_end(self, offset):
+        # offset moved past the rest of a UTF-8 character a row break split
+        if self.encoding.startswith("utf-8"):
+            stop = min(offset + 3, self.size)
+            while offset < stop and self.data[offset] & 0xC0 == 0x80:
+                offset += 1
+        return offset
+        
+    def load_window(self, start, top=None):
+        # Fill the widget with up to WINDOW_LINES lines from the row at
+        # start and scroll so the character at top is first in view
+        data = self.data
+        limit = min(self.size, start + self.MAX_WINDOW_BYTES)
+        end = start
+        for _ in range(self.WINDOW_LINES):
+            newline = data.find(b"\n", end, limit)
+            if newline < 0:
+                end = limit
+                break
+            end = newline + 1
+        self.start, self.shown, self.end = start, self.char_end(start), self.char_end(end)
+        self.start_line = self.index.line_at(start)
+        
+        content = data[self.shown:self.end].decode(self.encoding, "replace").replace("\r\n", "\n")
+        if content.endswith("\n"):
+            content = content[:-1]
+        self.text.config(state=tk.NORMAL)
+        self.text.delete("1.0", tk.END)
+        self.text.insert("1.0", content)
+        self.text.config(state=tk.DISABLED)
+        self.text.edit_modified(False)
+        if top is not None:
+            top = max(top, self.shown)
+            top_line = data[start:top].count(b"\n") + 1
+            line_start = max(self.shown, data.rfind(b"\n", start, top) + 1)
+            before = data[line_start:top].decode(self.encoding, "replace")
+            self.text.yview(f"{top_line}.{tk_column(before, len(before))}")
+            
+    def on_scroll(self, first, last):
+        # Map the widget's view onto the whole file for the scrollbar, and
+        # page the window once the view gets near one of its edges
+        first, last = float(first), float(last)
+        span = self.end - self.start
+        self.text.vbar.set((self.start + first * span) / self.size,
+                           (self.start + last * span) / self.size)
+        if (first < 0.2 and self.start > 0) or (last > 0.8 and self.end < self.size):
+            if self.recenter_job is None:
+                self.recenter_job = self.text.after_idle(self.recenter)
+                
+    def recenter(self):
+        # Page around the character at the top of the view, which may be
+        # part way into a long wrapped line
+        self.recenter_job = None
+        index = self.text.index("@0,0")
+        top_line = int(index.split(".")[0])
+        top = self.shown
+        for _ in range(top_line - 1):
+            top = self.data.find(b"\n", top, self.end) + 1
+        top += len(self.text.get(f"{top_line}.0", index).encode(self.encoding, "replace"))
+        start = self.rows_before(self.row_start(top), self.WINDOW_LINES // 2)
+        if start != self.start:
+            self.load_window(start, top)
+        
+    def on_scrollbar(self, *args):
+        if args[0] == "moveto":
+            top = self.row_start(int(max(0.0, min(float(args[1]), 1.0)) * self.size))
+            self.load_window(self.rows_before(top, self.WINDOW_LINES // 2), top)
+        else:
+            self.text.yview(*args)
+            
+    def goto(self, line):
+        # Jump to a 1-based line; False while the index has not reached it
+        offset = self.index.line_offset(line - 1)
+        if offset is None:
+            return False
+        self.load_window(self.rows_before(offset, self.WINDOW_LINES // 2), offset)
+        window_line = self.data[self.start:offset].count(b"\n") + 1
+        self.text.mark_set(tk.INSERT, f"{window_line}.0")
+        return True
+
+
+# Open files and cursor positions of the last session
+SESSION_FILE = os.path.join(os.path.expanduser("~"), ".notepad_plus", "session.json")
+
+
+class Tab:
+    # One open document. While hydrated it owns a text widget with its edit
+    # proxy, highlighter and outline; once evicted only the Document is
+    # kept, along with the cursor, scroll position and modified flag to
+    # rebuild the widget from. A tab restored from the last session is not read until
+    # it is first activated (loaded is False until then).
+    
+    def __init__(self, number, path=None, language="plain"):
+        self.number = number
+        self.path = path
+        self.encoding = "utf-8"
+        self.newlines = None
+        self.replaced = False  # invalid bytes read as U+FFFD, not yet saved
+        self.language = language
+        self.document = Document()
+        self.loaded = path is None
+        self.modified = False
+        self.cursor = "1.0"
+        self.view = 0.0
+        self.text_area = None
+        self.text_command = None
+        self.highlighter = None
+        self.outline = None
+        self.viewer = None
+        self.journal = None
+        self.journal_job = None
+        self.button = None
+        
+    def name(self):
+        return os.path.basename(self.path) if self.path else "Untitled"
+        
+    def footprint(self):
+        # Rough bytes held by the widget and highlighter: Tk keeps the text
+        # in a B-tree of per-line records on top of the characters
+        return len(self.document) * 2 + self.document.line_count() * 120
+
+
+def tab_attribute(name):
+    # Notepad attribute that reads and writes the active tab's
+    return property(lambda self: getattr(self.tab, name),
+                    lambda self, value: setattr(self.tab, name, value))
+
 
 class Notepad:
-    def __init__(self, root):
+    PREVIEW_LIMIT = 200
+    JOURNAL_INTERVAL = 1000
+    # Estimated memory the widgets of inactive tabs may hold before the
+    # least recently used are evicted
+    MEMORY_BUDGET = 256 * 1024 * 1024
+    
+    # Handlers timed when instrumentation is on; those that wait on a
+    # dialog are timed from the part after it (open_path, start_save)
+    INSTRUMENTED = ("on_key_release", "highlight_syntax", "update_line_numbers", "update_statusbar",
+                    "on_text_change", "open_path", "load_file", "poll_loader", "start_save", "run_find",
+                    "tag_visible_matches", "replace_text", "replace_all", "activate_tab", "refresh_outline")
+    
+    # Per-document state lives on the active tab
+    text_area = tab_attribute("text_area")
+    text_command = tab_attribute("text_command")
+    document = tab_attribute("document")
+    highlighter = tab_attribute("highlighter")
+    outline = tab_attribute("outline")
+    viewer = tab_attribute("viewer")
+    journal = tab_attribute("journal")
+    current_file = tab_attribute("path")
+    file_encoding = tab_attribute("encoding")
+    file_newlines = tab_attribute("newlines")
+    current_language = tab_attribute("language")
+    
+    def __init__(self, root, instrument=False, paths=(), startup=None):
         self.root = root
         self.root.title("Notepad+")
         self.root.geometry("1000x700")
         
-        # Current file and settings
-        self.current_file = None
+        # Wrap the handlers before anything binds them
+        self.instrumentation = Instrumentation() if instrument else None
+        self.performance_panel = None
+        if self.instrumentation is not None:
+            for name in self.INSTRUMENTED:
+                setattr(self, name, self.instrumentation.timed(name, getattr(self, name)))
+                
+        # Open tabs and settings
+        self.tabs = []
+        self.hydrated = []  # tabs with a widget, least recently used first
+        self.tab = None
+        self.tab_count = 0
+        self.loader = None
+        self.load_job = None
+        self.viewer_job = None
+        self.saver = None
+        self.save_job = None
+        self.save_tab = None
+        self.save_version = None
         self.dark_mode = tk.BooleanVar(value=False)
         self.font_size = tk.IntVar(value=12)
         self.font_family = tk.StringVar(value="Consolas")
+        self.show_outline = tk.BooleanVar(value=False)
+        self.paths = list(paths)
+        self.startup = startup
         
-        # Setup UI components
-        self.setup_menu()
-        self.setup_toolbar()
+        # Edits and cursor moves are coalesced into frames from the first
+        # text area on
+        self.setup_scheduler()
+        
+        # Only what the first frame needs is built before Tk takes over: an
+        # editable text area, the status bar and the find state the
+        # scheduler's stages use. The rest follows an idle pass at a time.
         self.setup_text_area()
         self.setup_statusbar()
+        self.setup_find_bar()
+        self.root.bind('<Escape>', lambda e: self.cancel_load())
+        # Closing the window exits like File > Exit, saving the session and
+        # waiting for a save in progress
+        self.root.protocol("WM_DELETE_WINDOW", self.exit_app)
+        self.mark_startup("window")
+        self.root.after_idle(self.finish_startup)
         
-        # Apply initial theme
+    def finish_startup(self):
+        # Menus, toolbar, the outline panel and the theme, once the window
+        # is up
+        self.mark_startup("shown")
+        self.setup_menu()
+        self.setup_toolbar()
+        self.setup_outline()
         self.toggle_theme()
+        self.mark_startup("ui")
+        self.root.after_idle(self.open_startup_files)
         
-        # Bind events
-        self.text_area.bind('<KeyRelease>', self.on_key_release)
-        self.text_area.bind('<Button-1>', self.update_statusbar)
-        self.text_area.bind('<<Modified>>', self.on_text_modified)
+    def open_startup_files(self):
+        # Crash recovery, then the tabs of the last session, then the files
+        # given on the command line, which stream in like any other open;
+        # those take the place of the session's active tab
+        self.setup_journal()
+        self.restore_session(activate=not self.paths)
+        for path in self.paths:
+            self.open_path(os.path.abspath(path))
+        self.mark_startup("session", report=self.loader is None)
         
+    def mark_startup(self, phase, report=False):
+        # End a phase of --profile-startup; the report is printed once, when
+        # the first file is in (or at once if there is none to read)
+        if self.startup is None:
+            return
+        self.startup.mark(phase)
+        if report:
+            self.startup.report()
+            self.startup = None
+            
     def setup_menu(self):
         # Create menu bar
         self.menu_bar = tk.Menu(self.root)
@@ -40,6 +686,7 @@ class Notepad:
         self.file_menu.add_command(label="Open", command=self.open_file, accelerator="Ctrl+O")
         self.file_menu.add_command(label="Save", command=self.save_file, accelerator="Ctrl+S")
         self.file_menu.add_command(label="Save As", command=self.save_as_file, accelerator="Ctrl+Shift+S")
+        self.file_menu.add_command(label="Close Tab", command=self.close_tab, accelerator="Ctrl+W")
         self.file_menu.add_separator()
         self.file_menu.add_command(label="Exit", command=self.exit_app)
         
@@ -54,7 +701,12 @@ class Notepad:
         self.edit_menu.add_command(label="Paste", command=self.paste, accelerator="Ctrl+V")
         self.edit_menu.add_separator()
         self.edit_menu.add_command(label="Find", command=self.find_text, accelerator="Ctrl+F")
+        self.edit_menu.add_command(label="Find Next", command=self.find_next, accelerator="F3")
+        self.edit_menu.add_command(label="Find Previous", command=lambda: self.find_next(backwards=True),
+                                   accelerator="Shift+F3")
         self.edit_menu.add_command(label="Replace", command=self.replace_text, accelerator="Ctrl+H")
+        self.edit_menu.add_command(label="Find in Files", command=self.find_in_files, accelerator="Ctrl+Shift+F")
+        self.edit_menu.add_command(label="Go to Line", command=self.goto_line, accelerator="Ctrl+G")
         self.edit_menu.add_separator()
         self.edit_menu.add_command(label="Select All", command=self.select_all, accelerator="Ctrl+A")
         
@@ -62,6 +714,13 @@ class Notepad:
         self.view_menu = tk.Menu(self.menu_bar, tearoff=0)
         self.menu_bar.add_cascade(label="View", menu=self.view_menu)
         self.view_menu.add_checkbutton(label="Dark Mode", variable=self.dark_mode, command=self.toggle_theme)
+        self.view_menu.add_command(label="Frame Statistics", command=self.show_frame_stats)
+        self.view_menu.add_command(label="Performance", command=self.show_performance)
+        self.view_menu.add_checkbutton(label="Outline", variable=self.show_outline, command=self.toggle_outline,
+                                       accelerator="Ctrl+Shift+O")
+        self.view_menu.add_command(label="Fold/Unfold Block", command=self.toggle_fold_at_cursor,
+                                   accelerator="Ctrl+Shift+[")
+        self.view_menu.add_command(label="Unfold All", command=self.unfold_all)
         
         # Theme submenu
         self.theme_menu = tk.Menu(self.view_menu, tearoff=0)
@@ -76,28 +735,33 @@ class Notepad:
         for size in [8, 10, 12, 14, 16, 18, 20, 24]:
             self.font_menu.add_command(label=str(size), command=lambda s=size: self.change_font_size(s))
         
-        # Syntax highlighting submenu
-        self.syntax_menu = tk.Menu(self.view_menu, tearoff=0)
+        # Syntax highlighting submenu, listing the registry's languages the
+        # first time it opens
+        self.syntax_menu = tk.Menu(self.view_menu, tearoff=0, postcommand=self.fill_syntax_menu)
         self.view_menu.add_cascade(label="Syntax Highlighting", menu=self.syntax_menu)
         self.syntax_menu.add_command(label="Plain Text", command=lambda: self.set_syntax_highlighting("plain"))
-        self.syntax_menu.add_command(label="Python", command=lambda: self.set_syntax_highlighting("python"))
-        self.syntax_menu.add_command(label="JavaScript", command=lambda: self.set_syntax_highlighting("javascript"))
-        self.syntax_menu.add_command(label="HTML", command=lambda: self.set_syntax_highlighting("html"))
-        self.syntax_menu.add_command(label="CSS", command=lambda: self.set_syntax_highlighting("css"))
         
         # Keyboard shortcuts
         self.root.bind('<Control-n>', lambda e: self.new_file())
         self.root.bind('<Control-o>', lambda e: self.open_file())
         self.root.bind('<Control-s>', lambda e: self.save_file())
         self.root.bind('<Control-Shift-S>', lambda e: self.save_as_file())
+        self.root.bind('<Control-w>', lambda e: self.close_tab())
+        self.root.bind('<Control-Tab>', lambda e: self.next_tab())
         self.root.bind('<Control-f>', lambda e: self.find_text())
+        self.root.bind('<F3>', lambda e: self.find_next())
+        self.root.bind('<Shift-F3>', lambda e: self.find_next(backwards=True))
         self.root.bind('<Control-h>', lambda e: self.replace_text())
+        self.root.bind('<Control-Shift-F>', lambda e: self.find_in_files())
+        self.root.bind('<Control-g>', lambda e: self.goto_line())
         self.root.bind('<Control-a>', lambda e: self.select_all())
+        self.root.bind('<Control-Shift-O>', lambda e: self.view_menu.invoke("Outline"))
+        self.root.bind('<Control-braceleft>', lambda e: self.toggle_fold_at_cursor())
         
     def setup_toolbar(self):
-        # Create toolbar frame
+        # Create toolbar frame, above the tab bar built before it
         self.toolbar = tk.Frame(self.root, bd=1, relief=tk.RAISED)
-        self.toolbar.pack(side=tk.TOP, fill=tk.X)
+        self.toolbar.pack(side=tk.TOP, fill=tk.X, before=self.tab_bar)
         
         # Toolbar buttons
         new_icon = tk.PhotoImage(width=1, height=1)  # Placeholder for actual icons
@@ -132,153 +796,831 @@ class Notepad:
         font_spinbox.pack(side=tk.LEFT, padx=5)
         
     def setup_text_area(self):
+        # Tab bar, one button per open document
+        self.tab_bar = tk.Frame(self.root)
+        self.tab_bar.pack(side=tk.TOP, fill=tk.X)
+        
         # Create main frame for text area and line numbers
-        text_frame = tk.Frame(self.root)
-        text_frame.pack(fill=tk.BOTH, expand=True)
+        self.text_frame = tk.Frame(self.root)
+        self.text_frame.pack(fill=tk.BOTH, expand=True)
         
-        # Line numbers
-        self.line_numbers = tk.Text(text_frame, width=4, padx=5, pady=5, takefocus=0, 
-                                   border=0, background='lightgray', state='disabled')
+        # Line numbers, drawn on a canvas for the visible lines only, with
+        # a fold marker beside each line that opens a block; clicking the
+        # marker folds or unfolds it
+        self.line_numbers = tk.Canvas(self.text_frame, width=40, takefocus=0,
+                                      highlightthickness=0, background='lightgray')
         self.line_numbers.pack(side=tk.LEFT, fill=tk.Y)
+        self.line_numbers.bind('<Button-1>', self.on_gutter_click)
+        self.gutter_fg = "black"
+        self.gutter_digits = 0
+        self.gutter_drawn = None
         
-        # Text area with scrollbar
-        self.text_area = scrolledtext.ScrolledText(text_frame, wrap=tk.WORD, undo=True, 
-                                                  font=(self.font_family.get(), self.font_size.get()))
+        # Each tab gets its own text area when it is hydrated; start with
+        # an empty one
+        self.text_colors = {}
+        self.syntax_colors = {"keyword": "blue", "comment": "green", "string": "red",
+                              "number": "purple", "function": "darkorange"}
+        self.tab = self.add_tab()
+        self.hydrate_tab(self.tab)
         self.text_area.pack(side=tk.RIGHT, fill=tk.BOTH, expand=True)
+        self.update_tab_label(self.tab)
+        self.update_gutter_width()
+        
+    def add_tab(self, path=None, language="plain"):
+        # New tab at the end of the bar, neither hydrated nor active yet
+        self.tab_count += 1
+        tab = Tab(self.tab_count, path, language)
+        tab.button = tk.Button(self.tab_bar, relief=tk.RAISED, padx=8,
+                               command=lambda: self.activate_tab(tab))
+        tab.button.bind('<Button-2>', lambda e: self.close_tab(tab))
+        tab.button.pack(side=tk.LEFT)
+        self.tabs.append(tab)
+        self.update_tab_label(tab)
+        return tab
         
-        # Add scrollbar to line numbers
-        line_scrollbar = tk.Scrollbar(text_frame, orient=tk.VERTICAL, command=self.sync_scroll)
-        line_scrollbar.pack(side=tk.LEFT, fill=tk.Y)
-        self.line_numbers.config(yscrollcommand=line_scrollbar.set)
+    def hydrate_tab(self, tab):
+        # Give a tab a text area again, filled from its Document; the undo
+        # history does not survive an eviction
+        text_area = scrolledtext.ScrolledText(self.text_frame, wrap=tk.WORD, undo=True,
+                                              font=(self.font_family.get(), self.font_size.get()),
+                                              **self.text_colors)
+        text_area.config(yscrollcommand=lambda first, last: self.on_text_scroll(tab, first, last))
+        tab.text_area = text_area
+        self.setup_edit_hook(tab)
+        self.setup_syntax_highlighting(tab)
+        text_area.tag_config("found", background="yellow", foreground="black")
+        text_area.tag_config("folded", elide=True)
+        text_area.bind('<KeyRelease>', self.on_key_release)
+        text_area.bind('<<Modified>>', lambda e: self.on_text_modified(tab))
         
-        # Configure tags for syntax highlighting
-        self.setup_syntax_highlighting()
+        if tab.loaded:
+            # The Document already has the text: fill the widget behind the proxy
+            self.text_call(tab, "insert", "1.0", tab.document.text())
+            text_area.edit_reset()
+            tab.highlighter.set_lexer(LANGUAGES.lexer(tab.language))
+            tab.outline.set_patterns(LANGUAGES.outline(tab.language))
+            text_area.mark_set(tk.INSERT, tab.cursor)
+            text_area.yview_moveto(tab.view)
+        text_area.edit_modified(tab.modified)
+        if tab.journal is None:
+            self.open_journal(tab)
+        self.hydrated.append(tab)
+        
+    def dehydrate_tab(self, tab):
+        # Destroy an inactive tab's text area, keeping what is needed to
+        # rebuild it; its text stays in the Document
+        text_area = tab.text_area
+        if tab.viewer is not None:
+            # Large files are mapped again by a new viewer
+            tab.viewer.close()
+            tab.viewer = None
+            tab.document = Document()
+            tab.loaded = False
+        else:
+            tab.modified = bool(text_area.edit_modified())
+            tab.cursor = text_area.index(tk.INSERT)
+            tab.view = text_area.yview()[0]
+        tab.highlighter.close()
+        text_area.frame.destroy()
+        text_area.tk.deletecommand(text_area._w)
+        tab.text_area = tab.text_command = tab.highlighter = tab.outline = None
+        self.hydrated.remove(tab)
+        
+    def activate_tab(self, tab):
+        if tab is self.tab:
+            return
+        if self.loader is not None:
+            # Switching away stops a load; the file is read again on return
+            self.stop_load()
+        if self.viewer_job is not None:
+            self.root.after_cancel(self.viewer_job)
+            self.viewer_job = None
+            
+        previous = self.tab
+        if previous.text_area is not None:
+            previous.text_area.pack_forget()
+        self.tab = tab
+        if tab.text_area is None:
+            self.hydrate_tab(tab)
+        else:
+            self.hydrated.remove(tab)
+            self.hydrated.append(tab)
+        self.text_area.pack(side=tk.RIGHT, fill=tk.BOTH, expand=True)
+        self.text_area.focus_set()
+        
+        if previous in self.tabs:
+            self.update_tab_label(previous)
+        self.update_tab_label(tab)
+        self.update_title()
+        self.find_engine = FindEngine(tab.document)
+        self.find_origin = self.text_offset(tk.INSERT)
+        self.update_gutter_width()
+        self.scheduler.request("cursor", "gutter", "highlight", "find", "outline")
+        if not tab.loaded:
+            self.load_file(tab.path)
+        elif tab.viewer is not None:
+            self.poll_viewer_index()
+        self.enforce_memory_budget()
+        
+    def enforce_memory_budget(self):
+        # Evict the least recently used inactive tabs until the widgets left
+        # fit in MEMORY_BUDGET
+        total = sum(tab.footprint() for tab in self.hydrated)
+        for tab in list(self.hydrated):
+            if total <= self.MEMORY_BUDGET:
+                break
+            if tab is not self.tab:
+                total -= tab.footprint()
+                self.dehydrate_tab(tab)
+                
+    def next_tab(self):
+        self.activate_tab(self.tabs[(self.tabs.index(self.tab) + 1) % len(self.tabs)])
+        
+    def close_tab(self, tab=None):
+        tab = tab or self.tab
+        if self.is_modified(tab):
+            self.activate_tab(tab)
+            answer = messagebox.askyesnocancel("Notepad+", f"Save changes to {tab.name()}?")
+            if answer is None:
+                return
+            if answer:
+                self.save_file(wait=True)
+                if self.is_modified(tab):
+                    return
+                    
+        if self.saver is not None and self.save_tab is tab:
+            self.saver.thread.join()
+            self.finish_save()
+        if tab is self.tab:
+            if self.loader is not None:
+                self.stop_load()
+            if self.viewer_job is not None:
+                self.root.after_cancel(self.viewer_job)
+                self.viewer_job = None
+        if tab.text_area is not None:
+            self.dehydrate_tab(tab)
+        if tab.journal_job is not None:
+            self.root.after_cancel(tab.journal_job)
+        if tab.journal is not None:
+            tab.journal.close()
+        tab.button.destroy()
+        index = self.tabs.index(tab)
+        self.tabs.remove(tab)
+        
+        if tab is self.tab:
+            if not self.tabs:
+                self.add_tab()
+            self.activate_tab(self.tabs[min(index, len(self.tabs) - 1)])
+            
+    def find_tab(self, path):
+        path = os.path.abspath(path)
+        for tab in self.tabs:
+            if tab.path and os.path.abspath(tab.path) == path:
+                return tab
+        return None
+        
+    def is_modified(self, tab):
+        if tab.text_area is not None:
+            return bool(tab.text_area.edit_modified())
+        return tab.modified
+        
+    def is_pristine(self, tab):
+        # An empty untitled tab nobody has typed in, reused by open_path
+        return tab.path is None and tab.loaded and not len(tab.document) and not self.is_modified(tab)
+        
+    def update_tab_label(self, tab):
+        tab.button.config(text=("*" if self.is_modified(tab) else "") + tab.name(),
+                          relief=tk.SUNKEN if tab is self.tab else tk.RAISED)
+                          
+    def update_title(self):
+        if self.current_file is None:
+            self.root.title("Notepad+")
+        elif self.viewer is not None:
+            self.root.title(f"Notepad+ - {self.current_file} (read-only)")
+        else:
+            self.root.title(f"Notepad+ - {self.current_file}")
+            
+    def save_session(self):
+        # Remember the open files with their cursor and scroll positions,
+        # and which one is active, for restore_session. The snapshot is
+        # kept compact, one [path, language, cursor, view] list per tab, as
+        # it is read on every start.
+        entries = []
+        active = 0
+        for tab in self.tabs:
+            if tab.path is None:
+                continue
+            if tab is self.tab:
+                active = len(entries)
+            if tab.text_area is not None and tab.viewer is None and tab.loaded:
+                tab.cursor = tab.text_area.index(tk.INSERT)
+                tab.view = tab.text_area.yview()[0]
+            entries.append([tab.path, tab.language, tab.cursor, tab.view])
+        temp_path = SESSION_FILE + ".tmp"
+        try:
+            os.makedirs(os.path.dirname(SESSION_FILE), exist_ok=True)
+            with open(temp_path, "w", encoding="utf-8") as file:
+                json.dump({"tabs": entries, "active": active}, file, separators=(",", ":"))
+            os.replace(temp_path, SESSION_FILE)
+        except OSError:
+            pass
+            
+    def restore_session(self, activate=True):
+        # Reopen the files of the last session as tabs; only the active one
+        # is read now, the others when they are first activated. Without
+        # activate none is read and the current tab stays.
+        try:
+            with open(SESSION_FILE, encoding="utf-8") as file:
+                session = json.load(file)
+        except (OSError, ValueError):
+            return
+        initial = self.tab
+        restored = []
+        for entry in session.get("tabs", []):
+            if isinstance(entry, dict):
+                # Written before the compact snapshot
+                entry = [entry.get("path"), entry.get("language"), entry.get("cursor"), entry.get("view")]
+            if not isinstance(entry, list) or len(entry) != 4:
+                continue
+            path, language, cursor, view = entry
+            if not isinstance(path, str) or not os.path.isfile(path) or self.find_tab(path):
+                continue
+            tab = self.add_tab(path, language if isinstance(language, str) else "plain")
+            if re.fullmatch(r"\d+\.\d+", str(cursor)):
+                tab.cursor = cursor
+            if isinstance(view, (int, float)):
+                tab.view = view
+            restored.append(tab)
+        if not restored or not activate:
+            return
+        active = session.get("active", 0)
+        self.activate_tab(restored[active if isinstance(active, int) and 0 <= active < len(restored) else 0])
+        self.close_tab(initial)
         
     def setup_statusbar(self):
         self.status_bar = tk.Label(self.root, text="Ln 1, Col 1", relief=tk.SUNKEN, anchor=tk.W)
         self.status_bar.pack(side=tk.BOTTOM, fill=tk.X)
         
-    def setup_syntax_highlighting(self):
+    def setup_syntax_highlighting(self, tab):
         # Configure text tags for different syntax elements
-        self.text_area.tag_configure("keyword", foreground="blue")
-        self.text_area.tag_configure("comment", foreground="green")
-        self.text_area.tag_configure("string", foreground="red")
-        self.text_area.tag_configure("number", foreground="purple")
-        self.text_area.tag_configure("function", foreground="darkorange")
-        
-        self.current_language = "plain"
+        for tag, color in self.syntax_colors.items():
+            tab.text_area.tag_configure(tag, foreground=color)
+            
+        tab.highlighter = SyntaxHighlighter(tab.text_area, tab.document)
+        tab.outline = Outline(tab.document)
+        tab.text_area.bind('<Configure>', lambda e: self.scheduler.request("gutter", "highlight"))
+        if self.instrumentation is not None:
+            # Time what highlighting does on the Tk thread: settling line
+            # states after an edit and each batch of tags
+            highlighter = tab.highlighter
+            highlighter.relex = self.instrumentation.timed("relex", highlighter.relex)
+            highlighter.step = self.instrumentation.timed("highlight_step", highlighter.step)
         
+    def fill_syntax_menu(self):
+        if self.syntax_menu.index(tk.END) > 0:
+            return
+        for language, title in LANGUAGES.titles():
+            self.syntax_menu.add_command(label=title, command=lambda l=language: self.set_syntax_highlighting(l))
+            
     def set_syntax_highlighting(self, language):
         self.current_language = language
+        self.highlighter.set_lexer(LANGUAGES.lexer(language))
+        self.outline.set_patterns(LANGUAGES.outline(language))
         self.highlight_syntax()
+        self.scheduler.request("outline")
         
     def highlight_syntax(self):
-        if self.current_language == "plain":
-            return
-            
-        # Remove previous highlighting
-        for tag in ["keyword", "comment", "string", "number", "function"]:
-            self.text_area.tag_remove(tag, "1.0", tk.END)
-            
-        # Get the entire text content
-        content = self.text_area.get("1.0", tk.END)
-        
-        if self.current_language == "python":
-            # Python syntax patterns
-            keywords = ["and", "as", "assert", "break", "class", "continue", "def", "del", 
-                       "elif", "else", "except", "False", "finally", "for", "from", "global", 
-                       "if", "import", "in", "is", "lambda", "None", "nonlocal", "not", "or", 
-                       "pass", "raise", "return", "True", "try", "while", "with", "yield"]
-            
-            self.highlight_patterns(keywords, "keyword")
-            self.highlight_pattern(r'#.*', "comment")
-            self.highlight_pattern(r'(\"\"\"[\s\S]*?\"\"\"|\'\'\'[\s\S]*?\'\'\'|\".*?\"|\'.*?\')', "string")
-            self.highlight_pattern(r'\b\d+\b', "number")
-            self.highlight_pattern(r'\bdef\s+(\w+)', "function", group=1)
-            
-        elif self.current_language == "javascript":
-            # JavaScript syntax patterns
-            keywords = ["break", "case", "catch", "class", "const", "continue", "debugger", 
-                       "default", "delete", "do", "else", "export", "extends", "finally", 
-                       "for", "function", "if", "import", "in", "instanceof", "new", "return", 
-                       "super", "switch", "this", "throw", "try", "typeof", "var", "void", 
-                       "while", "with", "yield"]
-            
-            self.highlight_patterns(keywords, "keyword")
-            self.highlight_pattern(r'//.*', "comment")
-            self.highlight_pattern(r'/\*[\s\S]*?\*/', "comment")
-            self.highlight_pattern(r'(\".*?\"|\'.*?\')', "string")
-            self.highlight_pattern(r'\b\d+\b', "number")
-            self.highlight_pattern(r'\bfunction\s+(\w+)', "function", group=1)
-            
-        elif self.current_language == "html":
-            # HTML syntax patterns
-            self.highlight_pattern(r'&lt;/?[^&gt;]+&gt;', "keyword")
-            self.highlight_pattern(r'&lt;!--[\s\S]*?--&gt;', "comment")
-            self.highlight_pattern(r'(\".*?\"|\'.*?\')', "string")
-            
-        elif self.current_language == "css":
-            # CSS syntax patterns
-            self.highlight_pattern(r'\.\w+', "keyword")
-            self.highlight_pattern(r'#\w+', "keyword")
-            self.highlight_pattern(r'/\*[\s\S]*?\*/', "comment")
-            self.highlight_pattern(r'(\".*?\"|\'.*?\')', "string")
-            self.highlight_pattern(r'\b\d+\b', "number")
-            
-    def highlight_patterns(self, patterns, tag):
-        for pattern in patterns:
-            self.highlight_pattern(r'\b' + pattern + r'\b', tag)
-            
-    def highlight_pattern(self, pattern, tag, group=0):
-        content = self.text_area.get("1.0", tk.END)
-        for match in re.finditer(pattern, content):
-            start = f"1.0 + {match.start()} chars"
-            end = f"1.0 + {match.end()} chars"
-            self.text_area.tag_add(tag, start, end)
-            
-    def sync_scroll(self, *args):
-        # Sync line numbers scroll with text area
-        self.line_numbers.yview_moveto(args[0])
-        self.text_area.yview_moveto(args[0])
+        # Have the stale lines in (or near) the viewport tagged
+        self.highlighter.highlight_view()
+        
+    def setup_scheduler(self):
+        # Edits and cursor moves are handled once per frame: the status bar
+        # first, then the gutter and highlighting once Tk is idle
+        self.scheduler = EditScheduler(self.root)
+        self.scheduler.add_stage("cursor", self.update_statusbar)
+        self.scheduler.add_stage("gutter", self.update_line_numbers)
+        self.scheduler.add_stage("highlight", lambda: self.highlighter.highlight_view(), deferred=True)
+        self.scheduler.add_stage("matches", self.tag_visible_matches)
+        self.scheduler.add_stage("find", self.run_find, deferred=True)
+        self.scheduler.add_stage("outline", self.refresh_outline, deferred=True)
+        
+    def on_text_scroll(self, tab, first, last):
+        if tab.viewer is not None:
+            tab.viewer.on_scroll(first, last)
+        else:
+            tab.text_area.vbar.set(first, last)
+        if tab is self.tab:
+            self.scheduler.request("gutter", "highlight", "matches")
+            
+    def setup_edit_hook(self, tab):
+        # Route the widget's Tcl command through a proxy so every insert,
+        # delete and replace (typing, paste, undo) is mirrored into the
+        # tab's document and reported as the range of lines it replaced
+        widget = tab.text_area
+        tab.text_command = widget._w + "_orig"
+        widget.tk.call("rename", widget._w, tab.text_command)
+        proxy = lambda *args: self.text_proxy(tab, *args)
+        if self.instrumentation is not None:
+            proxy = self.instrumentation.counted(proxy)
+        widget.tk.createcommand(widget._w, proxy)
+        
+    def text_proxy(self, tab, command, *args):
+        call = tab.text_area.tk.call
+        if command not in ("insert", "delete", "replace"):
+            if (command == "mark" and args[:2] == ("set", "insert")
+                    or command == "tag" and args[1:2] == ("sel",) and args[0] in ("add", "remove")):
+                # The cursor moved or the selection changed, by key, mouse
+                # or code alike
+                if tab is self.tab:
+                    self.scheduler.request("cursor", "outline")
+            return call(tab.text_command, command, *args)
+        if str(self.text_call(tab, "cget", "-state")) == tk.DISABLED:
+            return call(tab.text_command, command, *args)
+            
+        # Resolve the indices before the edit moves them
+        if command == "insert":
+            offset = self.text_offset(args[0], tab)
+            deletes = []
+            inserts = [(offset, "".join(args[1::2]))]
+        elif command == "delete":
+            indices = args if len(args) > 1 else (args[0], f"{args[0]}+1c")
+            deletes = [self.delete_range(i, j, tab) for i, j in zip(indices[::2], indices[1::2])]
+            inserts = []
+        else:
+            deletes = [self.delete_range(args[0], args[1], tab)]
+            inserts = [(self.text_offset(args[0], tab), "".join(args[2::2]))]
+            
+        result = call(tab.text_command, command, *args)
+        
+        document = tab.document
+        count = document.line_count()
+        start = min([r[0] for r in deletes] + [i[0] for i in inserts])
+        end = max([r[1] for r in deletes] + [start])
+        first = document.line_col(start)[0] + 1
+        last = document.line_col(end)[0] + 1
+        for delete_start, delete_end in sorted(deletes, reverse=True):
+            document.delete(delete_start, delete_end)
+        for offset, text in inserts:
+            document.insert(offset, text)
+            
+        old_count = last - first + 1
+        self.on_text_change(tab, first, old_count, old_count + document.line_count() - count)
+        return result
+        
+    def text_call(self, tab, command, *args):
+        # Call the widget's own command, bypassing the proxy; counted as
+        # calls through it are when instrumentation is on
+        result = tab.text_area.tk.call(tab.text_command, command, *args)
+        if self.instrumentation is not None:
+            self.instrumentation.count(command, args, result)
+        return result
+        
+    def text_offset(self, index, tab=None):
+        # Document offset of a Tk index, bypassing the proxy
+        tab = tab or self.tab
+        line, col = str(self.text_call(tab, "index", index)).split(".")
+        return tab.document.tk_offset(int(line) - 1, int(col))
+        
+    def delete_range(self, index1, index2, tab):
+        # Offsets Tk will really delete between two indices (see
+        # Document.delete_span). An empty range stays where it starts, so it
+        # does not widen the edit reported.
+        start = str(self.text_call(tab, "index", index1))
+        end = str(self.text_call(tab, "index", index2))
+        offset = self.text_offset(start, tab)
+        if self.text_call(tab, "compare", start, ">=", end):
+            return offset, offset
+        if int(end.split(".")[0]) > tab.document.line_count():
+            return tab.document.delete_span(offset, len(tab.document) + 1)  # into the final newline
+        return offset, self.text_offset(end, tab)
+        
+    def on_text_change(self, tab, first, old_count, new_count):
+        tab.highlighter.on_change(first, old_count, new_count)
+        tab.outline.update(first, old_count, new_count)
+        self.schedule_journal(tab)
+        if tab is self.tab:
+            if len(str(self.gutter_line_count())) != self.gutter_digits:
+                self.update_gutter_width()
+            self.scheduler.request("cursor", "gutter", "highlight", "outline")
         
     def update_line_numbers(self):
-        # Update line numbers based on text content
-        lines = self.text_area.get("1.0", "end-1c").split("\n")
-        line_count = len(lines)
+        # Draw the numbers of the lines currently in the text area's
+        # viewport. Folded lines have no display line: the line before a
+        # fold gets a closed marker and the numbers carry on after it.
+        text = self.text_area
+        count = self.document.line_count()
+        rows = []  # [line, y, folded]
+        runs = []  # (first, last) of each run of lines between folds
+        line = int(text.index("@0,0").split(".")[0])
+        info = text.dlineinfo("@0,0")
+        while line <= count:
+            if info is not None:
+                if not runs or runs[-1][1] != line - 1:
+                    runs.append((line, line))
+                runs[-1] = (runs[-1][0], line)
+                rows.append([line, info[1], False])
+            elif rows and "folded" in text.tag_names(f"{line}.0"):
+                rows[-1][2] = True
+                fold = text.tag_prevrange("folded", f"{line}.0 +1c")
+                line = int(str(fold[1]).split(".")[0])
+                info = text.dlineinfo(f"{line}.0")
+                continue
+            else:
+                break
+            line += 1
+            info = text.dlineinfo(f"{line}.0")
+            
+        # Markers come from the outline's view of the indentation
+        starts = set()
+        if self.viewer is None:
+            for first, last in runs:
+                starts |= self.outline.fold_starts(first - 1, last)
+        positions = [(self.display_line(line), y, "\u25b8" if folded else "\u25be" if line - 1 in starts else None)
+                     for line, y, folded in rows]
+                     
+        # Scrolling within a wrapped line or typing on it often leaves the
+        # visible numbers where they were
+        if positions == self.gutter_drawn:
+            return
+        self.gutter_drawn = positions
         
-        # Configure line numbers widget
-        self.line_numbers.config(state=tk.NORMAL)
-        self.line_numbers.delete("1.0", tk.END)
+        canvas = self.line_numbers
+        canvas.delete("all")
+        x = int(canvas["width"]) - 5
+        font = text["font"]
+        for line, y, marker in positions:
+            if line is not None:
+                canvas.create_text(x, y, anchor=tk.NE, text=str(line), fill=self.gutter_fg, font=font)
+            if marker is not None:
+                canvas.create_text(2, y, anchor=tk.NW, text=marker, fill=self.gutter_fg, font=font)
+                
+    def on_gutter_click(self, event):
+        if self.viewer is None:
+            self.toggle_fold(int(self.text_area.index(f"@0,{event.y}").split(".")[0]))
+            
+    def toggle_fold(self, line):
+        # Fold the block a 1-based line opens by eliding the lines under
+        # it, or unfold it if it is folded
+        text = self.text_area
+        below = f"{line + 1}.0"
+        if "folded" in text.tag_names(below):
+            text.tag_remove("folded", *text.tag_prevrange("folded", f"{below} +1c"))
+        else:
+            end = self.outline.fold_end(line - 1)
+            if end is None:
+                return
+            text.tag_add("folded", below, f"{end + 2}.0")
+            # Keep the cursor out of the hidden lines
+            if text.compare(tk.INSERT, ">=", below) and text.compare(tk.INSERT, "<", f"{end + 2}.0"):
+                text.mark_set(tk.INSERT, f"{line}.end")
+        self.scheduler.request("gutter", "highlight")
         
-        for i in range(1, line_count + 1):
-            self.line_numbers.insert(tk.END, f"{i}\n")
+    def toggle_fold_at_cursor(self):
+        if self.viewer is None:
+            self.toggle_fold(int(self.text_area.index(tk.INSERT).split(".")[0]))
             
-        self.line_numbers.config(state=tk.DISABLED)
+    def unfold_all(self):
+        self.text_area.tag_remove("folded", "1.0", tk.END)
+        self.scheduler.request("gutter", "highlight")
         
-    def update_statusbar(self, event=None):
-        # Update status bar with line and column info
-        if not event:
+    def unfold_line(self, line):
+        # Open the fold hiding a 1-based line, if any
+        text = self.text_area
+        if "folded" in text.tag_names(f"{line}.0"):
+            text.tag_remove("folded", *text.tag_prevrange("folded", f"{line}.0 +1c"))
+            self.scheduler.request("gutter", "highlight")
+            
+    def setup_outline(self):
+        # The active tab's symbols beside the text area, filtered by the
+        # entry above them; the symbol the cursor is in stays selected
+        self.outline_frame = tk.Frame(self.text_frame)
+        self.outline_filter = tk.StringVar()
+        self.outline_filter.trace_add("write", lambda *args: self.scheduler.request("outline"))
+        outline_entry = tk.Entry(self.outline_frame, textvariable=self.outline_filter)
+        outline_entry.pack(side=tk.TOP, fill=tk.X)
+        outline_entry.bind('<Return>', lambda e: self.jump_to_symbol(0))
+        scrollbar = tk.Scrollbar(self.outline_frame)
+        scrollbar.pack(side=tk.RIGHT, fill=tk.Y)
+        self.outline_list = tk.Listbox(self.outline_frame, width=32, exportselection=False,
+                                       activestyle=tk.NONE, yscrollcommand=scrollbar.set)
+        self.outline_list.pack(side=tk.LEFT, fill=tk.BOTH, expand=True)
+        scrollbar.config(command=self.outline_list.yview)
+        self.outline_list.bind('<ButtonRelease-1>', lambda e: self.jump_to_symbol())
+        self.outline_list.bind('<Return>', lambda e: self.jump_to_symbol())
+        self.outline_rows = []  # index in Outline.symbols of each row
+        self.outline_drawn = None
+        
+    def toggle_outline(self):
+        if self.show_outline.get():
+            self.outline_frame.pack(side=tk.RIGHT, fill=tk.Y, before=self.text_area.frame)
+            self.outline_drawn = None
+            self.scheduler.request("outline")
+        else:
+            self.outline_frame.pack_forget()
+            
+    def refresh_outline(self):
+        # List the symbols again when they (or the filter) changed, then
+        # select the one the cursor is in: a bisect over the symbol lines
+        # and then over the rows listed
+        if not self.show_outline.get():
             return
+        outline = self.outline
+        outline.scan()
+        listbox = self.outline_list
+        drawn = (outline, outline.version, self.outline_filter.get().lower())
+        if drawn != self.outline_drawn:
+            self.outline_drawn = drawn
+            symbols = outline.symbols
+            self.outline_rows = [index for index, (kind, name, indent) in enumerate(symbols)
+                                 if drawn[2] in name.lower()]
+            listbox.delete(0, tk.END)
+            listbox.insert(tk.END, *(" " * symbols[index][2] + f"{symbols[index][0]} {symbols[index][1]}"
+                                     for index in self.outline_rows))
+        current = outline.symbol_at(int(self.text_area.index(tk.INSERT).split(".")[0]) - 1)
+        row = bisect.bisect_left(self.outline_rows, current)
+        listbox.selection_clear(0, tk.END)
+        if current >= 0 and row < len(self.outline_rows) and self.outline_rows[row] == current:
+            listbox.selection_set(row)
+            listbox.see(row)
             
-        # Get current cursor position
+    def jump_to_symbol(self, row=None):
+        # Put the cursor on the symbol of a row (the selected one by default)
+        clicked = row is None
+        if clicked:
+            selection = self.outline_list.curselection()
+            if not selection:
+                return
+            row = selection[0]
+        outline = self.outline
+        if self.outline_drawn != (outline, outline.version, self.outline_filter.get().lower()):
+            # The rows are out of date: list the symbols as they are now,
+            # where a clicked row may stand for another symbol
+            self.refresh_outline()
+            if clicked:
+                return
+        if row >= len(self.outline_rows):
+            return
+        line = outline.symbol_line(self.outline_rows[row]) + 1
+        self.unfold_line(line)
+        self.text_area.mark_set(tk.INSERT, f"{line}.0")
+        self.text_area.see(tk.INSERT)
+        self.text_area.focus_set()
+        self.scheduler.request("gutter")
+                
+    def display_line(self, line):
+        # Line number shown for a line of the widget; in the large file
+        # viewer that is its line in the file, None until it is indexed
+        if self.viewer is not None:
+            return self.viewer.absolute_line(line)
+        return line
+        
+    def gutter_line_count(self):
+        if self.viewer is not None:
+            return self.viewer.index.line_count() or self.viewer.size // 40
+        return self.document.line_count()
+        
+    def update_gutter_width(self):
+        # Size the gutter for the digits of the largest line number and
+        # the fold markers
+        self.gutter_digits = len(str(self.gutter_line_count()))
+        font = tkfont.Font(font=self.text_area["font"])
+        width = font.measure("0" * max(self.gutter_digits, 2)) + font.measure("\u25be")
+        self.line_numbers.config(width=width + 14)
+        self.gutter_drawn = None
+        
+    def set_gutter_colors(self, bg, fg):
+        self.line_numbers.config(bg=bg)
+        self.gutter_fg = fg
+        self.gutter_drawn = None
+        self.update_line_numbers()
+        
+    def update_statusbar(self, event=None):
+        # Scheduler stage: cursor position, selection size and document
+        # totals. The totals are kept by the Document and selection
+        # offsets are bisects, so none of this depends on the file size.
+        if self.loader is not None:
+            # poll_loader reports progress meanwhile
+            return
         cursor_pos = self.text_area.index(tk.INSERT)
         line, col = cursor_pos.split('.')
+        line = self.display_line(int(line))
+        parts = [f"Ln {line if line is not None else '?'}, Col {int(col)+1}"]
         
-        # Update status bar
-        self.status_bar.config(text=f"Ln {line}, Col {int(col)+1}")
+        selection = self.text_area.tag_ranges(tk.SEL)
+        if selection:
+            first, last = str(selection[0]), str(selection[-1])
+            if self.viewer is not None:
+                chars = self.text_area.count(first, last, "chars")[0]
+            else:
+                chars = self.text_offset(last) - self.text_offset(first)
+            lines = int(last.split(".")[0]) - int(first.split(".")[0]) + 1
+            parts.append(f"Sel {chars:,} chars, {lines:,} lines")
+            
+        if self.viewer is not None:
+            lines = self.viewer.index.line_count()
+            parts.append(f"{lines:,} lines" if lines is not None else "Counting lines...")
+        else:
+            document = self.document
+            parts.append(f"{document.line_count():,} lines, {document.words:,} words, {len(document):,} chars")
+        if self.find_status:
+            parts.append(self.find_status)
+        self.status_bar.config(text="    ".join(parts))
         
     def on_key_release(self, event):
-        self.update_line_numbers()
-        self.update_statusbar()
-        self.highlight_syntax()
+        # Text changes and cursor moves schedule their own work through
+        # the edit proxy; this catches keys that do neither
+        self.scheduler.request("cursor")
+        
+    def on_text_modified(self, tab):
+        # The buffer now differs from the file (or matches it again); make
+        # sure the journal runs
+        if tab.text_area is None:
+            return
+        self.update_tab_label(tab)
+        if tab.text_area.edit_modified():
+            self.schedule_journal(tab)
+            
+    def setup_journal(self):
+        # Each tab journals its unsaved edits every JOURNAL_INTERVAL ms
+        # while there are any, so they survive a crash
+        self.root.after_idle(self.offer_recovery)
+        
+    def open_journal(self, tab):
+        try:
+            tab.journal = Journal(session=f"{os.getpid()}-{tab.number}")
+        except OSError:
+            return
+        tab.journal.reset(tab.path if tab.loaded else None, tab.encoding, tab.newlines)
+        
+    def schedule_journal(self, tab=None):
+        tab = tab or self.tab
+        if tab.journal is not None and tab.journal_job is None and tab.document.log:
+            tab.journal_job = self.root.after(self.JOURNAL_INTERVAL, lambda: self.flush_journal(tab))
+            
+    def flush_journal(self, tab):
+        # Hand the edits since the last flush to the journal's worker
+        tab.journal_job = None
+        records = tab.document.log
+        tab.document.clear_log()
+        if records:
+            tab.journal.append(records)
+        if tab.journal.needs_compaction():
+            tab.journal.compact(list(tab.document.chunks()), tab.path, tab.encoding, tab.newlines)
+            
+    def reset_journal(self, tab=None):
+        # The buffer matches the tab's file (or is empty) again
+        tab = tab or self.tab
+        tab.document.clear_log()
+        if tab.journal is not None:
+            tab.journal.reset(tab.path, tab.encoding, tab.newlines)
+            
+    def offer_recovery(self):
+        for journal_path in orphaned_journals():
+            try:
+                header, text = recover_journal(journal_path)
+            except (OSError, ValueError):
+                discard_journal(journal_path)
+                continue
+            if not read_journal(journal_path)[1] and not header.get("snapshot"):
+                discard_journal(journal_path)
+                continue
+                
+            name = header.get("path") or "an untitled document"
+            when = time.strftime("%Y-%m-%d %H:%M", time.localtime(header.get("time", 0)))
+            if messagebox.askyesno("Notepad+", f"Notepad+ did not exit cleanly.\n"
+                                               f"Recover unsaved changes to {name} from {when}?"):
+                discard_journal(journal_path)
+                self.restore_text(header, text)
+                continue
+            discard_journal(journal_path)
+            
+    def restore_text(self, header, text):
+        # The recovered text goes to the tab that has its file open, else
+        # to a new one
+        path = header.get("path")
+        tab = self.find_tab(path) if path else None
+        if tab is None:
+            tab = self.tab if self.is_pristine(self.tab) else self.add_tab()
+        tab.loaded = True
+        self.activate_tab(tab)
+        self.cancel_load()
+        self.close_viewer()
+        self.text_area.delete(1.0, tk.END)
+        self.text_area.insert(1.0, text)
+        self.text_area.edit_reset()
+        self.current_file = header.get("path")
+        self.file_encoding = header.get("encoding") or "utf-8"
+        self.file_newlines = header.get("newlines")
+        if isinstance(self.file_newlines, list):
+            self.file_newlines = tuple(self.file_newlines)
+        self.root.title(f"Notepad+ - {self.current_file}" if self.current_file else "Notepad+")
+        self.set_syntax_highlighting(self.detect_language(self.current_file or ""))
+        
+        # Journal the recovered text as a snapshot; it is still unsaved
+        self.document.clear_log()
+        if self.journal is not None:
+            self.journal.compact(list(self.document.chunks()), self.current_file,
+                                 self.file_encoding, self.file_newlines)
+        self.text_area.edit_modified(True)
+        self.update_tab_label(tab)
+        self.status_bar.config(text="Recovered unsaved changes")
+        
+    def show_frame_stats(self):
+        stats = self.scheduler.stats()
+        messagebox.showinfo("Frame Statistics",
+                            f"Frames: {stats['frames']}\n"
+                            f"Dropped frames: {stats['dropped']}\n"
+                            f"Last frame: {stats['last_ms']:.2f} ms\n"
+                            f"Average frame: {stats['avg_ms']:.2f} ms\n"
+                            f"Slowest frame: {stats['max_ms']:.2f} ms")
+            
+    def show_performance(self):
+        if self.instrumentation is None:
+            messagebox.showinfo("Performance", "Instrumentation is off.\n"
+                                               "Start Notepad+ with --profile or NOTEPAD_PROFILE=1 "
+                                               "to record handler latencies.")
+            return
+        if self.performance_panel is not None:
+            self.performance_panel.deiconify()
+            self.performance_panel.lift()
+            return
+            
+        panel = self.performance_panel = tk.Toplevel(self.root)
+        panel.title("Performance")
+        panel.protocol("WM_DELETE_WINDOW", self.close_performance)
+        self.performance_text = tk.Text(panel, width=100, height=30, wrap=tk.NONE,
+                                        font=(self.font_family.get(), 10))
+        self.performance_text.pack(fill=tk.BOTH, expand=True, padx=5, pady=5)
+        
+        buttons = tk.Frame(panel)
+        buttons.pack(fill=tk.X, padx=5, pady=5)
+        tk.Button(buttons, text="Close", command=self.close_performance).pack(side=tk.RIGHT, padx=2)
+        tk.Button(buttons, text="Export JSON", command=self.export_performance).pack(side=tk.RIGHT, padx=2)
+        self.profile_button = tk.Button(buttons, text="Start cProfile", command=self.toggle_profile)
+        self.profile_button.pack(side=tk.RIGHT, padx=2)
+        tk.Button(buttons, text="Reset", command=self.instrumentation.reset).pack(side=tk.RIGHT, padx=2)
+        self.refresh_performance()
+        
+    def refresh_performance(self):
+        # Redraw the tables every second while the panel is open
+        if self.performance_panel is None:
+            return
+        lines = [f"{'Handler':<22}{'Calls':>8}{'p50 ms':>10}{'p99 ms':>10}{'Max ms':>10}"
+                 f"{'Tk calls':>10}{'Chars':>10}"]
+        for name, count, p50, p99, slowest, calls, chars in self.instrumentation.summary():
+            lines.append(f"{name:<22}{count:>8}{p50:>10.2f}{p99:>10.2f}{slowest:>10.2f}{calls:>10.1f}{chars:>10.0f}")
+        lines.append("")
+        lines.append(f"{'Tk command':<22}{'Calls':>8}{'Chars':>12}")
+        for command, (calls, chars) in sorted(self.instrumentation.commands.items(), key=lambda item: -item[1][0]):
+            lines.append(f"{command:<22}{calls:>8}{chars:>12}")
+        stats = self.scheduler.stats()
+        lines.append("")
+        lines.append(f"Frames: {stats['frames']}, dropped: {stats['dropped']}, "
+                     f"average {stats['avg_ms']:.2f} ms, slowest {stats['max_ms']:.2f} ms")
+                     
+        text = self.performance_text
+        view = text.yview()[0]
+        text.config(state=tk.NORMAL)
+        text.delete("1.0", tk.END)
+        text.insert("1.0", "\n".join(lines))
+        text.config(state=tk.DISABLED)
+        text.yview_moveto(view)
+        self.performance_job = self.root.after(1000, self.refresh_performance)
         
-    def on_text_modified(self, event):
-        # Handle text modification events
-        if event:
-            self.text_area.edit_modified(False)
+    def close_performance(self):
+        self.root.after_cancel(self.performance_job)
+        self.performance_panel.destroy()
+        self.performance_panel = None
+        
+    def export_performance(self):
+        path = filedialog.asksaveasfilename(parent=self.performance_panel, defaultextension=".json",
+                                            filetypes=[("JSON files", "*.json"), ("All files", "*.*")])
+        if not path:
+            return
+        try:
+            self.instrumentation.export(path, self.scheduler.stats())
+        except OSError as e:
+            messagebox.showerror("Error", f"Could not export: {str(e)}")
+            
+    def toggle_profile(self):
+        # cProfile the Tk thread between two presses, then save its stats
+        if self.instrumentation.profile is None:
+            self.instrumentation.start_profile()
+            self.profile_button.config(text="Stop cProfile")
+            return
+        self.profile_button.config(text="Start cProfile")
+        path = filedialog.asksaveasfilename(parent=self.performance_panel, defaultextension=".prof",
+                                            filetypes=[("cProfile stats", "*.prof"), ("All files", "*.*")])
+        try:
+            self.instrumentation.stop_profile(path)
+        except OSError as e:
+            messagebox.showerror("Error", f"Could not save the profile: {str(e)}")
             
     def update_font(self):
-        self.text_area.config(font=(self.font_family.get(), self.font_size.get()))
+        for tab in self.hydrated:
+            tab.text_area.config(font=(self.font_family.get(), self.font_size.get()))
+        self.update_gutter_width()
+        self.scheduler.request("gutter")
         
     def change_font_size(self, size):
         self.font_size.set(size)
@@ -304,113 +1646,386 @@ class Notepad:
         # Light theme colors
         bg_color = "white"
         fg_color = "black"
-        self.text_area.config(bg=bg_color, fg=fg_color, insertbackground=fg_color)
-        self.line_numbers.config(bg="lightgray", fg="black")
+        self.set_text_colors(bg_color, fg_color)
+        self.set_gutter_colors("lightgray", "black")
         self.status_bar.config(bg="lightgray", fg="black")
         
     def apply_dark_theme(self):
         # Dark theme colors
         bg_color = "#2e2e2e"
         fg_color = "#ffffff"
-        self.text_area.config(bg=bg_color, fg=fg_color, insertbackground=fg_color)
-        self.line_numbers.config(bg="#3c3c3c", fg="white")
+        self.set_text_colors(bg_color, fg_color)
+        self.set_gutter_colors("#3c3c3c", "white")
         self.status_bar.config(bg="#3c3c3c", fg="white")
         
         # Update syntax highlighting colors for dark theme
-        self.text_area.tag_configure("keyword", foreground="#569cd6")
-        self.text_area.tag_configure("comment", foreground="#6a9955")
-        self.text_area.tag_configure("string", foreground="#ce9178")
-        self.text_area.tag_configure("number", foreground="#b5cea8")
-        self.text_area.tag_configure("function", foreground="#dcdcaa")
+        self.set_syntax_colors(keyword="#569cd6", comment="#6a9955", string="#ce9178",
+                               number="#b5cea8", function="#dcdcaa")
         
     def apply_blue_theme(self):
         # Blue theme colors
         bg_color = "#e6f3ff"
         fg_color = "#000055"
-        self.text_area.config(bg=bg_color, fg=fg_color, insertbackground=fg_color)
-        self.line_numbers.config(bg="#cce5ff", fg="darkblue")
+        self.set_text_colors(bg_color, fg_color)
+        self.set_gutter_colors("#cce5ff", "darkblue")
         self.status_bar.config(bg="#cce5ff", fg="darkblue")
         
+    def set_text_colors(self, bg, fg):
+        self.text_colors = {"bg": bg, "fg": fg, "insertbackground": fg}
+        for tab in self.hydrated:
+            tab.text_area.config(**self.text_colors)
+            
+    def set_syntax_colors(self, **colors):
+        self.syntax_colors.update(colors)
+        for tab in self.hydrated:
+            for tag, color in colors.items():
+                tab.text_area.tag_configure(tag, foreground=color)
+                
     def new_file(self):
-        if self.text_area.edit_modified():
-            if not messagebox.askokcancel("Notepad+", "Save changes to current file?"):
-                return
-            self.save_file()
+        self.activate_tab(self.add_tab())
+        
+    def open_file(self):
+        file_path = filedialog.askopenfilename(
+            defaultextension=".txt",
+            filetypes=[("Text files", "*.txt"), ("All files", "*.*")]
+        )
+        
+        if file_path:
+            self.open_path(file_path)
+            
+    def open_path(self, file_path):
+        # Show the tab that has the file open, or read it into a new tab
+        # (into the current one when that is still empty and untitled)
+        tab = self.find_tab(file_path)
+        if tab is not None:
+            self.activate_tab(tab)
+            return
+        if not self.is_pristine(self.tab):
+            self.activate_tab(self.add_tab())
+        self.load_file(file_path)
+        
+    def load_file(self, file_path):
+        # Stream the file into the current tab from a worker thread;
+        # highlighting waits until the whole file is in
+        self.cancel_load()
+        self.close_viewer()
+        try:
+            self.loader = FileLoader(file_path)
+        except Exception as e:
+            if not self.tab.loaded:
+                self.tab.loaded = True
+                self.current_file = None
+                self.update_tab_label(self.tab)
+                self.update_title()
+            messagebox.showerror("Error", f"Could not open file: {str(e)}")
+            return
             
+        if file_path != self.current_file:
+            self.current_language = self.detect_language(file_path)
+            self.tab.cursor, self.tab.view = "1.0", 0.0
+        if self.loader.size >= LARGE_FILE_THRESHOLD and not self.loader.encoding.startswith(("utf-16", "utf-32")):
+            self.open_viewer(self.loader)
+            return
+            
+        self.highlighter.set_lexer(None)
+        self.outline.set_patterns(None)
+        self.text_area.config(undo=False)
+        self.document.logging = False
         self.text_area.delete(1.0, tk.END)
+        self.text_area.config(state=tk.DISABLED)
+        self.current_file = file_path
+        self.root.title(f"Notepad+ - {file_path}")
+        self.update_tab_label(self.tab)
+        self.loader.start()
+        self.poll_loader()
+        
+    def poll_loader(self):
+        # Insert queued chunks for up to one frame, then yield to Tk
+        loader = self.loader
+        self.load_job = None
+        deadline = time.perf_counter() + 0.016
+        self.text_area.config(state=tk.NORMAL)
+        try:
+            while time.perf_counter() < deadline:
+                try:
+                    item = loader.queue.get_nowait()
+                except queue.Empty:
+                    break
+                if item is None:
+                    self.finish_load()
+                    return
+                # Past the proxy, so the Document gets the word count
+                # FileLoader already took
+                chunk, words = item
+                first = self.document.line_count()
+                self.text_call(self.tab, "insert", tk.END, chunk)
+                self.document.insert(len(self.document), chunk, words)
+                self.on_text_change(self.tab, first, 1, self.document.line_count() - first + 1)
+        finally:
+            if self.loader is loader:
+                self.text_area.config(state=tk.DISABLED)
+                
+        self.status_bar.config(text=f"Loading {os.path.basename(loader.path)}... "
+                                    f"{loader.progress():.0%} (Esc to cancel)")
+        self.load_job = self.root.after(10, self.poll_loader)
+        
+    def finish_load(self):
+        loader = self.loader
+        self.loader = None
+        self.mark_startup("loaded", report=True)
+        self.text_area.config(state=tk.NORMAL, undo=True)
+        self.text_area.edit_reset()
+        self.document.logging = True
+        self.document.clear_log()
+        self.tab.loaded = True
+        if loader.error is not None:
+            self.text_area.delete(1.0, tk.END)
+            self.current_file = None
+            self.root.title("Notepad+")
+            self.update_tab_label(self.tab)
+            self.update_statusbar()
+            messagebox.showerror("Error", f"Could not open file: {str(loader.error)}")
+            return
+            
+        self.file_encoding = loader.encoding
+        self.file_newlines = loader.newlines
+        self.tab.replaced = loader.replaced
+        self.text_area.mark_set(tk.INSERT, self.tab.cursor)
+        if self.tab.view is None:
+            # Opened at a location (see open_location)
+            self.text_area.see(tk.INSERT)
+        else:
+            self.text_area.yview_moveto(self.tab.view)
+        self.text_area.edit_modified(False)
+        self.update_line_numbers()
+        self.set_syntax_highlighting(self.current_language)
+        if loader.replaced:
+            self.status_bar.config(text=f"Opened {os.path.basename(loader.path)} ({loader.encoding}): "
+                                        f"invalid bytes were replaced with \ufffd")
+        else:
+            self.status_bar.config(text=f"Opened {os.path.basename(loader.path)} ({loader.encoding})")
+        self.reset_journal()
+        
+    def cancel_load(self):
+        if self.loader is None:
+            return
+        self.stop_load()
+        self.mark_startup("cancelled", report=True)
+        self.tab.loaded = True
         self.current_file = None
+        self.current_language = "plain"
         self.root.title("Notepad+")
+        self.update_tab_label(self.tab)
+        self.status_bar.config(text="Open cancelled")
+        self.reset_journal()
+        
+    def stop_load(self):
+        # Stop the worker and empty the widget; the tab keeps its path and
+        # reads the file again when next activated
+        self.loader.cancel()
+        self.loader = None
+        if self.load_job is not None:
+            self.root.after_cancel(self.load_job)
+            self.load_job = None
+        self.text_area.config(state=tk.NORMAL, undo=True)
+        self.text_area.delete(1.0, tk.END)
+        self.text_area.edit_reset()
+        self.text_area.edit_modified(False)
+        self.document.logging = True
+        self.document.clear_log()
+        self.tab.loaded = False
+        
+    def open_viewer(self, loader):
+        # Browse a large file through a memory-mapped window instead of
+        # loading it into the widget
+        self.loader = None
+        try:
+            self.viewer = LargeFileViewer(self.text_area, loader.path, loader.encoding)
+        except Exception as e:
+            messagebox.showerror("Error", f"Could not open file: {str(e)}")
+            return
+            
+        self.set_syntax_highlighting("plain")
+        self.text_area.config(undo=False)
+        self.document.logging = False
+        self.text_area.vbar.config(command=self.viewer.on_scrollbar)
+        self.current_file = loader.path
+        self.file_encoding = loader.encoding
+        self.tab.loaded = True
+        self.root.title(f"Notepad+ - {loader.path} (read-only)")
+        self.update_tab_label(self.tab)
+        self.viewer.open()
+        self.text_area.edit_reset()
         self.text_area.edit_modified(False)
+        self.poll_viewer_index()
+        
+    def poll_viewer_index(self):
+        # Report indexing progress until absolute line numbers are known
+        self.viewer_job = None
+        index = self.viewer.index
+        if not index.done:
+            self.status_bar.config(text=f"Indexing lines... {index.progress():.0%}")
+            self.viewer_job = self.root.after(100, self.poll_viewer_index)
+            return
+        self.update_gutter_width()
         self.update_line_numbers()
+        self.update_statusbar()
         
-    def open_file(self):
-        if self.text_area.edit_modified():
-            if not messagebox.askokcancel("Notepad+", "Save changes to current file?"):
+    def close_viewer(self):
+        if self.viewer is None:
+            return
+        if self.viewer_job is not None:
+            self.root.after_cancel(self.viewer_job)
+            self.viewer_job = None
+        self.viewer.close()
+        self.viewer = None
+        self.text_area.vbar.config(command=self.text_area.yview)
+        self.text_area.config(state=tk.NORMAL, undo=True)
+        self.text_area.delete(1.0, tk.END)
+        self.text_area.edit_reset()
+        self.text_area.edit_modified(False)
+        self.document.logging = True
+        self.document.clear_log()
+        self.update_gutter_width()
+        
+    def goto_line(self):
+        line = simpledialog.askinteger("Go to Line", "Line number:", minvalue=1)
+        if line is None:
+            return
+        if self.viewer is not None:
+            if not self.viewer.goto(line):
+                self.status_bar.config(text=f"Line {line} is not indexed yet")
                 return
-            self.save_file()
+        else:
+            self.unfold_line(line)
+            self.text_area.mark_set(tk.INSERT, f"{line}.0")
+        self.text_area.see(tk.INSERT)
+        self.scheduler.request("cursor", "gutter")
+        
+    def detect_language(self, file_path):
+        # Try to detect file type for syntax highlighting
+        return LANGUAGES.detect(file_path)
+        
+    def save_file(self, wait=False):
+        # Write a snapshot of the document in the background; with wait,
+        # block until it is on disk (used before exiting)
+        if self.viewer is not None:
+            self.status_bar.config(text="Large files are opened read-only")
+            return
+        if not self.current_file:
+            self.save_as_file(wait)
+            return
+        if self.saver is not None:
+            self.status_bar.config(text="A save is already in progress")
+            if wait:
+                self.saver.thread.join()
+                self.finish_save()
+            return
+        if self.tab.replaced:
+            # Saving would write the replacement characters over the bytes
+            if not messagebox.askokcancel("Save", f"{self.tab.name()} had bytes that are not valid "
+                                                  f"{self.file_encoding}; they were replaced with \ufffd "
+                                                  f"when opened and will be saved that way.\nSave anyway?"):
+                return
+            self.tab.replaced = False
+        self.start_save(wait)
+        
+    def start_save(self, wait):
+        # The save itself, once any dialog is answered
+        newline = self.file_newlines
+        if isinstance(newline, tuple):
+            # Mixed line endings: keep the Windows style if it was there
+            newline = "\r\n" if "\r\n" in newline else newline[0]
+        self.saver = FileSaver(self.current_file, list(self.document.chunks()), self.file_encoding, newline)
+        self.save_tab = self.tab
+        self.save_version = self.document.version
+        self.saver.start()
+        if wait:
+            self.saver.thread.join()
+            self.finish_save()
+        else:
+            self.poll_saver()
             
-        file_path = filedialog.askopenfilename(
-            defaultextension=".txt",
-            filetypes=[("Text files", "*.txt"), ("All files", "*.*")]
-        )
+    def poll_saver(self):
+        self.save_job = None
+        if not self.saver.done():
+            self.status_bar.config(text=f"Saving... {self.saver.progress():.0%}")
+            self.save_job = self.root.after(50, self.poll_saver)
+            return
+        self.finish_save()
         
-        if file_path:
-            try:
-                with open(file_path, "r") as file:
-                    content = file.read()
-                    self.text_area.delete(1.0, tk.END)
-                    self.text_area.insert(1.0, content)
-                    
-                self.current_file = file_path
-                self.root.title(f"Notepad+ - {file_path}")
-                self.text_area.edit_modified(False)
-                self.update_line_numbers()
-                
-                # Try to detect file type for syntax highlighting
-                if file_path.endswith(".py"):
-                    self.set_syntax_highlighting("python")
-                elif file_path.endswith(".js"):
-                    self.set_syntax_highlighting("javascript")
-                elif file_path.endswith(".html"):
-                    self.set_syntax_highlighting("html")
-                elif file_path.endswith(".css"):
-                    self.set_syntax_highlighting("css")
-                else:
-                    self.set_syntax_highlighting("plain")
-                    
-            except Exception as e:
-                messagebox.showerror("Error", f"Could not open file: {str(e)}")
-                
-    def save_file(self):
-        if self.current_file:
-            try:
-                with open(self.current_file, "w") as file:
-                    content = self.text_area.get(1.0, tk.END)
-                    file.write(content)
-                    
-                self.text_area.edit_modified(False)
-                messagebox.showinfo("Notepad+", "File saved successfully!")
-            except Exception as e:
-                messagebox.showerror("Error", f"Could not save file: {str(e)}")
+    def finish_save(self):
+        # The tab saved may no longer be the active one. A save waited for
+        # elsewhere (closing its tab, exiting) stops the polling.
+        saver, tab = self.saver, self.save_tab
+        if saver is None:
+            return
+        if self.save_job is not None:
+            self.root.after_cancel(self.save_job)
+            self.save_job = None
+        self.saver = self.save_tab = None
+        name = os.path.basename(saver.path)
+        if saver.error is not None:
+            self.status_bar.config(text=f"Could not save {name}: {saver.error}")
+            return
+        if saver.encoding != tab.encoding and saver.path == tab.path:
+            self.status_bar.config(text=f"Saved {name} as {saver.encoding} "
+                                        f"(the text does not fit {tab.encoding})")
+            tab.encoding = saver.encoding
         else:
-            self.save_as_file()
+            self.status_bar.config(text=f"Saved {name}")
+        if tab.document.version == self.save_version:
+            if tab.text_area is not None:
+                tab.text_area.edit_modified(False)
+            else:
+                tab.modified = False
+                self.update_tab_label(tab)
+            if saver.path == tab.path:
+                self.reset_journal(tab)
+        elif tab.journal is not None:
+            # Edited while saving: the journal's base file was overwritten
+            tab.document.clear_log()
+            tab.journal.compact(list(tab.document.chunks()), tab.path, tab.encoding, tab.newlines)
             
-    def save_as_file(self):
+    def save_as_file(self, wait=False):
+        # The tab takes the new path only once its save can start
+        if self.viewer is not None:
+            self.status_bar.config(text="Large files are opened read-only")
+            return
+        if self.saver is not None and not wait:
+            self.status_bar.config(text="A save is already in progress")
+            return
         file_path = filedialog.asksaveasfilename(
             defaultextension=".txt",
             filetypes=[("Text files", "*.txt"), ("All files", "*.*")]
         )
         
         if file_path:
+            if self.saver is not None:
+                self.saver.thread.join()
+                self.finish_save()
             self.current_file = file_path
-            self.save_file()
+            self.save_file(wait)
             self.root.title(f"Notepad+ - {file_path}")
+            self.update_tab_label(self.tab)
             
     def exit_app(self):
-        if self.text_area.edit_modified():
-            if messagebox.askokcancel("Notepad+", "Save changes before exiting?"):
-                self.save_file()
-                
+        for tab in list(self.tabs):
+            if self.is_modified(tab):
+                self.activate_tab(tab)
+                if messagebox.askokcancel("Notepad+", f"Save changes to {tab.name()} before exiting?"):
+                    self.save_file(wait=True)
+                    
+        if self.saver is not None:
+            self.saver.thread.join()
+        if self.file_search is not None:
+            self.file_search.cancel()
+        self.save_session()
+        for tab in self.tabs:
+            if tab.journal is not None:
+                tab.journal.close()
+            if tab.viewer is not None:
+                tab.viewer.close()
         self.root.destroy()
         
     def undo(self):
@@ -439,51 +2054,491 @@ class Notepad:
         self.text_area.mark_set(tk.INSERT, "1.0")
         self.text_area.see(tk.INSERT)
         
+    def setup_find_bar(self):
+        # Search-as-you-type bar, shown by find_text
+        self.find_engine = FindEngine(self.document)
+        self.replace_dialog = None
+        self.replace_with = tk.StringVar()
+        self.replace_in_selection = tk.BooleanVar(value=False)
+        self.find_status = ""
+        self.find_origin = 0
+        self.find_query = tk.StringVar()
+        self.find_regex = tk.BooleanVar(value=False)
+        self.find_case = tk.BooleanVar(value=False)
+        self.find_word = tk.BooleanVar(value=False)
+        self.files_dialog = None
+        self.file_search = None
+        self.file_search_job = None
+        self.file_results = []  # (path, line, column) of each row in the results list
+        self.files_directory = tk.StringVar(value=os.getcwd())
+        self.files_include = tk.StringVar()
+        self.files_exclude = tk.StringVar()
+        
+        self.find_bar = tk.Frame(self.root, bd=1, relief=tk.RAISED)
+        tk.Label(self.find_bar, text="Find:").pack(side=tk.LEFT, padx=2)
+        self.find_entry = tk.Entry(self.find_bar, textvariable=self.find_query, width=30)
+        self.find_entry.pack(side=tk.LEFT, padx=2, pady=2)
+        for label, variable in (("Regex", self.find_regex), ("Match case", self.find_case),
+                                ("Whole word", self.find_word)):
+            tk.Checkbutton(self.find_bar, text=label, variable=variable,
+                           command=lambda: self.scheduler.request("find")).pack(side=tk.LEFT)
+        tk.Button(self.find_bar, text="Prev", relief=tk.FLAT,
+                  command=lambda: self.find_next(backwards=True)).pack(side=tk.LEFT, padx=2)
+        tk.Button(self.find_bar, text="Next", relief=tk.FLAT,
+                  command=self.find_next).pack(side=tk.LEFT, padx=2)
+        tk.Button(self.find_bar, text="Close", relief=tk.FLAT,
+                  command=self.close_find_bar).pack(side=tk.RIGHT, padx=2)
+                  
+        self.find_query.trace_add("write", lambda *args: self.scheduler.request("find"))
+        self.find_entry.bind('<Return>', lambda e: self.find_next())
+        self.find_entry.bind('<Shift-Return>', lambda e: self.find_next(backwards=True))
+        self.find_entry.bind('<Escape>', lambda e: self.close_find_bar())
+        
     def find_text(self):
-        find_str = simpledialog.askstring("Find", "Enter text to find:")
-        if find_str:
-            # Remove previous highlights
-            self.text_area.tag_remove("found", "1.0", tk.END)
-            
-            # Search for the text
-            start_pos = "1.0"
-            while True:
-                start_pos = self.text_area.search(find_str, start_pos, stopindex=tk.END)
-                if not start_pos:
-                    break
-                    
-                end_pos = f"{start_pos}+{len(find_str)}c"
-                self.text_area.tag_add("found", start_pos, end_pos)
-                start_pos = end_pos
-                
-            # Configure the highlight
-            self.text_area.tag_config("found", background="yellow", foreground="black")
+        if not self.find_bar.winfo_ismapped():
+            self.find_bar.pack(side=tk.BOTTOM, fill=tk.X, before=self.status_bar)
+        if self.text_area.tag_ranges(tk.SEL):
+            selected = self.text_area.get(tk.SEL_FIRST, tk.SEL_LAST)
+            if "\n" not in selected:
+                self.find_query.set(selected)
+        self.find_origin = self.text_offset(tk.INSERT)
+        self.find_entry.focus_set()
+        self.find_entry.select_range(0, tk.END)
+        self.scheduler.request("find")
+        
+    def close_find_bar(self):
+        self.find_bar.pack_forget()
+        self.find_engine.clear()
+        self.text_area.tag_remove("found", "1.0", tk.END)
+        self.find_status = ""
+        self.update_statusbar()
+        self.text_area.focus_set()
+        
+    def run_find(self):
+        # Scheduler stage: search for the query as typed so far
+        query = self.find_query.get()
+        if not query or not self.find_bar.winfo_ismapped():
+            self.find_engine.clear()
+            self.find_status = ""
+            self.tag_visible_matches()
+            self.update_statusbar()
+            return
+        try:
+            count = self.find_engine.search(query, self.find_regex.get(),
+                                            self.find_case.get(), self.find_word.get())
+        except re.error as e:
+            self.find_engine.clear()
+            self.find_status = f"Invalid pattern: {e}"
+            self.tag_visible_matches()
+            self.update_statusbar()
+            return
             
+        self.find_status = f"{count} matches" if count else "No matches"
+        index = self.find_engine.next_index(self.find_origin)
+        if index is not None:
+            self.select_match(index)
+        self.tag_visible_matches()
+        self.update_statusbar()
+        
+    def find_next(self, backwards=False):
+        engine = self.find_engine
+        if not self.find_query.get():
+            self.find_text()
+            return
+        if engine.stale() or engine.query != self.find_query.get():
+            self.run_find()
+        if backwards:
+            start = self.text_area.index(tk.SEL_FIRST) if self.text_area.tag_ranges(tk.SEL) else tk.INSERT
+            index = engine.prev_index(self.text_offset(start))
+        else:
+            index = engine.next_index(self.text_offset(tk.INSERT))
+        if index is None:
+            return
+        self.select_match(index)
+        self.find_origin = engine.starts[index]
+        self.tag_visible_matches()
+        self.update_statusbar()
+        
+    def select_match(self, index):
+        engine = self.find_engine
+        start = self.text_index(engine.starts[index])
+        end = self.text_index(engine.ends[index])
+        self.unfold_line(int(start.split(".")[0]))
+        self.text_area.tag_remove(tk.SEL, "1.0", tk.END)
+        self.text_area.tag_add(tk.SEL, start, end)
+        self.text_area.mark_set(tk.INSERT, end)
+        self.text_area.see(start)
+        self.find_status = f"Match {index + 1} of {len(engine)}"
+        
+    def tag_visible_matches(self):
+        # Only the matches in the viewport carry the "found" tag
+        self.text_area.tag_remove("found", "1.0", tk.END)
+        engine = self.find_engine
+        if not len(engine) or engine.stale():
+            return
+        first, last = self.highlighter.visible_lines()
+        document = self.document
+        indices = []
+        for index in engine.between(document.line_offset(first - 1), document.line_end(last - 1)):
+            indices.extend((self.text_index(engine.starts[index]), self.text_index(engine.ends[index])))
+        if indices:
+            self.text_area.tag_add("found", *indices)
+            
+    def text_index(self, offset):
+        line, col = self.document.tk_line_col(offset)
+        return f"{line + 1}.{col}"
+        
     def replace_text(self):
-        find_str = simpledialog.askstring("Replace", "Find what:")
-        if not find_str:
+        if self.replace_dialog is not None:
+            self.replace_dialog.deiconify()
+            self.replace_dialog.lift()
             return
             
-        replace_str = simpledialog.askstring("Replace", "Replace with:")
-        if replace_str is None:
+        dialog = self.replace_dialog = tk.Toplevel(self.root)
+        dialog.title("Replace")
+        dialog.transient(self.root)
+        dialog.protocol("WM_DELETE_WINDOW", self.close_replace_dialog)
+        
+        fields = tk.Frame(dialog)
+        fields.pack(fill=tk.X, padx=5, pady=5)
+        tk.Label(fields, text="Find what:").grid(row=0, column=0, sticky=tk.W)
+        find_entry = tk.Entry(fields, textvariable=self.find_query, width=40)
+        find_entry.grid(row=0, column=1, sticky=tk.EW, padx=5)
+        tk.Label(fields, text="Replace with:").grid(row=1, column=0, sticky=tk.W)
+        tk.Entry(fields, textvariable=self.replace_with, width=40).grid(row=1, column=1, sticky=tk.EW, padx=5)
+        fields.columnconfigure(1, weight=1)
+        
+        options = tk.Frame(dialog)
+        options.pack(fill=tk.X, padx=5)
+        for label, variable in (("Regex", self.find_regex), ("Match case", self.find_case),
+                                ("Whole word", self.find_word), ("In selection", self.replace_in_selection)):
+            tk.Checkbutton(options, text=label, variable=variable).pack(side=tk.LEFT)
+            
+        self.replace_preview = tk.Listbox(dialog, height=10, width=70)
+        self.replace_preview.pack(fill=tk.BOTH, expand=True, padx=5, pady=5)
+        
+        buttons = tk.Frame(dialog)
+        buttons.pack(fill=tk.X, padx=5, pady=5)
+        tk.Button(buttons, text="Close", command=self.close_replace_dialog).pack(side=tk.RIGHT, padx=2)
+        tk.Button(buttons, text="Replace All", command=self.replace_all).pack(side=tk.RIGHT, padx=2)
+        tk.Button(buttons, text="Preview", command=self.preview_replace).pack(side=tk.RIGHT, padx=2)
+        find_entry.focus_set()
+        
+    def close_replace_dialog(self):
+        self.replace_dialog.destroy()
+        self.replace_dialog = None
+        
+    def replace_plan(self):
+        # (pattern, replace function, start, end) for the dialog's settings,
+        # None after reporting a bad pattern or replacement
+        query = self.find_query.get()
+        if not query:
+            return None
+        try:
+            pattern = self.find_engine.compile(query, self.find_regex.get(),
+                                               self.find_case.get(), self.find_word.get())
+        except re.error as e:
+            self.status_bar.config(text=f"Invalid pattern: {e}")
+            return None
+        replacement = self.replace_with.get()
+        if self.find_regex.get():
+            try:
+                # sub parses the template before looking for matches, so
+                # this checks its escapes and group references
+                pattern.sub(replacement, "")
+            except (re.error, IndexError) as e:
+                self.status_bar.config(text=f"Invalid replacement: {e}")
+                return None
+        start, end = 0, len(self.document)
+        if self.replace_in_selection.get() and self.viewer is None:
+            # Tk drops the selection when an entry takes it, so it may be gone
+            if not self.text_area.tag_ranges(tk.SEL):
+                self.status_bar.config(text="In selection is on but no text is selected")
+                return None
+            start, end = self.text_offset(tk.SEL_FIRST), self.text_offset(tk.SEL_LAST)
+        return pattern, replacer(replacement, self.find_regex.get()), start, end
+        
+    def preview_replace(self):
+        plan = self.replace_plan()
+        self.replace_preview.delete(0, tk.END)
+        if plan is None or self.viewer is not None:
+            return
+        pattern, replace, start, end = plan
+        text = self.document.text()
+        shown = 0
+        count = 0
+        for match in pattern.finditer(text, start, end):
+            count += 1
+            if shown < self.PREVIEW_LIMIT:
+                line, col = self.document.line_col(match.start())
+                line_start = match.start() - col
+                line_end = text.find("\n", match.end())
+                before = text[line_start:match.start()][-30:]
+                after = text[match.end():line_end if line_end >= 0 else len(text)][:30]
+                self.replace_preview.insert(tk.END, f"Ln {line + 1}: {before}[{match.group()} -> {replace(match)}]{after}")
+                shown += 1
+        self.status_bar.config(text=f"{count} matches to replace")
+        
+    def replace_all(self):
+        plan = self.replace_plan()
+        if plan is None:
+            return
+        if self.viewer is not None:
+            if self.replace_in_selection.get():
+                # The file on disk is rewritten whole, so a selection of the
+                # viewer's window cannot scope it
+                messagebox.showinfo("Replace", "In selection is not available for files too large "
+                                               "to edit in the window.")
+                return
+            self.replace_in_file(plan)
             return
             
-        # Remove previous highlights
-        self.text_area.tag_remove("found", "1.0", tk.END)
+        pattern, replace, start, end = plan
+        started = time.perf_counter()
+        text = self.document.text()
+        edits = plan_replacements(text, pattern, replace, start, end)
+        if not edits:
+            self.status_bar.config(text="Text not found")
+            return
+            
+        # One undo step for the whole operation; the cursor and view are
+        # kept since only the matched ranges change
+        text_area = self.text_area
+        view = text_area.yview()[0]
+        text_area.tag_remove("found", "1.0", tk.END)
+        text_area.config(autoseparators=False)
+        text_area.edit_separator()
+        try:
+            # One Tk call per match, or one for the span they cover when
+            # there are many
+            for edit_start, edit_end, new_text in replace_edits(text, edits):
+                text_area.replace(self.text_index(edit_start), self.text_index(edit_end), new_text)
+        finally:
+            text_area.edit_separator()
+            text_area.config(autoseparators=True)
+        text_area.yview_moveto(view)
+        
+        elapsed = (time.perf_counter() - started) * 1000
+        self.status_bar.config(text=f"Replaced {len(edits)} occurrences in {elapsed:.0f} ms")
+        
+    def replace_in_file(self, plan):
+        # The large file viewer has no buffer to edit: rewrite the file on
+        # disk on a worker thread, then reopen it
+        if not messagebox.askokcancel("Replace", "This file is too large to edit in the window.\n"
+                                                 "Replace all matches directly in the file on disk?"):
+            return
+        pattern, replace, start, end = plan
+        path, encoding = self.current_file, self.file_encoding
+        size = os.path.getsize(path)
+        tab = self.tab
+        self.close_viewer()
+        tab.loaded = False
+        result = {}
+        
+        def work():
+            started = time.perf_counter()
+            try:
+                result["count"] = stream_replace(path, pattern, replace, encoding,
+                                                 progress=lambda done: result.update(done=done))
+            except Exception as e:
+                result["error"] = e
+            result["elapsed"] = time.perf_counter() - started
+            
+        def poll():
+            if thread.is_alive():
+                self.status_bar.config(text=f"Replacing in file... {result.get('done', 0) / max(size, 1):.0%}")
+                self.root.after(100, poll)
+                return
+            if tab is self.tab:
+                self.load_file(path)
+            else:
+                # Read again when the tab is next activated
+                tab.loaded = False
+            if "error" in result:
+                messagebox.showerror("Error", f"Could not replace in file: {str(result['error'])}")
+            else:
+                self.status_bar.config(text=f"Replaced {result['count']} occurrences "
+                                            f"in {result['elapsed']:.1f} s")
+                                            
+        thread = threading.Thread(target=work, daemon=True)
+        thread.start()
+        poll()
+        
+    def find_in_files(self):
+        if self.files_dialog is not None:
+            self.files_dialog.deiconify()
+            self.files_dialog.lift()
+            return
+            
+        dialog = self.files_dialog = tk.Toplevel(self.root)
+        dialog.title("Find in Files")
+        dialog.protocol("WM_DELETE_WINDOW", self.close_files_dialog)
+        dialog.bind('<Escape>', lambda e: self.stop_file_search())
+        
+        fields = tk.Frame(dialog)
+        fields.pack(fill=tk.X, padx=5, pady=5)
+        tk.Label(fields, text="Find what:").grid(row=0, column=0, sticky=tk.W)
+        find_entry = tk.Entry(fields, textvariable=self.find_query, width=50)
+        find_entry.grid(row=0, column=1, columnspan=2, sticky=tk.EW, padx=5)
+        tk.Label(fields, text="Directory:").grid(row=1, column=0, sticky=tk.W)
+        tk.Entry(fields, textvariable=self.files_directory, width=50).grid(row=1, column=1, sticky=tk.EW, padx=5)
+        tk.Button(fields, text="Browse...", command=self.browse_search_directory).grid(row=1, column=2)
+        tk.Label(fields, text="Files:").grid(row=2, column=0, sticky=tk.W)
+        tk.Entry(fields, textvariable=self.files_include, width=50).grid(row=2, column=1, columnspan=2,
+                                                                          sticky=tk.EW, padx=5)
+        tk.Label(fields, text="Exclude:").grid(row=3, column=0, sticky=tk.W)
+        tk.Entry(fields, textvariable=self.files_exclude, width=50).grid(row=3, column=1, columnspan=2,
+                                                                          sticky=tk.EW, padx=5)
+        fields.columnconfigure(1, weight=1)
+        
+        options = tk.Frame(dialog)
+        options.pack(fill=tk.X, padx=5)
+        for label, variable in (("Regex", self.find_regex), ("Match case", self.find_case),
+                                ("Whole word", self.find_word)):
+            tk.Checkbutton(options, text=label, variable=variable).pack(side=tk.LEFT)
+        tk.Label(options, text="Globs separated by ';', e.g. *.py;*.txt", fg="gray").pack(side=tk.RIGHT)
         
-        # Search and replace
-        content = self.text_area.get("1.0", tk.END)
-        new_content = content.replace(find_str, replace_str)
+        results = tk.Frame(dialog)
+        results.pack(fill=tk.BOTH, expand=True, padx=5, pady=5)
+        scrollbar = tk.Scrollbar(results)
+        scrollbar.pack(side=tk.RIGHT, fill=tk.Y)
+        self.files_list = tk.Listbox(results, height=20, width=100, yscrollcommand=scrollbar.set)
+        self.files_list.pack(side=tk.LEFT, fill=tk.BOTH, expand=True)
+        scrollbar.config(command=self.files_list.yview)
+        self.files_list.bind('<ButtonRelease-1>', lambda e: self.open_file_result())
+        self.files_list.bind('<Return>', lambda e: self.open_file_result())
         
-        if content != new_content:
-            self.text_area.delete("1.0", tk.END)
-            self.text_area.insert("1.0", new_content)
-            messagebox.showinfo("Replace", "Replacement completed.")
+        buttons = tk.Frame(dialog)
+        buttons.pack(fill=tk.X, padx=5, pady=5)
+        self.files_summary = tk.Label(buttons, anchor=tk.W)
+        self.files_summary.pack(side=tk.LEFT, fill=tk.X, expand=True)
+        tk.Button(buttons, text="Close", command=self.close_files_dialog).pack(side=tk.RIGHT, padx=2)
+        tk.Button(buttons, text="Stop", command=self.stop_file_search).pack(side=tk.RIGHT, padx=2)
+        tk.Button(buttons, text="Search", command=self.start_file_search).pack(side=tk.RIGHT, padx=2)
+        find_entry.bind('<Return>', lambda e: self.start_file_search())
+        find_entry.focus_set()
+        
+    def browse_search_directory(self):
+        directory = filedialog.askdirectory(parent=self.files_dialog, initialdir=self.files_directory.get())
+        if directory:
+            self.files_directory.set(directory)
+            
+    def close_files_dialog(self):
+        self.stop_file_search()
+        self.files_dialog.destroy()
+        self.files_dialog = None
+        
+    def start_file_search(self):
+        self.stop_file_search()
+        query = self.find_query.get()
+        directory = self.files_directory.get()
+        if not query:
+            return
+        if not os.path.isdir(directory):
+            messagebox.showerror("Error", f"Not a directory: {directory}", parent=self.files_dialog)
+            return
+        try:
+            pattern = self.find_engine.compile(query, self.find_regex.get(),
+                                               self.find_case.get(), self.find_word.get())
+        except re.error as e:
+            self.files_summary.config(text=f"Invalid pattern: {e}")
+            return
+        globs = lambda variable: [glob for glob in re.split(r"[;,\s]+", variable.get()) if glob]
+        
+        self.files_list.delete(0, tk.END)
+        self.file_results = []
+        self.file_search = FileSearch(directory, pattern, globs(self.files_include), globs(self.files_exclude))
+        self.file_search.start()
+        self.poll_file_search()
+        
+    def poll_file_search(self, drain=False):
+        # Move found lines into the results list for up to one frame (all
+        # of them with drain), then report progress and yield to Tk
+        search = self.file_search
+        self.file_search_job = None
+        deadline = time.perf_counter() + 0.016
+        rows = []
+        finished = False
+        while drain or time.perf_counter() < deadline:
+            try:
+                item = search.queue.get_nowait()
+            except queue.Empty:
+                break
+            if item is None:
+                finished = True
+                break
+            path, found = item
+            name = os.path.relpath(path, search.root)
+            for line, column, length, text in found:
+                rows.append(f"{name}:{line}: {text.strip()}")
+                self.file_results.append((path, line, column))
+        if rows:
+            self.files_list.insert(tk.END, *rows)
+            
+        megabytes, files = search.rates()
+        progress = (f"{search.matches} matching lines in {search.files} files, "
+                    f"{megabytes:.1f} MB/s, {files:.0f} files/s")
+        if not finished:
+            self.files_summary.config(text=f"Searching... {progress}")
+            self.status_bar.config(text=f"Find in Files: {progress}")
+            self.file_search_job = self.root.after(50, self.poll_file_search)
+            return
+            
+        self.file_search = None
+        if search.error is not None:
+            messagebox.showerror("Error", f"Search failed: {str(search.error)}", parent=self.files_dialog)
+        if search.full():
+            progress += f" (stopped at {search.MAX_MATCHES})"
+        elif search.cancelled.is_set():
+            progress += " (stopped)"
+        self.files_summary.config(text=progress)
+        self.status_bar.config(text=f"Find in Files: {progress} in {search.elapsed:.1f} s")
+        
+    def stop_file_search(self):
+        if self.file_search is None:
+            return
+        self.file_search.cancel()
+        if self.file_search_job is not None:
+            self.root.after_cancel(self.file_search_job)
+        # A last poll takes what was found and reports the totals
+        self.file_search.thread.join()
+        self.poll_file_search(drain=True)
+        
+    def open_file_result(self):
+        selection = self.files_list.curselection()
+        if selection:
+            self.open_location(*self.file_results[selection[0]])
+            
+    def open_location(self, path, line, column=0):
+        # Show a file with the cursor at a 1-based line and 0-based column;
+        # a file still streaming in gets it once loaded (see finish_load)
+        self.open_path(path)
+        if self.find_tab(path) is not self.tab:
+            return
+        if self.viewer is not None:
+            if not self.viewer.goto(line):
+                self.status_bar.config(text=f"Line {line} is not indexed yet")
+                return
+        elif self.loader is not None:
+            self.tab.cursor, self.tab.view = f"{line}.{column}", None
+            return
         else:
-            messagebox.showinfo("Replace", "Text not found.")
+            self.unfold_line(line)
+            self.text_area.mark_set(tk.INSERT, f"{line}.{column}")
+        self.text_area.see(tk.INSERT)
+        self.text_area.focus_set()
+        self.scheduler.request("cursor", "gutter")
 
 
 if __name__ == "__main__":
+    # notepad.py [file ...] [--profile] [--profile-startup]
+    args = sys.argv[1:]
+    startup = StartupProfile(STARTED) if "--profile-startup" in args else None
+    if startup is not None:
+        startup.mark("imports")
     root = tk.Tk()
-    notepad = Notepad(root)
+    if startup is not None:
+        startup.mark("tk")
+    notepad = Notepad(root, instrument="--profile" in args or os.environ.get("NOTEPAD_PROFILE", "") not in ("", "0"),
+                      paths=[arg for arg in args if not arg.startswith("--")], startup=startup)
     root.mainloop()
\ No newline at end of file
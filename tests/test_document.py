@@ -0,0 +1,118 @@
+import random
+
+import pytest
+
+from notepad_core import Document, text_column, tk_column
+
+
+@pytest.fixture
+def small_blocks(monkeypatch):
+    # Blocks of a few lines, so edits and lookups cross block boundaries
+    monkeypatch.setattr(Document, "BLOCK", 32)
+
+
+def random_text(rng, size):
+    return "".join(rng.choice("ab  \n\n\tc") for _ in range(size))
+
+
+def check_lines(document, text):
+    lines = text.split("\n")
+    assert document.line_count() == len(lines)
+    offset = 0
+    for line, content in enumerate(lines):
+        assert document.line_offset(line) == offset
+        assert document.line(line) == content
+        assert document.line_col(offset + len(content)) == (line, len(content))
+        assert document.offset(line, len(content) + 5) == offset + len(content)
+        offset += len(content) + 1
+    assert document.line_offset(len(lines)) == len(text)
+    start = len(lines) // 3
+    assert document.lines(start, len(lines)) == lines[start:]
+
+
+def test_edits_match_a_plain_string(small_blocks):
+    rng = random.Random(0)
+    text = random_text(rng, 300)
+    document = Document(text)
+    assert len(document.blocks) > 1
+    for _ in range(500):
+        start = rng.randrange(len(text) + 1)
+        if rng.random() < 0.5:
+            insert = random_text(rng, rng.randrange(1, 40))
+            document.insert(start, insert)
+            text = text[:start] + insert + text[start:]
+        else:
+            end = min(len(text), start + rng.randrange(60))
+            document.delete(start, end)
+            text = text[:start] + text[end:]
+        assert document.text() == text
+        assert len(document) == len(text)
+        assert document.words == len(text.split())
+        i, j = sorted(rng.randrange(len(text) + 1) for _ in range(2))
+        assert document.get(i, j) == text[i:j]
+    check_lines(document, text)
+
+
+def test_lines_across_blocks(small_blocks):
+    text = "".join(f"line {i}\n" for i in range(100)) + "last"
+    document = Document(text)
+    assert len(document.blocks) > 10
+    check_lines(document, text)
+    assert document.line_col(len(text) + 10) == (100, 4)
+    assert document.line_offset(-1) == 0
+
+
+def test_words_joined_and_split_by_edits():
+    document = Document("foo bar")
+    document.insert(3, "x")
+    assert document.words == 2
+    document.insert(4, " ")
+    assert document.words == 2
+    document.insert(4, "y z")
+    assert document.text() == "fooxy z  bar"
+    assert document.words == 3
+    document.delete(5, 9)
+    assert document.text() == "fooxybar"
+    assert document.words == 1
+    document.delete(0, len(document))
+    assert document.words == 0
+
+
+def test_edits_are_logged():
+    document = Document("abc")
+    document.insert(1, "x")
+    document.delete(0, 2)
+    assert document.log == [("insert", 1, "x"), ("delete", 0, "ax")]
+
+
+@pytest.mark.parametrize("text, start, end, span", [
+    ("a\nb", 0, 4, (0, 3)),  # 1.0 end: everything
+    ("a\nb", 2, 4, (1, 3)),  # 2.0 end: the last line and the newline before it
+    ("a\nb", 1, 4, (1, 3)),  # 1.1 end: from inside the first line
+    ("a\n", 2, 3, (1, 2)),  # 2.0 end on an empty last line
+    ("ab", 2, 3, (2, 2)),  # 1.2 end: nothing
+    ("a\nb", 1, 3, (1, 3)),  # inside the document, unchanged
+    ("a\nb", 2, 2, (2, 2)),
+])
+def test_delete_span_follows_the_final_newline_rule(text, start, end, span):
+    assert Document(text).delete_span(start, end) == span
+
+
+def test_tk_columns_count_astral_characters_twice():
+    tkinter = pytest.importorskip("tkinter")
+    tcl = tkinter.Tcl()
+    line = "\U0001F600ab\u00e9\U0001F680c"
+    for col in range(len(line) + 1):
+        tk_col = int(tcl.call("string", "length", line[:col]))
+        assert tk_column(line, col) == tk_col
+        assert text_column(line, tk_col) == col
+    assert text_column(line, 1) == 0  # inside the first surrogate pair
+
+
+def test_tk_offsets_across_lines():
+    document = Document("x\n\U0001F600ab\n")
+    assert document.tk_offset(1, 3) == 4  # between a and b
+    assert document.tk_line_col(4) == (1, 3)
+    assert document.tk_offset(1, 10) == 5  # clamped to the line
+    assert document.tk_line_col(5) == (1, 4)
+    assert document.tk_offset(0, 1) == 1
\ No newline at end of file
@@ -0,0 +1,38 @@
+import random
+
+from notepad_core import Document, FindEngine
+
+
+def matches(engine):
+    return list(zip(engine.starts, engine.ends))
+
+
+def test_narrowing_matches_a_fresh_search():
+    rng = random.Random(0)
+    document = Document("".join(rng.choice("abAB \n") for _ in range(2000)))
+    for _ in range(200):
+        engine = FindEngine(document)
+        query = ""
+        case = rng.random() < 0.5
+        for _ in range(4):
+            query += rng.choice("abAB ")
+            engine.search(query, case=case)
+            fresh = FindEngine(document)
+            fresh.search(query, case=case)
+            assert matches(engine) == matches(fresh)
+
+
+def test_narrows_only_a_growing_query_on_the_same_text():
+    document = Document("abc abd abc")
+    engine = FindEngine(document)
+    engine.search("ab")
+    assert engine.can_narrow("abc", (False, False, False))
+    assert not engine.can_narrow("abc", (True, False, False))
+    assert not engine.can_narrow("b", (False, False, False))
+    engine.search("abc")
+    assert matches(engine) == [(0, 3), (8, 11)]
+    document.insert(0, "abc ")
+    assert not engine.can_narrow("abcd", (False, False, False))
+    
+    engine.search("aa")
+    assert not engine.can_narrow("aab", (False, False, False))  # "aa" can overlap itself
\ No newline at end of file
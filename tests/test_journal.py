@@ -0,0 +1,75 @@
+import os
+
+import pytest
+
+from notepad_core import Document, Journal, read_journal, recover_journal
+
+
+def edit(document):
+    document.insert(0, "hello ")
+    document.insert(len(document), "\nlast line")
+    document.delete(2, 4)
+
+
+def test_appended_edits_are_recovered(tmp_path):
+    journal = Journal(str(tmp_path), session="1")
+    journal.reset()
+    document = Document("")
+    edit(document)
+    journal.append(document.log)
+    journal.close(discard=False)
+    assert journal.error is None
+    header, text = recover_journal(journal.path)
+    assert header["path"] is None
+    assert text == document.text()
+
+
+def test_compaction_keeps_one_snapshot(tmp_path):
+    journal = Journal(str(tmp_path), session="1")
+    journal.reset()
+    document = Document("")
+    edit(document)
+    journal.append(document.log)
+    document.clear_log()
+    for _ in range(2):
+        journal.compact(list(document.chunks()))
+        edit(document)
+        journal.append(document.log)
+        document.clear_log()
+    journal.close(discard=False)
+    assert sorted(name for name in os.listdir(tmp_path) if name.endswith(".snapshot")) == ["session-1.2.snapshot"]
+    assert recover_journal(journal.path)[1] == document.text()
+
+
+def test_a_record_cut_short_is_dropped(tmp_path):
+    journal = Journal(str(tmp_path), session="1")
+    journal.reset()
+    journal.append([("insert", 0, "kept")])
+    journal.close(discard=False)
+    with open(journal.path, "a", encoding="utf-8") as file:
+        file.write('["i", 4, "lo')
+    assert len(read_journal(journal.path)[1]) == 1
+    assert recover_journal(journal.path)[1] == "kept"
+
+
+def test_edits_to_a_file_apply_only_while_it_is_unchanged(tmp_path):
+    path = tmp_path / "file.txt"
+    path.write_text("base\n")
+    directory = tmp_path / "recovery"
+    journal = Journal(str(directory), session="1")
+    journal.reset(str(path))
+    journal.append([("insert", 4, " edited")])
+    journal.close(discard=False)
+    assert recover_journal(journal.path)[1] == "base edited\n"
+    
+    path.write_text("changed on disk\n")
+    with pytest.raises(ValueError):
+        recover_journal(journal.path)
+
+
+def test_close_discards_the_files(tmp_path):
+    journal = Journal(str(tmp_path), session="1")
+    journal.reset()
+    journal.compact(["text"])
+    journal.close()
+    assert os.listdir(tmp_path) == []
\ No newline at end of file
@@ -0,0 +1,24 @@
+import os
+
+import languages
+from notepad_core import LanguageRegistry
+
+
+def test_every_module_is_listed():
+    directory = os.path.dirname(languages.__file__)
+    names = sorted(name[:-3] for name in os.listdir(directory) if name.endswith(".py") and not name.startswith("_"))
+    assert sorted(languages.LANGUAGES) == names
+
+
+def test_detect_does_not_import_definitions(tmp_path):
+    registry = LanguageRegistry()
+    script = tmp_path / "script"
+    script.write_text("#!/usr/bin/env python3\n")
+    assert registry.detect("style.CSS") == "css"
+    assert registry.detect(str(script)) == "python"
+    assert registry.detect("notes.txt") == "plain"
+    assert ("python", "Python") in registry.titles()
+    assert registry.definitions == {}
+    assert registry.lexer("python") is not None
+    assert registry.outline("plain") is None
+    assert list(registry.definitions) == ["python"]
\ No newline at end of file
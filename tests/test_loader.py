@@ -0,0 +1,29 @@
+import pytest
+
+from notepad_core import FileLoader
+
+
+def load(path):
+    loader = FileLoader(str(path))
+    loader.start()
+    chunks = []
+    while True:
+        item = loader.queue.get(timeout=10)
+        if item is None:
+            return loader, "".join(chunk for chunk, words in chunks)
+        chunks.append(item)
+
+
+@pytest.mark.parametrize("content, replaced", [
+    (b"plain\n", False),
+    ("kept \ufffd\n".encode("utf-8"), False),  # U+FFFD that was in the file
+    (b"x" * 70000 + b" \xff\n", True),  # past the head that picks the encoding
+])
+def test_loader_notes_replaced_bytes(tmp_path, content, replaced):
+    path = tmp_path / "file.txt"
+    path.write_bytes(content)
+    loader, text = load(path)
+    assert loader.error is None
+    assert loader.encoding == "utf-8"
+    assert loader.replaced is replaced
+    assert text == content.decode("utf-8", errors="replace")
\ No newline at end of file
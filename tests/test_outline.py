@@ -0,0 +1,52 @@
+import random
+
+from notepad_core import Document, Outline, LANGUAGES
+
+POOL = ["def f(a):", "    x = 1", "", "class K:", "    def m(self):", "        return 2", "y = 3"]
+
+
+def scanned(document):
+    outline = Outline(document)
+    outline.set_patterns(LANGUAGES.outline("python"))
+    outline.scan()
+    return outline
+
+
+def symbol_lines(outline):
+    return [outline.symbol_line(index) for index in range(len(outline.symbols))]
+
+
+def test_updates_match_a_fresh_scan(monkeypatch):
+    # Short runs, so that edits span them and empty them
+    monkeypatch.setattr(Outline, "RUN", 8)
+    rng = random.Random(3)
+    document = Document("\n".join(rng.choice(POOL) for _ in range(1000)))
+    outline = scanned(document)
+    for step in range(1000):
+        count = document.line_count()
+        first = rng.randint(1, count)
+        old_count = rng.randint(1, min(40 if step % 50 == 0 else 4, count - first + 1))
+        new = [rng.choice(POOL) for _ in range(rng.randint(1, 4))]
+        start = document.line_offset(first - 1)
+        document.delete(start, document.line_end(first + old_count - 2))
+        document.insert(start, "\n".join(new))
+        outline.update(first, old_count, len(new))
+        fresh = scanned(document)
+        assert outline.symbols == fresh.symbols
+        assert symbol_lines(outline) == symbol_lines(fresh)
+
+
+def test_symbol_at():
+    document = Document("x = 1\ndef a():\n    pass\n\nclass B:\n    def c(self):\n        pass")
+    outline = scanned(document)
+    assert [outline.symbol_at(line) for line in range(7)] == [-1, 0, 0, 0, 1, 2, 2]
+    assert [name for kind, name, indent in outline.symbols] == ["a", "B", "c"]
+
+
+def test_fold_blocks():
+    document = Document("def a():\n    x = 1\n\n    y = 2\nz = 3\nif z:\n    pass")
+    outline = scanned(document)
+    assert outline.fold_starts(0, 7) == {0, 5}
+    assert outline.fold_end(0) == 3
+    assert outline.fold_end(1) is None
+    assert outline.fold_end(5) == 6
\ No newline at end of file
@@ -0,0 +1,38 @@
+import re
+
+import pytest
+
+import notepad_core
+from notepad_core import plan_replacements, replace_edits, replacer, stream_replace
+
+
+@pytest.mark.parametrize("content", [b"foo\nbar\n", b"foo\nbar", b"", b"\n", b"foo"])
+def test_stream_replace_ends_with_or_without_newline(tmp_path, content):
+    path = tmp_path / "file.txt"
+    path.write_bytes(content)
+    count = stream_replace(str(path), re.compile("o"), "0", "utf-8")
+    assert count == content.count(b"o")
+    assert path.read_bytes() == content.replace(b"o", b"0")
+    assert [p.name for p in tmp_path.iterdir()] == ["file.txt"]
+
+
+def test_stream_replace_across_chunks(tmp_path):
+    # Small chunks force lines to be carried over to the next block
+    content = "".join(f"line {i} foo\n" for i in range(200)) + "last foo"
+    path = tmp_path / "file.txt"
+    path.write_bytes(content.encode("utf-8"))
+    count = stream_replace(str(path), re.compile("foo"), "bar", "utf-8", chunk_size=7)
+    assert count == 201
+    assert path.read_bytes() == content.replace("foo", "bar").encode("utf-8")
+
+
+@pytest.mark.parametrize("threshold", [1000, 2])
+def test_replace_edits_per_match_or_one_span(monkeypatch, threshold):
+    monkeypatch.setattr(notepad_core, "REPLACE_SPAN_THRESHOLD", threshold)
+    text = "a foo b foo c foo d"
+    pattern = re.compile("foo")
+    edits = replace_edits(text, plan_replacements(text, pattern, replacer("x")))
+    assert len(edits) == (3 if threshold > 3 else 1)
+    for start, end, new_text in edits:
+        text = text[:start] + new_text + text[end:]
+    assert text == "a x b x c x d"
\ No newline at end of file
@@ -0,0 +1,68 @@
+import codecs
+import os
+
+import pytest
+
+from notepad_core import FileLoader, FileSaver, NEW_FILE_MODE
+
+
+def save(path, text, encoding="utf-8", newline=None):
+    saver = FileSaver(str(path), [text], encoding, newline)
+    saver.start()
+    saver.thread.join()
+    assert saver.error is None
+    return saver
+
+
+@pytest.mark.skipif(not hasattr(os, "symlink"), reason="needs symlinks")
+def test_saves_through_a_symlink(tmp_path):
+    real = tmp_path / "real.txt"
+    real.write_bytes(b"old")
+    link = tmp_path / "link.txt"
+    link.symlink_to(real)
+    save(link, "new")
+    assert link.is_symlink()
+    assert real.read_bytes() == b"new"
+
+@pytest.mark.parametrize("encoding, bom", [
+    ("utf-16-le", codecs.BOM_UTF16_LE), ("utf-16-be", codecs.BOM_UTF16_BE),
+    ("utf-32-le", codecs.BOM_UTF32_LE), ("utf-32-be", codecs.BOM_UTF32_BE),
+])
+def test_keeps_the_byte_order_and_bom(tmp_path, encoding, bom):
+    path = tmp_path / "file.txt"
+    content = bom + "h\u00e9llo\nw\u00f6rld\n".encode(encoding)
+    path.write_bytes(content)
+    loader = FileLoader(str(path))
+    assert loader.encoding == encoding
+    loader.start()
+    chunks = iter(loader.queue.get, None)
+    text = "".join(chunk for chunk, words in chunks)
+    assert text == "h\u00e9llo\nw\u00f6rld\n"
+    save(path, text, loader.encoding)
+    assert path.read_bytes() == content
+
+def test_new_files_get_the_umask_mode(tmp_path):
+    path = tmp_path / "new.txt"
+    save(path, "text")
+    assert os.stat(path).st_mode & 0o777 == NEW_FILE_MODE
+
+@pytest.mark.parametrize("encoding", ["utf-8", "utf-8-sig", "latin-1", "utf-16-be"])
+@pytest.mark.parametrize("newline", ["\n", "\r\n"])
+def test_encoding_and_newlines_round_trip(tmp_path, encoding, newline):
+    path = tmp_path / "file.txt"
+    text = "caf\u00e9\nline two\n"
+    saver = save(path, text, encoding, newline)
+    assert saver.encoding == encoding
+    expected = text.replace("\n", newline).encode(encoding)
+    if encoding == "utf-16-be":
+        expected = codecs.BOM_UTF16_BE + expected
+    assert path.read_bytes() == expected
+
+
+def test_text_the_encoding_cannot_hold_is_saved_as_utf8(tmp_path):
+    path = tmp_path / "file.txt"
+    path.write_bytes(b"old")
+    saver = save(path, "\u20ac 5", "latin-1")
+    assert saver.encoding == "utf-8"
+    assert path.read_bytes() == "\u20ac 5".encode("utf-8")
+    assert [p.name for p in tmp_path.iterdir()] == ["file.txt"]
\ No newline at end of file